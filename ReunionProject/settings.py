@@ -68,6 +68,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -76,6 +77,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ReplicaStickinessMiddleware',
 ]
 
 ROOT_URLCONF = 'ReunionProject.urls'
@@ -102,21 +104,83 @@ WSGI_APPLICATION = 'ReunionProject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# Connections are kept open for DB_CONN_MAX_AGE seconds and reused by later requests of the same worker
+# thread. Reused connections are health checked before their first query, so a connection dropped by the
+# server is replaced instead of failing the request. Behind a transaction pooler such as PgBouncer in
+# transaction mode set DB_TRANSACTION_POOLER=true: consecutive transactions may land on different server
+# connections there, so server-side cursors are disabled.
+# The api.db backends record connection statistics, served at /api/db/stats/
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'api.db.postgresql',
         'NAME': os.getenv('DB_NAME'),
         'USER': os.getenv('DB_USER'),
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'true').lower() == 'true',
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_TRANSACTION_POOLER', 'false').lower() == 'true',
     }
     # 'default': {
-    #     'ENGINE': 'django.db.backends.sqlite3',
+    #     'ENGINE': 'api.db.sqlite3',
     #     'NAME': BASE_DIR / 'db.sqlite3',
     # }
 }
 
+# Read replicas of default, one alias per host in the comma separated DB_REPLICA_HOSTS. Request reads go to
+# a replica, writes and everything outside requests to default. After a write the user's reads stay on
+# default for REPLICA_STICKY_SECONDS, which should cover the replication lag.
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(','))):
+    DATABASES[f'replica_{index}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{index}')
+DATABASE_ROUTERS = ['api.db.router.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+
+# Per request SQL instrumentation (api.middleware.QueryInstrumentationMiddleware). A statement shape that runs
+# more than SQL_REPEAT_THRESHOLD times in one request is logged as a likely N+1 query, or raised as
+# RepeatedQueryError with SQL_REPEAT_RAISE=true, which makes the offending test fail.
+# SQL_LOG_LEVEL=INFO also logs the query count and database time of every request.
+SQL_REPEAT_THRESHOLD = int(os.getenv('SQL_REPEAT_THRESHOLD', 10))
+SQL_REPEAT_RAISE = os.getenv('SQL_REPEAT_RAISE', 'false').lower() == 'true'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.sql': {'handlers': ['console'], 'level': os.getenv('SQL_LOG_LEVEL', 'WARNING'), 'propagate': False},
+    },
+}
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'reunion'),
+    }
+}
+
+# Seconds a serialized post stays cached, writes to the post invalidate it earlier
+POST_CACHE_TIMEOUT = int(os.getenv('POST_CACHE_TIMEOUT', 300))
+
+# Seconds an authenticated user stays cached for views that need the full user
+USER_CACHE_TIMEOUT = int(os.getenv('USER_CACHE_TIMEOUT', 60))
+
+# Seconds an invalidated post or user entry stays marked stale, during which it is not cached again.
+# Must cover the time between a request reading the row and caching it, so that read can't outlive a write
+CACHE_TOMBSTONE_SECONDS = int(os.getenv('CACHE_TOMBSTONE_SECONDS', 5))
+
+# Likes and comments of the last TRENDING_WINDOW_HOURS hours rank posts on /api/trending/. `manage.py compact_trending`,
+# run periodically, keeps the TRENDING_SIZE best posts and drops hourly activity buckets older than the window
+TRENDING_WINDOW_HOURS = int(os.getenv('TRENDING_WINDOW_HOURS', 24))
+TRENDING_SIZE = int(os.getenv('TRENDING_SIZE', 100))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -135,9 +199,27 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing runs on a bounded pool of PASSWORD_HASH_WORKERS threads (one per core by default).
+# At most PASSWORD_HASH_QUEUE_DEPTH more hashes may wait for a thread, past that logins and
+# registrations are answered with 503 instead of piling up behind the busy workers
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+PASSWORD_HASH_QUEUE_DEPTH = int(os.getenv('PASSWORD_HASH_QUEUE_DEPTH', 2 * PASSWORD_HASH_WORKERS))
+
+# Django's default hashers, with PBKDF2 able to run on that pool inside api.hashing.pooled_hashing()
+PASSWORD_HASHERS = [
+    'api.hashing.PooledPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# Most views only need the user id, so by default request.user is a TokenUser built from the verified
+# token claims without a database query. Writes also check through the user cache that the user still
+# exists and is active. Views that need the full user use api.authentication.CachedJWTAuthentication
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.StatelessJWTAuthentication',
     ],
 }
 
@@ -157,6 +239,13 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+# collectstatic adds content hashed copies and gzip variants, served from memory by api.staticfiles.serve.
+# Templates link the hashed names, which are cached for a year, whenever DEBUG is off
+STATICFILES_STORAGE = 'api.staticfiles.PrecompressedManifestStaticFilesStorage'
+
+# `manage.py generate_schema` writes the OpenAPI schema here at build time, processes load the build matching
+# their sources instead of inspecting every view on the first schema request
+SCHEMA_ROOT = os.path.join(BASE_DIR, 'schema')
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
@@ -191,3 +280,7 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
     'TOKEN_USER_CLASS': 'rest_framework_simplejwt.models.TokenUser',
 }
+
+# Seconds a process may answer refresh token blacklist checks from its local revoked jti index
+# before reading new blacklist rows, 0 reads them on every check
+REVOKED_JTI_SYNC_INTERVAL = float(os.getenv('REVOKED_JTI_SYNC_INTERVAL', 1))
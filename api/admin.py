@@ -2,8 +2,9 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
 # Register your models here.
-from .models import User, Post, Comment
+from .models import User, Post, Comment, TimelineEntry
 
 admin.site.register(User, UserAdmin)
 admin.site.register(Post)
 admin.site.register(Comment)
+admin.site.register(TimelineEntry)
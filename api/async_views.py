@@ -0,0 +1,122 @@
+from django.http import HttpResponse
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+
+from .authentication import AsyncJWTAuthentication
+from .cache import aget_cached_post, aset_cached_post, ainvalidate_post
+from .models import Post, aattach_comment_preview
+from .pagination import akeyset_page, parse_page_size
+from .serializers import UserSerializer, PostSerializer, parse_post_options
+
+# Async twins of the read endpoints in views.py for the ASGI app. DRF views are sync only, so these are
+# plain Django async views that authenticate and render the same way DRF does.
+
+authenticator = AsyncJWTAuthentication()
+
+
+def render(data, status: int = 200, headers: dict = None) -> HttpResponse:
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status, headers=headers)
+
+
+# Same body and headers as DRF's default exception handler
+def render_exception(exc: exceptions.APIException) -> HttpResponse:
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    headers = None
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        headers = {'WWW-Authenticate': authenticator.authenticate_header(None)}
+    return render(data, status=exc.status_code, headers=headers)
+
+
+# Returns the authenticated user, or raises the APIException DRF would have turned into a 401.
+# Views that only need the user id pass stateless=True and get a TokenUser without any lookup.
+async def authenticate(request, stateless: bool = False):
+    result = await authenticator.aauthenticate(request, stateless=stateless)
+    if result is None:
+        raise exceptions.NotAuthenticated()
+    return result[0]
+
+
+def check_method(request, allowed: list):
+    if request.method not in allowed:
+        raise exceptions.MethodNotAllowed(request.method)
+
+
+# Get current user profile
+async def get_user(request):
+    try:
+        check_method(request, ['GET'])
+        user = await authenticate(request)
+    except exceptions.APIException as e:
+        return render_exception(e)
+
+    serializer = UserSerializer(user, many=False)
+    return render(serializer.data)
+
+
+# Get all posts by current user
+async def get_posts(request):
+    try:
+        check_method(request, ['GET'])
+        user = await authenticate(request, stateless=True)
+    except exceptions.APIException as e:
+        return render_exception(e)
+
+    try:
+        fields, comments, preview = parse_post_options(request.GET)
+        posts = Post.objects.filter(user=user.id).for_fields(fields, comments)
+        if 'limit' in request.GET or 'cursor' in request.GET:
+            limit = parse_page_size(request.GET.get('limit'))
+            posts, next_cursor = await akeyset_page(posts, request.GET.get('cursor'), limit)
+            if preview:
+                await aattach_comment_preview(posts, preview)
+            serializer = PostSerializer(posts, many=True, fields=fields, comments=comments)
+            return render({'results': serializer.data, 'next': next_cursor})
+    except ValueError as e:
+        return render({'message': str(e)}, status=400)
+
+    # Iterating the queryset asynchronously also runs its comment prefetch
+    posts = [post async for post in posts.order_by('id')]
+    if preview:
+        await aattach_comment_preview(posts, preview)
+    serializer = PostSerializer(posts, many=True, fields=fields, comments=comments)
+    return render(serializer.data)
+
+
+# Get or delete a post
+async def get_or_delete_post(request, id: int = None):
+    try:
+        check_method(request, ['GET', 'DELETE'])
+        user = await authenticate(request, stateless=True)
+    except exceptions.APIException as e:
+        return render_exception(e)
+
+    shaped = 'fields' in request.GET or 'comments' in request.GET
+    if request.method == 'GET':
+        if not shaped:
+            data = await aget_cached_post(id)
+            if data is not None:
+                return render(data)
+        try:
+            fields, comments, preview = parse_post_options(request.GET)
+        except ValueError as e:
+            return render({'message': str(e)}, status=400)
+
+        posts = [post async for post in Post.objects.filter(id=id).for_fields(fields, comments)]
+        if not posts:
+            return render({'message': 'Post not found'}, status=404)
+        if preview:
+            await aattach_comment_preview(posts, preview)
+        serializer = PostSerializer(posts[0], many=False, fields=fields, comments=comments)
+        if not shaped:
+            await aset_cached_post(id, serializer.data)
+        return render(serializer.data)
+
+    author_id = await Post.objects.filter(id=id).values_list('user_id', flat=True).afirst()
+    if author_id is None:
+        return render({'message': 'Post not found'}, status=404)
+    if author_id != user.id:
+        return render({'message': 'You cannot delete this post'}, status=403)
+
+    await Post.objects.filter(id=id).adelete()
+    await ainvalidate_post(id)
+    return render({"message": f'Post {id} deleted'})
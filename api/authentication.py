@@ -0,0 +1,94 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .cache import get_cached_user, set_cached_user, aget_cached_user, aset_cached_user
+from .db.router import primary_reads
+
+# User fields kept in the user cache, enough for UserSerializer and the permission classes
+CACHED_USER_FIELDS = ['id', 'username', 'is_active', 'is_staff', 'is_superuser', 'following_count', 'followers_count']
+
+
+# simplejwt authentication for async views. With stateless the user is a TokenUser built from the
+# verified claims, otherwise it is looked up through the user cache and the async ORM.
+class AsyncJWTAuthentication(JWTAuthentication):
+    async def aauthenticate(self, request, stateless: bool = False):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+
+        if stateless:
+            return JWTStatelessUserAuthentication().get_user(validated_token), validated_token
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user_id = _user_id(validated_token)
+        fields = await aget_cached_user(user_id)
+        if fields is None:
+            with primary_reads():
+                fields = await (self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+                                .values(*CACHED_USER_FIELDS).afirst())
+            if fields is None:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            await aset_cached_user(user_id, fields)
+        return _build_user(self.user_model, fields)
+
+
+# simplejwt authentication that keeps the looked up user in the cache for a short time,
+# for views that need the full User object rather than just the token claims
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        return _build_user(self.user_model, _user_fields(self.user_model, _user_id(validated_token)))
+
+
+# Default authentication: request.user is a TokenUser built from the verified token claims. Writes store
+# the user id in foreign keys, so for unsafe methods the user must also still exist and be active, which
+# costs a query only when the user cache misses.
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None and request.method not in SAFE_METHODS:
+            user, validated_token = result
+            _check_active(_user_fields(self.user_model, user.id))
+        return result
+
+
+def _user_id(validated_token):
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken(_("Token contained no recognizable user identification"))
+
+
+# Cached fields of the user: what the views read from a full user, never the password hash. Misses are
+# read from the primary, so a user deleted or deactivated there is not accepted again by a lagging replica.
+def _user_fields(user_model, user_id) -> dict:
+    fields = get_cached_user(user_id)
+    if fields is None:
+        with primary_reads():
+            fields = (user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+                      .values(*CACHED_USER_FIELDS).first())
+        if fields is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        set_cached_user(user_id, fields)
+    return fields
+
+
+def _check_active(fields: dict):
+    if not fields['is_active']:
+        raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+
+def _build_user(user_model, fields: dict):
+    _check_active(fields)
+    user = user_model(**fields)
+    user._state.adding = False
+    return user
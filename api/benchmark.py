@@ -0,0 +1,62 @@
+import time
+from contextlib import contextmanager
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+# Shared helpers for the benchmark management commands
+
+
+# Run the benchmark against a throwaway test database, never the configured one
+@contextmanager
+def benchmark_database():
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+# Add a fixed delay to every SQL statement on every connection, including ones opened by worker threads
+@contextmanager
+def slow_database(delay: float):
+    def slow_execute(execute, sql, params, many, context):
+        time.sleep(delay)
+        return execute(sql, params, many, context)
+
+    def install(connection, **kwargs):
+        connection.execute_wrappers.append(slow_execute)
+
+    if delay <= 0:
+        yield
+        return
+    for connection in connections.all():
+        install(connection)
+    connection_created.connect(install)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(install)
+        for connection in connections.all():
+            if slow_execute in connection.execute_wrappers:
+                connection.execute_wrappers.remove(slow_execute)
+
+
+def percentile(samples: list, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+# One report line: throughput and latency percentiles in milliseconds
+def summarize(name: str, latencies: list, elapsed: float) -> str:
+    throughput = len(latencies) / elapsed if elapsed else 0.0
+    return (f'{name:<28} {len(latencies):>6} req  {throughput:>8.1f} req/s  '
+            f'p50 {percentile(latencies, 50) * 1000:>8.1f} ms  '
+            f'p95 {percentile(latencies, 95) * 1000:>8.1f} ms  '
+            f'p99 {percentile(latencies, 99) * 1000:>8.1f} ms')
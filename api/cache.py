@@ -0,0 +1,141 @@
+from django.conf import settings
+from django.core.cache import cache
+
+HITS_KEY = 'post:stats:hits'
+MISSES_KEY = 'post:stats:misses'
+
+# Invalidation leaves this placeholder instead of deleting the entry: reads treat it as a miss and, since
+# entries are only ever added, a request that read the row before the write cannot cache it afterwards.
+# It stays for CACHE_TOMBSTONE_SECONDS, or REPLICA_STICKY_SECONDS if longer, since with read replicas a
+# read right after a write may still return the old row from a lagging replica.
+STALE = '<stale>'
+
+
+def post_cache_key(post_id: int) -> str:
+    return f'post:{post_id}'
+
+
+def post_state_cache_key(post_id: int) -> str:
+    return f'post:state:{post_id}'
+
+
+# Get the serialized post payload, or None on a miss
+def get_cached_post(post_id: int):
+    data = _fresh(cache.get(post_cache_key(post_id)))
+    _incr(HITS_KEY if data is not None else MISSES_KEY)
+    return data
+
+
+async def aget_cached_post(post_id: int):
+    data = _fresh(await cache.aget(post_cache_key(post_id)))
+    await _aincr(HITS_KEY if data is not None else MISSES_KEY)
+    return data
+
+
+def set_cached_post(post_id: int, data):
+    cache.add(post_cache_key(post_id), data, settings.POST_CACHE_TIMEOUT)
+
+
+async def aset_cached_post(post_id: int, data):
+    await cache.aadd(post_cache_key(post_id), data, settings.POST_CACHE_TIMEOUT)
+
+
+# The row state conditional GETs validate a post against, invalidated together with the payload
+def get_cached_post_state(post_id: int):
+    return _fresh(cache.get(post_state_cache_key(post_id)))
+
+
+def set_cached_post_state(post_id: int, state):
+    cache.add(post_state_cache_key(post_id), state, settings.POST_CACHE_TIMEOUT)
+
+
+# Called after any write that changes the serialized post (likes, comments, delete)
+def invalidate_post(post_id: int):
+    _invalidate([post_cache_key(post_id), post_state_cache_key(post_id)])
+
+
+async def ainvalidate_post(post_id: int):
+    await _ainvalidate([post_cache_key(post_id), post_state_cache_key(post_id)])
+
+
+def invalidate_posts(post_ids: list):
+    _invalidate([key for post_id in post_ids for key in (post_cache_key(post_id), post_state_cache_key(post_id))])
+
+
+def user_cache_key(user_id: int) -> str:
+    return f'user:{user_id}'
+
+
+def get_cached_user(user_id: int):
+    return _fresh(cache.get(user_cache_key(user_id)))
+
+
+async def aget_cached_user(user_id: int):
+    return _fresh(await cache.aget(user_cache_key(user_id)))
+
+
+def set_cached_user(user_id: int, user):
+    cache.add(user_cache_key(user_id), user, settings.USER_CACHE_TIMEOUT)
+
+
+async def aset_cached_user(user_id: int, user):
+    await cache.aadd(user_cache_key(user_id), user, settings.USER_CACHE_TIMEOUT)
+
+
+# Called after any write to the user row, including the follow counters
+def invalidate_users(user_ids: list):
+    _invalidate([user_cache_key(user_id) for user_id in user_ids])
+
+
+def primary_pin_key(user_id: int) -> str:
+    return f'primary:{user_id}'
+
+
+# Send the user's reads to the primary database for the next REPLICA_STICKY_SECONDS
+def pin_to_primary(user_id: int):
+    cache.set(primary_pin_key(user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+async def apin_to_primary(user_id: int):
+    await cache.aset(primary_pin_key(user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned_to_primary(user_id: int) -> bool:
+    return cache.get(primary_pin_key(user_id), False)
+
+
+async def ais_pinned_to_primary(user_id: int) -> bool:
+    return await cache.aget(primary_pin_key(user_id), False)
+
+
+def post_cache_stats():
+    return {'hits': cache.get(HITS_KEY, 0), 'misses': cache.get(MISSES_KEY, 0)}
+
+
+def _fresh(data):
+    return None if data == STALE else data
+
+
+def _tombstone_timeout() -> int:
+    if settings.DATABASE_REPLICAS:
+        return max(settings.CACHE_TOMBSTONE_SECONDS, settings.REPLICA_STICKY_SECONDS)
+    return settings.CACHE_TOMBSTONE_SECONDS
+
+
+def _invalidate(keys: list):
+    cache.set_many({key: STALE for key in keys}, _tombstone_timeout())
+
+
+async def _ainvalidate(keys: list):
+    await cache.aset_many({key: STALE for key in keys}, _tombstone_timeout())
+
+
+def _incr(key: str):
+    # add() is a no-op when the key exists, so incr() always has something to increment
+    cache.add(key, 0, None)
+    cache.incr(key)
+
+
+async def _aincr(key: str):
+    await cache.aadd(key, 0, None)
+    await cache.aincr(key)
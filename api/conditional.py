@@ -0,0 +1,87 @@
+import hashlib
+from datetime import datetime
+from functools import wraps
+from typing import NamedTuple, Optional
+
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from .cache import get_cached_post_state, set_cached_post_state
+from .models import Post
+
+# Clients keep the representation but must revalidate it, and it depends on the authenticated user
+CACHE_CONTROL = 'private, no-cache'
+
+
+class Validators(NamedTuple):
+    etag: str
+    last_modified: Optional[datetime]
+
+
+# Strong ETag of a representation, from the row state it is rendered from and the query params shaping it
+def make_etag(request, *state) -> str:
+    query = sorted(request.query_params.lists())
+    return '"%s"' % hashlib.sha1(repr((request.path, query, state)).encode()).hexdigest()
+
+
+# The profile is rendered from the cached user and its counters, which the follow views invalidate.
+# The user has no modification time, so only the ETag applies.
+def user_validators(request) -> Validators:
+    user = request.user
+    return Validators(make_etag(request, user.id, user.username, user.following_count, user.followers_count), None)
+
+
+# Like, unlike and comment writes move Post.activity_at along with the counters, the latest comment time
+# also covers comments written around the views. The row state is cached like the serialized post and
+# invalidated with it, so revalidating a cached post needs no query either.
+def post_validators(request, id: int = None):
+    row = get_cached_post_state(id)
+    if row is None:
+        row = (Post.objects.filter(id=id).annotate(latest_comment=Max('comments__created_at'))
+               .values('activity_at', 'likes_count', 'comments_count', 'latest_comment').first())
+        if row is None:
+            return None
+        set_cached_post_state(id, row)
+    last_modified = max(filter(None, (row['activity_at'], row['latest_comment'])))
+    return Validators(make_etag(request, id, *row.values()), last_modified)
+
+
+# One aggregate over the user's posts: a post added, deleted or touched by a like or comment changes it.
+# Only the ETag applies: deleting a post leaves the latest activity time of the others where it was, so a
+# Last-Modified would answer If-Modified-Since with a 304 for a list that lost a post.
+def posts_validators(request) -> Validators:
+    state = Post.objects.filter(user=request.user.id).aggregate(
+        count=Count('id'), last_id=Max('id'), activity_at=Max('activity_at'),
+        likes=Sum('likes_count'), comments=Sum('comments_count'))
+    return Validators(make_etag(request, request.user.id, *state.values()), None)
+
+
+# Conditional GET for a DRF view, applied below @api_view so it runs after authentication and permissions.
+# The validators come from `validators_func(request, *args, **kwargs)` without rendering the body, matching
+# If-None-Match or If-Modified-Since requests get a 304 and the view never runs. When validators_func
+# returns None (a missing row) the view answers on its own.
+def conditional(validators_func):
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            validators = validators_func(request, *args, **kwargs)
+            if validators is None:
+                return view(request, *args, **kwargs)
+
+            last_modified = validators.last_modified and int(validators.last_modified.timestamp())
+            response = get_conditional_response(request, etag=validators.etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response['ETag'] = validators.etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+            response['Cache-Control'] = CACHE_CONTROL
+            patch_vary_headers(response, ['Authorization'])
+            return response
+        return wrapped
+    return decorator
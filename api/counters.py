@@ -0,0 +1,51 @@
+from django.apps import apps
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+# Correlated COUNT(*) of rows in related_model pointing at the outer row through field
+def count_subquery(related_model, field):
+    counts = (related_model.objects.filter(**{field: OuterRef('pk')})
+              .order_by().values(field).annotate(count=Count('*')).values('count'))
+    return Coalesce(Subquery(counts), 0)
+
+
+# Decrement a counter without taking it below 0, which a positive integer column rejects once it drifted
+def decrement(counter: str, by=1):
+    return Greatest(F(counter) - by, 0)
+
+
+# (model, counter field, related model, field on the related model pointing back at model)
+def counter_definitions():
+    User = apps.get_model('api', 'User')
+    Post = apps.get_model('api', 'Post')
+    Comment = apps.get_model('api', 'Comment')
+    return [
+        (Post, 'likes_count', Post.likes.through, 'post'),
+        (Post, 'comments_count', Comment, 'post'),
+        (User, 'following_count', User.following.through, 'from_user'),
+        (User, 'followers_count', User.following.through, 'to_user'),
+    ]
+
+
+# Recount every stored counter from the relation tables and fix the rows that drifted.
+# Rows are walked in primary key chunks so no single statement locks the whole table. Each chunk is
+# recounted and written by one conditional UPDATE, so a like or follow committed while the repair runs
+# is never overwritten with a count read before it.
+# Returns the number of repaired rows per counter.
+def reconcile_counters(chunk_size: int = 1000):
+    repaired = {}
+    for model, counter, related_model, field in counter_definitions():
+        key = f'{model.__name__}.{counter}'
+        repaired[key] = 0
+        last_id = 0
+        while True:
+            ids = list(model.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            actual = count_subquery(related_model, field)
+            repaired[key] += (model.objects.filter(id__in=ids).exclude(**{counter: actual})
+                              .update(**{counter: actual}))
+    return repaired
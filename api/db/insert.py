@@ -0,0 +1,36 @@
+from django.db import connections, router, transaction
+
+
+# Insert (owner, target) rows into a through table, skipping rows that already exist, and return the
+# targets this statement actually inserted. Concurrent requests inserting the same pair never both see
+# it as new, so counters can be updated for exactly the returned targets.
+def insert_missing_pairs(model, owner_field: str, owner_id: int, target_field: str, target_ids) -> set:
+    target_ids = list(target_ids)
+    if not target_ids:
+        return set()
+    alias = router.db_for_write(model)
+    connection = connections[alias]
+    owner_column = model._meta.get_field(owner_field).column
+    target_column = model._meta.get_field(target_field).column
+
+    if connection.vendor in ('postgresql', 'sqlite'):
+        quote = connection.ops.quote_name
+        rows = ', '.join(['(%s, %s)'] * len(target_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(model._meta.db_table)} ({quote(owner_column)}, {quote(target_column)}) '
+                f'VALUES {rows} ON CONFLICT DO NOTHING RETURNING {quote(target_column)}',
+                [value for target_id in target_ids for value in (owner_id, target_id)],
+            )
+            return {row[0] for row in cursor.fetchall()}
+
+    # Without INSERT ... RETURNING, lock the existing pairs and insert the rest in the same transaction
+    with transaction.atomic(using=alias):
+        existing = set(model.objects.using(alias).select_for_update()
+                       .filter(**{owner_column: owner_id, f'{target_column}__in': target_ids})
+                       .values_list(target_column, flat=True))
+        inserted = set(target_ids) - existing
+        model.objects.using(alias).bulk_create(
+            [model(**{owner_column: owner_id, target_column: target_id}) for target_id in inserted],
+            ignore_conflicts=True)
+    return inserted
@@ -0,0 +1,8 @@
+from django.db.backends.postgresql import base
+
+from ..stats import StatsDatabaseWrapperMixin
+
+
+# PostgreSQL backend recording persistent connection statistics
+class DatabaseWrapper(StatsDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
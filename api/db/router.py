@@ -0,0 +1,68 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+class RoutingState:
+    def __init__(self, use_primary: bool):
+        self.use_primary = use_primary
+        self.wrote = False
+
+
+# Routing state of the current request, None outside requests
+_state = ContextVar('db_routing_state', default=None)
+# Set inside primary_reads()
+_primary_reads = ContextVar('db_primary_reads', default=False)
+
+# Apps whose reads always go to the primary: a refresh token blacklisted on the primary must not be
+# accepted again by a replica that has not caught up
+PRIMARY_APPS = {'token_blacklist'}
+
+
+# Route the queries run inside the block as one request: reads go to a replica until the first write,
+# or to the primary throughout when use_primary is set
+@contextmanager
+def routing_context(use_primary: bool = False):
+    state = RoutingState(use_primary)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+# Send the reads of the block to the primary without pinning the rest of the request to it. Used by
+# the authentication checks, which must see a deactivated or deleted user straight away.
+@contextmanager
+def primary_reads():
+    token = _primary_reads.set(True)
+    try:
+        yield
+    finally:
+        _primary_reads.reset(token)
+
+
+# Sends reads to one of the DATABASE_REPLICAS and writes to the primary. Management commands, signals
+# and anything else running outside routing_context always use the primary, as do the reads of a request
+# after its first write, so a request always sees its own changes. Token blacklist and authentication
+# reads use the primary too.
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (state is None or state.use_primary or not settings.DATABASE_REPLICAS or _primary_reads.get()
+                or model._meta.app_label in PRIMARY_APPS):
+            return 'default'
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.use_primary = True
+            state.wrote = True
+        return 'default'
+
+    # Every alias holds the same data
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
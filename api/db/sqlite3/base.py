@@ -0,0 +1,8 @@
+from django.db.backends.sqlite3 import base
+
+from ..stats import StatsDatabaseWrapperMixin
+
+
+# SQLite backend recording persistent connection statistics
+class DatabaseWrapper(StatsDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
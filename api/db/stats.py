@@ -0,0 +1,91 @@
+import threading
+import time
+import weakref
+
+
+# Per-process statistics of the persistent database connections. Each thread keeps its own connection
+# per alias, reused across requests until CONN_MAX_AGE, so a connection is active while its thread is
+# handling a request and idle between requests. Wait time is the time requests spent opening connections.
+class ConnectionStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._open = weakref.WeakSet()
+        self._busy_threads = set()
+        self.opened = 0
+        self.closed = 0
+        self.health_check_failures = 0
+        self.requests = 0
+        self.reused = 0
+        self.connect_seconds = 0.0
+        self.max_connect_seconds = 0.0
+
+    def connected(self, wrapper, seconds: float):
+        with self._lock:
+            self._open.add(wrapper)
+            self.opened += 1
+            self.connect_seconds += seconds
+            self.max_connect_seconds = max(self.max_connect_seconds, seconds)
+
+    def disconnected(self, wrapper, health_check_failed: bool = False):
+        with self._lock:
+            if wrapper in self._open:
+                self._open.discard(wrapper)
+                self.closed += 1
+            if health_check_failed:
+                self.health_check_failures += 1
+
+    # Called with the connections of the current thread that survived close_old_connections
+    def request_started(self, wrappers: list):
+        with self._lock:
+            self._busy_threads.add(threading.get_ident())
+            self.requests += 1
+            if any(wrapper.connection is not None for wrapper in wrappers):
+                self.reused += 1
+
+    def request_finished(self):
+        with self._lock:
+            self._busy_threads.discard(threading.get_ident())
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            open_connections = [wrapper for wrapper in self._open if wrapper.connection is not None]
+            active = sum(wrapper._thread_ident in self._busy_threads for wrapper in open_connections)
+            return {
+                'active': active,
+                'idle': len(open_connections) - active,
+                'opened': self.opened,
+                'closed': self.closed,
+                'health_check_failures': self.health_check_failures,
+                'requests': self.requests,
+                'reused': self.reused,
+                'wait_ms': {
+                    'total': round(self.connect_seconds * 1000, 3),
+                    'avg': round(self.connect_seconds * 1000 / self.opened, 3) if self.opened else 0.0,
+                    'max': round(self.max_connect_seconds * 1000, 3),
+                },
+            }
+
+
+connection_stats = ConnectionStats()
+
+
+# Mixed into the backend DatabaseWrapper classes of api.db.postgresql and api.db.sqlite3
+class StatsDatabaseWrapperMixin:
+    def connect(self):
+        started = time.monotonic()
+        super().connect()
+        connection_stats.connected(self, time.monotonic() - started)
+
+    def close(self):
+        super().close()
+        if self.connection is None:
+            connection_stats.disconnected(self)
+
+    def close_if_health_check_failed(self):
+        had_connection = self.connection is not None
+        super().close_if_health_check_failed()
+        if had_connection and self.connection is None:
+            connection_stats.disconnected(self, health_check_failed=True)
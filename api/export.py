@@ -0,0 +1,53 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Comment, Post
+
+CHUNK_SIZE = 2000
+
+
+def _line(data: dict) -> str:
+    return json.dumps(data, cls=DjangoJSONEncoder) + '\n'
+
+
+# Yield a user's posts as NDJSON, each post followed by its comments, then the comments the user
+# wrote on other users' posts. Posts and comments are read in chunks and merged by post id. On PostgreSQL
+# the chunks come from server-side cursors, so memory stays flat no matter how much the user has written,
+# except behind a transaction pooler (DB_TRANSACTION_POOLER) where server-side cursors are disabled and
+# each query's rows are fetched at once.
+def export_user(user_id: int):
+    posts = (Post.objects.filter(user=user_id).order_by('id')
+             .values('id', 'title', 'desc', 'created_at', 'updated_at', 'likes_count', 'comments_count')
+             .iterator(chunk_size=CHUNK_SIZE))
+    comments = (Comment.objects.filter(post__user=user_id).order_by('post_id', 'id')
+                .values('id', 'post_id', 'user__username', 'comment', 'created_at', 'updated_at')
+                .iterator(chunk_size=CHUNK_SIZE))
+
+    comment = next(comments, None)
+    for post in posts:
+        yield _line({'type': 'post', **post})
+        # The two queries are separate snapshots: skip comments of posts deleted before the posts query ran
+        while comment is not None and comment['post_id'] < post['id']:
+            comment = next(comments, None)
+        while comment is not None and comment['post_id'] == post['id']:
+            yield _comment_line(comment)
+            comment = next(comments, None)
+
+    authored = (Comment.objects.filter(user=user_id).exclude(post__user=user_id).order_by('id')
+                .values('id', 'post_id', 'user__username', 'comment', 'created_at', 'updated_at')
+                .iterator(chunk_size=CHUNK_SIZE))
+    for comment in authored:
+        yield _comment_line(comment)
+
+
+def _comment_line(comment: dict) -> str:
+    return _line({
+        'type': 'comment',
+        'id': comment['id'],
+        'post': comment['post_id'],
+        'user': comment['user__username'],
+        'comment': comment['comment'],
+        'created_at': comment['created_at'],
+        'updated_at': comment['updated_at'],
+    })
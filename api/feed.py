@@ -0,0 +1,54 @@
+from django.db import connections, router
+
+from .models import Post, TimelineEntry, User
+
+# Number of a followee's most recent posts copied into the timeline on follow
+BACKFILL_LIMIT = 100
+BATCH_SIZE = 1000
+# Rows are ranked per followee by the (user, created_at, id) post index, newest first
+BACKFILL = '''
+    INSERT INTO api_timelineentry (user_id, post_id, author_id, created_at)
+    SELECT %s, id, user_id, created_at FROM (
+        SELECT id, user_id, created_at,
+               ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY created_at DESC, id DESC) AS position
+        FROM api_post WHERE user_id IN ({followees})
+    ) latest
+    WHERE position <= %s
+    ON CONFLICT DO NOTHING
+'''
+
+
+# Write a new post into the timeline of every follower of its author
+def fan_out_post(post: Post):
+    follower_ids = User.objects.filter(following=post.user_id).values_list('id', flat=True)
+    entries = (TimelineEntry(user_id=follower_id, post=post, author_id=post.user_id, created_at=post.created_at)
+               for follower_id in follower_ids.iterator(chunk_size=BATCH_SIZE))
+    _bulk_insert(entries)
+
+
+# Copy the latest posts of each followee into the follower's timeline, in one INSERT ... SELECT
+# whatever the number of followees
+def backfill_timeline(user_id: int, followee_ids):
+    followee_ids = list(followee_ids)
+    if not followee_ids:
+        return
+    connection = connections[router.db_for_write(TimelineEntry)]
+    with connection.cursor() as cursor:
+        cursor.execute(BACKFILL.format(followees=', '.join(['%s'] * len(followee_ids))),
+                       [user_id, *followee_ids, BACKFILL_LIMIT])
+
+
+# Remove every post of the unfollowed users from the follower's timeline
+def trim_timeline(user_id: int, followee_ids: list):
+    TimelineEntry.objects.filter(user=user_id, author__in=followee_ids).delete()
+
+
+def _bulk_insert(entries):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
@@ -0,0 +1,73 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class PasswordHashPoolBusy(Exception):
+    pass
+
+
+# Bounded pool for the password hashing of the login and register views. PBKDF2 from hashlib releases the
+# GIL, so at most `workers` hashes run in parallel, one per core. The calling request thread still waits for
+# its hash: what the pool adds is the bound. Slots cover the running hashes plus the ones queued behind
+# them; when none is free the caller is rejected straight away instead of queueing unbounded work behind
+# a login burst. Everything else (admin login, createsuperuser, changepassword) hashes on its own thread.
+class PasswordHashPool:
+    def __init__(self, workers: int = None, queue_depth: int = None):
+        self._workers = workers
+        self._queue_depth = queue_depth
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+
+    def _start(self):
+        with self._lock:
+            if self._executor is None:
+                workers = self._workers or settings.PASSWORD_HASH_WORKERS
+                queue_depth = self._queue_depth if self._queue_depth is not None else settings.PASSWORD_HASH_QUEUE_DEPTH
+                self._slots = threading.BoundedSemaphore(workers + queue_depth)
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+
+    def run(self, fn, *args):
+        if self._executor is None:
+            self._start()
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHashPoolBusy()
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+hash_pool = PasswordHashPool()
+_pooled = threading.local()
+
+
+# Inside the block, PBKDF2 hashes of this thread run on the hash pool and raise PasswordHashPoolBusy when it
+# is full. Only the hash moves: authentication backends, the user_login_failed signal and hash upgrades all
+# stay on the request thread.
+@contextmanager
+def pooled_hashing():
+    _pooled.active = True
+    try:
+        yield
+    finally:
+        _pooled.active = False
+
+
+# The default PBKDF2 hasher, with the same algorithm name so stored hashes keep verifying. verify() and
+# ModelBackend's dummy hash for unknown users go through encode(), so this is the only expensive call.
+class PooledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    def encode(self, password, salt, iterations=None):
+        if getattr(_pooled, 'active', False):
+            return hash_pool.run(super().encode, password, salt, iterations)
+        return super().encode(password, salt, iterations)
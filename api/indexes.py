@@ -0,0 +1,24 @@
+from django.apps import apps
+from django.db import models
+
+# A user's posts in (created_at, id) order, as walked by keyset pagination
+POST_USER_CREATED = models.Index(fields=['user', 'created_at', 'id'], name='post_user_created_idx')
+# A post's comments in (created_at, id) order, for comment pages and latest comment previews
+COMMENT_POST_CREATED = models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_idx')
+# Reverse direction of the unique (from_user, to_user) and (post, user) indexes of the through tables,
+# which have no Meta of their own
+FOLLOW_TO_FROM = models.Index(fields=['to_user', 'from_user'], name='follow_to_from_idx')
+LIKE_USER_POST = models.Index(fields=['user', 'post'], name='like_user_post_idx')
+
+
+# (model, index) pairs of the indexes added by migration 0007, which keeps its own copy
+def access_pattern_indexes():
+    Post = apps.get_model('api', 'Post')
+    Comment = apps.get_model('api', 'Comment')
+    User = apps.get_model('api', 'User')
+    return [
+        (Post, POST_USER_CREATED),
+        (Comment, COMMENT_POST_CREATED),
+        (User.following.through, FOLLOW_TO_FROM),
+        (Post.likes.through, LIKE_USER_POST),
+    ]
@@ -0,0 +1,74 @@
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_WHITESPACE = re.compile(r'\s+')
+
+
+class RepeatedQueryError(Exception):
+    pass
+
+
+# Shape of a statement: literals and IN lists of any length collapse, so the same query run for
+# different rows (the N of an N+1) gets the same fingerprint
+def fingerprint(sql: str) -> str:
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+# Execute wrapper counting statements, their total time and how often each shape ran
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.shapes[fingerprint(sql)] += 1
+
+    # Shapes that ran more than threshold times, most repeated first
+    def repeated(self, threshold: int) -> list:
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+
+# Record the statements run on every database alias of the current thread
+@contextmanager
+def record_queries():
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        _wrap_connections(stack, recorder)
+        yield recorder
+
+
+# Record the statements the async ORM runs for the current task. Connections belong to a thread, and the
+# async ORM runs its queries through thread sensitive sync_to_async, so the wrappers are installed and
+# removed on that same thread.
+@asynccontextmanager
+async def arecord_queries():
+    recorder = QueryRecorder()
+    stack = ExitStack()
+    await sync_to_async(_wrap_connections)(stack, recorder)
+    try:
+        yield recorder
+    finally:
+        await sync_to_async(stack.close)()
+
+
+def _wrap_connections(stack: ExitStack, recorder: QueryRecorder):
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(recorder))
@@ -0,0 +1,84 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import ThreadSensitiveContext
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.benchmark import benchmark_database, slow_database, summarize
+from api.counters import reconcile_counters
+from api.models import Comment, Post, User
+
+
+# Compare the sync read endpoints behind the WSGI handler with their async twins behind the ASGI handler,
+# under the same number of concurrent clients and an artificially slowed database
+class Command(BaseCommand):
+    help = 'Benchmark concurrency and tail latency of the WSGI and ASGI read endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Requests per entry point')
+        parser.add_argument('--concurrency', type=int, default=20, help='Concurrent clients')
+        parser.add_argument('--db-delay', type=float, default=0.005, help='Seconds added to every SQL statement')
+        parser.add_argument('--posts', type=int, default=20, help='Posts seeded for the benchmark user')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            user, post_id = self.seed(options['posts'])
+            token = f'Bearer {AccessToken.for_user(user)}'
+            sync_urls = [reverse('get_user'), reverse('get_posts'), reverse('get_or_delete_post', args=[post_id])]
+            async_urls = [reverse('async_get_user'), reverse('async_get_posts'),
+                          reverse('async_get_or_delete_post', args=[post_id])]
+
+            self.stdout.write(f"{options['requests']} requests per entry point, {options['concurrency']} concurrent "
+                              f"clients, {options['db_delay'] * 1000:.1f} ms per SQL statement")
+            with slow_database(options['db_delay']):
+                latencies, elapsed = self.run_wsgi(sync_urls, token, options['requests'], options['concurrency'])
+                self.stdout.write(summarize('WSGI (sync views)', latencies, elapsed))
+                latencies, elapsed = asyncio.run(
+                    self.run_asgi(async_urls, token, options['requests'], options['concurrency']))
+                self.stdout.write(summarize('ASGI (async views)', latencies, elapsed))
+
+    def seed(self, post_count: int):
+        user = User.objects.create_user(username='bench', email='bench@bench.com', password='bench')
+        other = User.objects.create_user(username='bench2', email='bench2@bench.com', password='bench2')
+        posts = Post.objects.bulk_create(
+            [Post(user=user, title=f'Post {i}', desc=f'Description {i}') for i in range(post_count)])
+        Comment.objects.bulk_create(
+            [Comment(user=other, post=post, comment=f'Comment {i}') for post in posts for i in range(5)])
+        reconcile_counters()
+        return user, posts[0].id
+
+    # A pool of threads stands in for the WSGI worker pool
+    def run_wsgi(self, urls: list, token: str, requests: int, concurrency: int):
+        def call(i):
+            started = time.perf_counter()
+            response = Client().get(urls[i % len(urls)], HTTP_AUTHORIZATION=token)
+            assert response.status_code == 200, response.status_code
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(call, range(requests)))
+        return latencies, time.perf_counter() - started
+
+    # Concurrent tasks on one event loop, as an ASGI server would run them
+    async def run_asgi(self, urls: list, token: str, requests: int, concurrency: int):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call(i):
+            async with semaphore:
+                started = time.perf_counter()
+                # Like ASGIHandler, give each request its own thread for the async ORM's queries.
+                # AsyncClient takes raw header names rather than WSGI environ keys.
+                async with ThreadSensitiveContext():
+                    response = await client.get(urls[i % len(urls)], AUTHORIZATION=token)
+                assert response.status_code == 200, response.status_code
+                return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(call(i) for i in range(requests)))
+        return list(latencies), time.perf_counter() - started
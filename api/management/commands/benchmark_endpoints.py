@@ -0,0 +1,171 @@
+import itertools
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api import urls
+from api.benchmark import benchmark_database, summarize
+from api.feed import backfill_timeline
+from api.instrumentation import record_queries
+from api.models import Comment, Follow, Post, User
+from api.seed import seed_graph
+from api.tokens import IndexedRefreshToken
+from api.trending import compact_trending, record_activity
+
+
+# Drive every route of api/urls.py against a seeded social graph and report latency percentiles,
+# throughput and queries per request. Routes run one after another with a fixed seed, so runs compare.
+class Command(BaseCommand):
+    help = 'Benchmark every API route against a synthetic social graph'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Requests per route')
+        parser.add_argument('--users', type=int, default=500, help='Users in the seeded graph')
+        parser.add_argument('--likes', type=int, default=20000, help='Likes in the seeded graph')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed of the graph')
+        parser.add_argument('--route', action='append', help='Only benchmark these route names')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.stdout.write('Seeding graph')
+            seed_graph(users=options['users'], likes=options['likes'], seed=options['seed'])
+            self.setup_user()
+
+            scenarios = self.scenarios(options['requests'])
+            missing = {pattern.name for pattern in urls.urlpatterns} - {name for name, label, call in scenarios}
+            if missing:
+                raise CommandError(f'No benchmark scenario for routes: {", ".join(sorted(missing))}')
+
+            self.stdout.write(f"{options['requests']} requests per route")
+            for name, label, call in scenarios:
+                if options['route'] and name not in options['route']:
+                    continue
+                self.stdout.write(self.run(label, call, options['requests']))
+
+    # The benchmark user follows the most followed users, has posts with comments and is an admin
+    # so the stats routes answer
+    def setup_user(self):
+        self.user = User.objects.create_user(username='bench', email='bench@bench.com', password='benchpassword',
+                                             is_staff=True)
+        followees = list(User.objects.exclude(id=self.user.id).order_by('-followers_count')
+                         .values_list('id', flat=True)[:50])
+        Follow.objects.bulk_create([Follow(from_user_id=self.user.id, to_user_id=followee_id)
+                                    for followee_id in followees])
+        backfill_timeline(self.user.id, followees)
+        User.objects.filter(id=self.user.id).update(following_count=len(followees))
+        posts = Post.objects.bulk_create([Post(user=self.user, title=f'Bench {i}', desc=f'Bench post {i}')
+                                          for i in range(50)])
+        Comment.objects.bulk_create([Comment(user_id=followees[i % len(followees)], post=post, comment=f'Comment {i}')
+                                     for post in posts for i in range(10)])
+        Post.objects.filter(user=self.user).update(comments_count=10)
+        # Recent activity on the followees' posts, ranked as the periodic compaction would
+        record_activity(Post.objects.filter(user__in=followees).values_list('id', flat=True)[:1000], likes=1)
+        compact_trending()
+
+        self.token = f'Bearer {AccessToken.for_user(self.user)}'
+        self.own_post_ids = [post.id for post in posts]
+        self.popular_post_id = Post.objects.order_by('-comments_count').values_list('id', flat=True).first()
+        # Users and posts the benchmark user has no relation with yet, handed out to the write routes
+        self.strangers = iter(User.objects.exclude(id__in=followees + [self.user.id]).order_by('id')
+                              .values_list('id', flat=True))
+        self.other_posts = iter(Post.objects.exclude(user=self.user).exclude(likes=self.user).order_by('id')
+                                .values_list('id', flat=True))
+
+    # (route name, label, call) in run order: writes that need earlier state (unfollow, unlike,
+    # delete, token refresh) come after the routes that create it
+    def scenarios(self, requests: int):
+        followed, followed_batches, liked, liked_batches, created = [], [], [], [], []
+        refresh = [str(IndexedRefreshToken.for_user(self.user))]
+
+        def take(iterator, count):
+            return list(itertools.islice(iterator, count))
+
+        def get(path):
+            return lambda client, i: client.get(path, HTTP_AUTHORIZATION=self.token)
+
+        def post(path_for, data_for=lambda i: {}):
+            return lambda client, i: client.post(path_for(i), data_for(i), content_type='application/json',
+                                                 HTTP_AUTHORIZATION=self.token)
+
+        def refresh_token(client, i):
+            response = client.post(reverse('token_refresh'), {'refresh': refresh[0]})
+            refresh[0] = response.data.get('refresh', refresh[0])
+            return response
+
+        followed.extend(take(self.strangers, requests))
+        followed_batches.extend(take(self.strangers, 10) for _ in range(requests))
+        liked.extend(take(self.other_posts, requests))
+        liked_batches.extend(take(self.other_posts, 10) for _ in range(requests))
+        post_url = lambda i: reverse('get_or_delete_post', args=[self.own_post_ids[i % len(self.own_post_ids)]])
+        async_post_url = lambda i: reverse('async_get_or_delete_post', args=[self.own_post_ids[i % len(self.own_post_ids)]])
+
+        return [
+            ('token_obtain_pair', 'POST authenticate/',
+             lambda client, i: client.post(reverse('token_obtain_pair'),
+                                           {'email': 'bench@bench.com', 'password': 'benchpassword'})),
+            ('token_refresh', 'POST token/refresh/', refresh_token),
+            ('register', 'POST register/',
+             lambda client, i: client.post(reverse('register'), {'username': f'bench-register{i}',
+                                                                 'email': f'bench-register{i}@bench.com',
+                                                                 'password': f'bench-password-{i}'})),
+            ('get_user', 'GET user/', get(reverse('get_user'))),
+            ('follow_user', 'POST follow/<id>/', post(lambda i: reverse('follow_user', args=[followed[i]]))),
+            ('follow_users', 'POST follow/batch/',
+             post(lambda i: reverse('follow_users'), lambda i: {'ids': followed_batches[i]})),
+            ('unfollow_user', 'POST unfollow/<id>/', post(lambda i: reverse('unfollow_user', args=[followed[i]]))),
+            ('unfollow_users', 'POST unfollow/batch/',
+             post(lambda i: reverse('unfollow_users'), lambda i: {'ids': followed_batches[i]})),
+            ('create_post', 'POST posts/',
+             lambda client, i: self.created(created, client.post(reverse('create_post'),
+                                                                 {'title': f'New {i}', 'desc': f'New post {i}'},
+                                                                 HTTP_AUTHORIZATION=self.token))),
+            ('get_or_delete_post', 'GET posts/<id>/', lambda client, i: client.get(post_url(i),
+                                                                                  HTTP_AUTHORIZATION=self.token)),
+            ('get_or_delete_post', 'DELETE posts/<id>/',
+             lambda client, i: client.delete(reverse('get_or_delete_post', args=[created[i]]),
+                                             HTTP_AUTHORIZATION=self.token)),
+            ('get_post_comments', 'GET posts/<id>/comments/',
+             get(reverse('get_post_comments', args=[self.popular_post_id]))),
+            ('like_post', 'POST like/<id>/', post(lambda i: reverse('like_post', args=[liked[i]]))),
+            ('like_posts', 'POST like/batch/',
+             post(lambda i: reverse('like_posts'), lambda i: {'ids': liked_batches[i]})),
+            ('unlike_post', 'POST unlike/<id>/', post(lambda i: reverse('unlike_post', args=[liked[i]]))),
+            ('unlike_posts', 'POST unlike/batch/',
+             post(lambda i: reverse('unlike_posts'), lambda i: {'ids': liked_batches[i]})),
+            ('comment_post', 'POST comment/<id>/',
+             post(lambda i: reverse('comment_post', args=[self.popular_post_id]), lambda i: {'comment': f'Bench {i}'})),
+            ('get_posts', 'GET all_posts/', get(reverse('get_posts'))),
+            ('export_posts', 'GET export/', get(reverse('export_posts'))),
+            ('get_feed', 'GET feed/', get(reverse('get_feed'))),
+            ('search', 'GET search/', get(reverse('search') + '?q=synthetic')),
+            ('get_trending', 'GET trending/', get(reverse('get_trending'))),
+            ('get_post_cache_stats', 'GET cache/stats/', get(reverse('get_post_cache_stats'))),
+            ('get_db_stats', 'GET db/stats/', get(reverse('get_db_stats'))),
+            ('async_get_user', 'GET async/user/', get(reverse('async_get_user'))),
+            ('async_get_posts', 'GET async/all_posts/', get(reverse('async_get_posts'))),
+            ('async_get_or_delete_post', 'GET async/posts/<id>/',
+             lambda client, i: client.get(async_post_url(i), HTTP_AUTHORIZATION=self.token)),
+        ]
+
+    def created(self, created: list, response):
+        created.append(response.data['id'])
+        return response
+
+    def run(self, label: str, call, requests: int) -> str:
+        client = Client()
+        latencies, queries, failures = [], 0, 0
+        started = time.perf_counter()
+        for i in range(requests):
+            request_started = time.perf_counter()
+            with record_queries() as recorder:
+                response = call(client, i)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            latencies.append(time.perf_counter() - request_started)
+            queries += recorder.count
+            failures += response.status_code >= 400
+        line = f'{summarize(label, latencies, time.perf_counter() - started)}  {queries / requests:>6.1f} q/req'
+        return f'{line}  {failures} failed' if failures else line
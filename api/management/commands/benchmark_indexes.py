@@ -0,0 +1,96 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api.benchmark import benchmark_database, percentile
+from api.counters import reconcile_counters
+from api.indexes import access_pattern_indexes
+from api.models import Comment, Follow, Like, Post, User
+
+
+# Query plans and timings of the API's hot lookups on a seeded dataset, without and with
+# the access pattern indexes
+class Command(BaseCommand):
+    help = 'Report query plans and timings before and after the access pattern indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Users seeded')
+        parser.add_argument('--posts', type=int, default=50, help='Posts per user')
+        parser.add_argument('--comments', type=int, default=5, help='Comments per post')
+        parser.add_argument('--likes', type=int, default=100, help='Likes per user')
+        parser.add_argument('--follows', type=int, default=50, help='Follows per user')
+        parser.add_argument('--repeat', type=int, default=50, help='Timed runs per query')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.seed(options)
+            user_ids = list(User.objects.values_list('id', flat=True))
+            post_ids = list(Post.objects.values_list('id', flat=True))
+
+            self.drop_indexes()
+            self.report('Before', user_ids, post_ids, options['repeat'])
+            self.create_indexes()
+            self.report('After', user_ids, post_ids, options['repeat'])
+
+    def seed(self, options: dict):
+        rng = random.Random(0)
+        users = User.objects.bulk_create(
+            [User(username=f'bench{i}', email=f'bench{i}@bench.com') for i in range(options['users'])])
+        posts = Post.objects.bulk_create(
+            [Post(user=user, title=f'Post {i}', desc=f'Description {i}')
+             for user in users for i in range(options['posts'])], batch_size=1000)
+        Comment.objects.bulk_create(
+            [Comment(user=rng.choice(users), post=post, comment=f'Comment {i}')
+             for post in posts for i in range(options['comments'])], batch_size=1000)
+        Like.objects.bulk_create(
+            [Like(user_id=user.id, post_id=post.id)
+             for user in users for post in rng.sample(posts, min(options['likes'], len(posts)))],
+            batch_size=1000, ignore_conflicts=True)
+        Follow.objects.bulk_create(
+            [Follow(from_user_id=user.id, to_user_id=other.id)
+             for user in users for other in rng.sample(users, min(options['follows'], len(users))) if other != user],
+            batch_size=1000, ignore_conflicts=True)
+        reconcile_counters()
+
+    def queries(self, user_id: int, post_id: int, post_ids: list):
+        return {
+            'user posts by time': Post.objects.filter(user=user_id).order_by('-created_at', '-id').values('id')[:20],
+            'post comments by time': Comment.objects.filter(post=post_id).order_by('created_at', 'id').values('id')[:20],
+            'followers of a user': Follow.objects.filter(to_user_id=user_id).values('from_user_id'),
+            'user likes among posts': Like.objects.filter(user_id=user_id, post_id__in=post_ids).values('post_id'),
+        }
+
+    def report(self, title: str, user_ids: list, post_ids: list, repeat: int):
+        self.analyze()
+        rng = random.Random(1)
+        self.stdout.write(f'\n=== {title} ===')
+        for name, queryset in self.queries(user_ids[0], post_ids[0], post_ids[:100]).items():
+            self.stdout.write(f'\n{name}\n{queryset.explain()}')
+
+        timings = {}
+        for i in range(repeat):
+            queries = self.queries(rng.choice(user_ids), rng.choice(post_ids), rng.sample(post_ids, 100))
+            for name, queryset in queries.items():
+                started = time.perf_counter()
+                list(queryset)
+                timings.setdefault(name, []).append(time.perf_counter() - started)
+        self.stdout.write('')
+        for name, latencies in timings.items():
+            self.stdout.write(f'{name:<28} p50 {percentile(latencies, 50) * 1000:>8.3f} ms  '
+                              f'p95 {percentile(latencies, 95) * 1000:>8.3f} ms')
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def drop_indexes(self):
+        with connection.schema_editor() as schema_editor:
+            for model, index in access_pattern_indexes():
+                schema_editor.remove_index(model, index)
+
+    def create_indexes(self):
+        with connection.schema_editor() as schema_editor:
+            for model, index in access_pattern_indexes():
+                schema_editor.add_index(model, index)
@@ -0,0 +1,65 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from api.benchmark import benchmark_database, summarize
+from api.hashing import hash_pool
+from api.models import User
+
+
+# Measure login throughput through the password hash pool, reported per core doing the hashing
+class Command(BaseCommand):
+    help = 'Benchmark logins per second per core through the password hash pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Login requests')
+        parser.add_argument('--concurrency', type=int, default=20, help='Concurrent clients')
+        parser.add_argument('--workers', type=int, default=settings.PASSWORD_HASH_WORKERS,
+                            help='Password hash pool threads')
+        parser.add_argument('--queue-depth', type=int,
+                            help='Hashes allowed to wait for a pool thread before logins get 503, '
+                                 'defaults to the concurrency so every login is measured')
+
+    def handle(self, *args, **options):
+        if options['queue_depth'] is None:
+            options['queue_depth'] = options['concurrency']
+        with benchmark_database(), override_settings(PASSWORD_HASH_WORKERS=options['workers'],
+                                                     PASSWORD_HASH_QUEUE_DEPTH=options['queue_depth']):
+            # Restart the pool so it picks up the benchmark sizes
+            hash_pool.shutdown()
+            try:
+                User.objects.create_user(username='bench', email='bench@bench.com', password='benchpassword')
+                latencies, rejected, elapsed = self.run_logins(options['requests'], options['concurrency'])
+            finally:
+                hash_pool.shutdown()
+
+        cores = min(options['workers'], os.cpu_count() or 1)
+        throughput = len(latencies) / elapsed if elapsed else 0.0
+        self.stdout.write(f"{options['requests']} logins, {options['concurrency']} concurrent clients, "
+                          f"{options['workers']} hash workers, queue depth {options['queue_depth']}")
+        self.stdout.write(summarize('Successful logins', latencies, elapsed))
+        self.stdout.write(f'Rejected with 503: {rejected}')
+        self.stdout.write(f'Logins per second per core: {throughput / cores:.1f} ({cores} cores)')
+
+    # A pool of threads stands in for the WSGI worker pool
+    def run_logins(self, requests: int, concurrency: int):
+        url = reverse('token_obtain_pair')
+
+        def call(i):
+            started = time.perf_counter()
+            response = Client().post(url, {'email': 'bench@bench.com', 'password': 'benchpassword'})
+            assert response.status_code in (200, 503), response.status_code
+            return response.status_code, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(call, range(requests)))
+        elapsed = time.perf_counter() - started
+        latencies = [latency for status, latency in results if status == 200]
+        return latencies, len(results) - len(latencies), elapsed
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef, Q
+
+from api.benchmark import benchmark_database, percentile
+from api.models import Comment, Post, User
+from api.search import search_posts
+from api.seed import seed_graph
+
+NEEDLE = 'needle'
+
+
+# Search latency as the seeded corpus grows, against the icontains scan it replaces. The searched word
+# is planted in a fixed number of posts, so the index lookup stays flat while the scan grows with the corpus.
+class Command(BaseCommand):
+    help = 'Benchmark full-text search against an icontains scan on a growing corpus'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--steps', type=int, default=4, help='Times the corpus doubles')
+        parser.add_argument('--users', type=int, default=200, help='Users seeded in the first step')
+        parser.add_argument('--needles', type=int, default=20, help='Posts containing the searched word')
+        parser.add_argument('--repeat', type=int, default=30, help='Timed runs per query and step')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.plant(options['needles'])
+            self.stdout.write(f"{'posts':>9} {'comments':>9}  {'search p50':>12} {'search p95':>12}  "
+                              f"{'icontains p50':>14} {'icontains p95':>14}")
+            users = options['users']
+            for step in range(options['steps']):
+                # Each step adds as many users as exist already, doubling the corpus
+                seed_graph(users=users, likes=users * 10, seed=step)
+                users = User.objects.count()
+                self.stdout.write(self.report(options['repeat']))
+
+    def plant(self, count: int):
+        user = User.objects.create_user(username='needles', email='needles@bench.com', password=None)
+        Post.objects.bulk_create([Post(user=user, title=f'Post {i} with a {NEEDLE}', desc=f'Planted post {i}')
+                                  for i in range(count)])
+
+    def search(self):
+        return search_posts(NEEDLE, limit=20)[0]
+
+    # What a search without the index would run: a substring scan of every post and comment
+    def scan(self):
+        comments = Comment.objects.filter(post=OuterRef('pk'), comment__icontains=NEEDLE)
+        return list(Post.objects.filter(Q(title__icontains=NEEDLE) | Q(desc__icontains=NEEDLE) | Exists(comments))
+                    .order_by('-id').values_list('id', flat=True)[:20])
+
+    def time(self, query, repeat: int) -> list:
+        latencies = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            query()
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    def report(self, repeat: int) -> str:
+        search, scan = self.time(self.search, repeat), self.time(self.scan, repeat)
+        return (f'{Post.objects.count():>9} {Comment.objects.count():>9}  '
+                f'{percentile(search, 50) * 1000:>9.3f} ms {percentile(search, 95) * 1000:>9.3f} ms  '
+                f'{percentile(scan, 50) * 1000:>11.3f} ms {percentile(scan, 95) * 1000:>11.3f} ms')
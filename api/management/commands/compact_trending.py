@@ -0,0 +1,22 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.trending import compact_trending
+
+
+# Rank the trending posts from the activity buckets, meant to run every few minutes from cron
+class Command(BaseCommand):
+    help = 'Recompute the trending posts from recent like and comment activity and drop expired buckets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window-hours', type=int, default=settings.TRENDING_WINDOW_HOURS,
+                            help='Hours of activity a post is ranked by')
+        parser.add_argument('--size', type=int, default=settings.TRENDING_SIZE, help='Posts kept in the ranking')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        ranked, deleted = compact_trending(window_hours=options['window_hours'], size=options['size'])
+        self.stdout.write(f'{ranked} posts ranked, {deleted} expired buckets deleted '
+                          f'in {(time.perf_counter() - started) * 1000:.1f} ms')
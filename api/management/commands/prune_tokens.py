@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+
+# Chunked replacement for simplejwt's flushexpiredtokens, which deletes every expired row in one statement
+class Command(BaseCommand):
+    help = 'Delete expired outstanding and blacklisted tokens in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Tokens deleted per batch')
+
+    def handle(self, *args, **options):
+        now = aware_utcnow()
+        outstanding_deleted = blacklisted_deleted = 0
+        while True:
+            ids = list(OutstandingToken.objects.filter(expires_at__lte=now).order_by('id')
+                       .values_list('id', flat=True)[:options['chunk_size']])
+            if not ids:
+                break
+            # Blacklist rows go first so the outstanding token delete has nothing left to cascade to
+            blacklisted_deleted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+            outstanding_deleted += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+
+        self.stdout.write(f'{outstanding_deleted} outstanding and {blacklisted_deleted} blacklisted tokens deleted')
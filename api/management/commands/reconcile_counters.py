@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.counters import reconcile_counters
+
+
+# Repair drift in the denormalized like, comment, follower and following counters
+class Command(BaseCommand):
+    help = 'Recount stored like, comment, follower and following counters and fix any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows recounted per batch')
+
+    def handle(self, *args, **options):
+        repaired = reconcile_counters(chunk_size=options['chunk_size'])
+        for counter, count in repaired.items():
+            self.stdout.write(f'{counter}: {count} repaired')
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.seed import seed_graph
+
+
+class Command(BaseCommand):
+    help = 'Seed the database with a synthetic social graph'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Users to create')
+        parser.add_argument('--posts', type=int, default=10, help='Average posts per user')
+        parser.add_argument('--follows', type=int, default=20, help='Average users followed per user')
+        parser.add_argument('--likes', type=int, default=100000, help='Likes to generate, duplicates are skipped')
+        parser.add_argument('--comments', type=float, default=5, help='Average comments per post')
+        parser.add_argument('--alpha', type=float, default=1.2, help='Zipf exponent of user and post popularity')
+        parser.add_argument('--days', type=int, default=30, help='Posts are spread over this many past days')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed gives the same graph')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counts = seed_graph(options['users'], options['posts'], options['follows'], options['likes'],
+                            options['comments'], options['alpha'], options['days'], options['seed'],
+                            log=self.stdout.write)
+        for table, count in counts.items():
+            self.stdout.write(f'{table:<18} {count:>10}')
+        self.stdout.write(f'Seeded in {time.perf_counter() - started:.1f} s')
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import logging
+import time
+
+import jwt
+from django.conf import settings
+from rest_framework_simplejwt.settings import api_settings
+
+from .cache import ais_pinned_to_primary, apin_to_primary, is_pinned_to_primary, pin_to_primary
+from .db.router import routing_context
+from .instrumentation import RepeatedQueryError, arecord_queries, record_queries
+
+logger = logging.getLogger('api.sql')
+
+
+# Records the SQL run by each request. The query count and database time go out as Server-Timing
+# metrics and, with the request duration and the shapes that ran more than SQL_REPEAT_THRESHOLD times,
+# as one JSON log line. Repeated shapes are logged as warnings, or raised with SQL_REPEAT_RAISE so
+# tests fail on N+1 queries. Queries run while a streaming response is consumed are not counted.
+# Behind an async handler it runs in async mode and wraps the connections of the thread the async ORM uses.
+class QueryInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        mark_async(self, get_response)
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        return self.report(request, response, recorder, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        async with arecord_queries() as recorder:
+            response = await self.get_response(request)
+        return self.report(request, response, recorder, time.perf_counter() - started)
+
+    def report(self, request, response, recorder, duration: float):
+        repeated = recorder.repeated(settings.SQL_REPEAT_THRESHOLD)
+        if repeated and settings.SQL_REPEAT_RAISE:
+            shape, count = repeated[0]
+            raise RepeatedQueryError(f'{request.method} {request.path} ran {count} times: {shape}')
+
+        response['Server-Timing'] = (f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries", '
+                                     f'app;dur={duration * 1000:.2f}')
+        level = logging.WARNING if repeated else logging.INFO
+        if logger.isEnabledFor(level):
+            logger.log(level, json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': recorder.count,
+                'db_ms': round(recorder.duration * 1000, 2),
+                'duration_ms': round(duration * 1000, 2),
+                'repeated': [{'sql': shape, 'count': count} for shape, count in repeated],
+            }))
+        return response
+
+
+# Read-your-writes on top of PrimaryReplicaRouter: after a request writes, the user's requests read from
+# the primary for REPLICA_STICKY_SECONDS, long enough for the replicas to catch up with the write.
+# Runs in async mode behind an async handler, so the async views keep not holding a thread.
+class ReplicaStickinessMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        mark_async(self, get_response)
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        user_id = token_user_id(request)
+        with routing_context(use_primary=user_id is not None and is_pinned_to_primary(user_id)) as state:
+            response = self.get_response(request)
+        if state.wrote and user_id is not None:
+            pin_to_primary(user_id)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        user_id = token_user_id(request)
+        pinned = user_id is not None and await ais_pinned_to_primary(user_id)
+        # The ORM's sync_to_async calls copy the context, and with it this request's routing state
+        with routing_context(use_primary=pinned) as state:
+            response = await self.get_response(request)
+        if state.wrote and user_id is not None:
+            await apin_to_primary(user_id)
+        return response
+
+
+# Like MiddlewareMixin: a hybrid middleware in front of an async get_response becomes a coroutine
+# function, so the handler calls it without a sync_to_async thread
+def mark_async(middleware, get_response):
+    middleware._is_coroutine = asyncio.coroutines._is_coroutine if asyncio.iscoroutinefunction(get_response) else None
+
+
+# User id claim of the bearer token. The signature is not verified here, it only picks the database:
+# a forged token can at most send its own reads to the primary, authentication still rejects it.
+def token_user_id(request):
+    parts = request.META.get(api_settings.AUTH_HEADER_NAME, '').split()
+    if len(parts) != 2 or parts[0] not in api_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        return jwt.decode(parts[1], options={'verify_signature': False}).get(api_settings.USER_ID_CLAIM)
+    except jwt.InvalidTokenError:
+        return None
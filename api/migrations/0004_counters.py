@@ -0,0 +1,53 @@
+# Generated by Django 4.1.3 on 2026-10-18 06:34
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+# Fill the new counters from the existing likes, comments and follows
+def populate_counters(apps, schema_editor):
+    User = apps.get_model('api', 'User')
+    Post = apps.get_model('api', 'Post')
+    Comment = apps.get_model('api', 'Comment')
+
+    def count(related_model, field):
+        counts = (related_model.objects.filter(**{field: OuterRef('pk')})
+                  .order_by().values(field).annotate(count=Count('*')).values('count'))
+        return Coalesce(Subquery(counts), 0)
+
+    Post.objects.update(likes_count=count(Post.likes.through, 'post'),
+                        comments_count=count(Comment, 'post'))
+    User.objects.update(following_count=count(User.following.through, 'from_user'),
+                        followers_count=count(User.following.through, 'to_user'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_rename_text_comment_comment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+from django.db import migrations, models
+
+
+def access_pattern_indexes(apps):
+    Post = apps.get_model('api', 'Post')
+    Comment = apps.get_model('api', 'Comment')
+    User = apps.get_model('api', 'User')
+    return [
+        (Post, models.Index(fields=['user', 'created_at', 'id'], name='post_user_created_idx')),
+        (Comment, models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_idx')),
+        # Reverse direction of the unique (from_user, to_user) and (post, user) indexes of the through tables
+        (User.following.through, models.Index(fields=['to_user', 'from_user'], name='follow_to_from_idx')),
+        (Post.likes.through, models.Index(fields=['user', 'post'], name='like_user_post_idx')),
+    ]
+
+
+# On PostgreSQL the indexes are built concurrently so writes to the tables are not blocked while they build
+def create_indexes(apps, schema_editor):
+    concurrently = {'concurrently': True} if schema_editor.connection.vendor == 'postgresql' else {}
+    for model, index in access_pattern_indexes(apps):
+        schema_editor.add_index(model, index, **concurrently)
+
+
+def drop_indexes(apps, schema_editor):
+    concurrently = {'concurrently': True} if schema_editor.connection.vendor == 'postgresql' else {}
+    for model, index in access_pattern_indexes(apps):
+        schema_editor.remove_index(model, index, **concurrently)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('api', '0005_timelineentry'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='post',
+                    index=models.Index(fields=['user', 'created_at', 'id'], name='post_user_created_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='comment',
+                    index=models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_idx'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(create_indexes, drop_indexes),
+            ],
+        ),
+    ]
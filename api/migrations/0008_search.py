@@ -0,0 +1,75 @@
+from django.db import migrations
+
+# PostgreSQL keeps a weighted tsvector per post (title A, description B) and per comment (C) in generated
+# columns, so every write path including bulk inserts maintains them, each with a GIN index
+POSTGRESQL_FORWARD = [
+    """ALTER TABLE api_post ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+           setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+           setweight(to_tsvector('english', coalesce("desc", '')), 'B')) STORED""",
+    'CREATE INDEX post_search_idx ON api_post USING GIN (search_vector)',
+    """ALTER TABLE api_comment ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+           setweight(to_tsvector('english', coalesce(comment, '')), 'C')) STORED""",
+    'CREATE INDEX comment_search_idx ON api_comment USING GIN (search_vector)',
+]
+POSTGRESQL_REVERSE = [
+    'DROP INDEX comment_search_idx',
+    'ALTER TABLE api_comment DROP COLUMN search_vector',
+    'DROP INDEX post_search_idx',
+    'ALTER TABLE api_post DROP COLUMN search_vector',
+]
+
+
+# SQLite indexes the text in FTS5 tables over the post and comment tables, kept in sync by triggers.
+# Updates only reindex when the text columns change, counter updates leave the index alone. Their rank
+# column is bm25 with the column weights PostgreSQL's ts_rank gives weights A, B and C.
+# SQLite migrations that remake api_post or api_comment drop their triggers, such a migration must
+# recreate them.
+def sqlite_fts(table: str, columns: list, weights: list) -> list:
+    names = ', '.join(f'"{column}"' for column in columns)
+    new = ', '.join(f'new."{column}"' for column in columns)
+    old = ', '.join(f'old."{column}"' for column in columns)
+    return [
+        f"""CREATE VIRTUAL TABLE {table}_fts USING fts5({names}, content='{table}', content_rowid='id',
+                                                       tokenize='porter unicode61')""",
+        f"""CREATE TRIGGER {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {table}_fts(rowid, {names}) VALUES (new.id, {new});
+            END""",
+        f"""CREATE TRIGGER {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {table}_fts({table}_fts, rowid, {names}) VALUES ('delete', old.id, {old});
+            END""",
+        f"""CREATE TRIGGER {table}_fts_update AFTER UPDATE OF {names} ON {table} BEGIN
+                INSERT INTO {table}_fts({table}_fts, rowid, {names}) VALUES ('delete', old.id, {old});
+                INSERT INTO {table}_fts(rowid, {names}) VALUES (new.id, {new});
+            END""",
+        f"INSERT INTO {table}_fts({table}_fts, rank) VALUES ('rank', 'bm25({', '.join(map(str, weights))})')",
+        # Index the rows written before the migration
+        f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')",
+    ]
+
+
+SQLITE_FORWARD = sqlite_fts('api_post', ['title', 'desc'], [1.0, 0.4]) + sqlite_fts('api_comment', ['comment'], [0.2])
+SQLITE_REVERSE = [f'DROP {kind} {table}_fts{suffix}'
+                  for table in ('api_comment', 'api_post')
+                  for kind, suffix in (('TRIGGER', '_insert'), ('TRIGGER', '_delete'), ('TRIGGER', '_update'),
+                                       ('TABLE', ''))]
+
+
+def run(statements: dict):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_access_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'postgresql': POSTGRESQL_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run({'postgresql': POSTGRESQL_REVERSE, 'sqlite': SQLITE_REVERSE}),
+        ),
+    ]
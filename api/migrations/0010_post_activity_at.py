@@ -0,0 +1,51 @@
+# Generated by Django 4.1.3 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+# Adding the column remakes api_post on SQLite, which drops the full-text triggers of migration 0008
+SQLITE_POST_FTS_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS api_post_fts_insert AFTER INSERT ON api_post BEGIN
+           INSERT INTO api_post_fts(rowid, "title", "desc") VALUES (new.id, new."title", new."desc");
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS api_post_fts_delete AFTER DELETE ON api_post BEGIN
+           INSERT INTO api_post_fts(api_post_fts, rowid, "title", "desc") VALUES ('delete', old.id, old."title", old."desc");
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS api_post_fts_update AFTER UPDATE OF "title", "desc" ON api_post BEGIN
+           INSERT INTO api_post_fts(api_post_fts, rowid, "title", "desc") VALUES ('delete', old.id, old."title", old."desc");
+           INSERT INTO api_post_fts(rowid, "title", "desc") VALUES (new.id, new."title", new."desc");
+       END""",
+]
+
+
+def restore_fts_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_POST_FTS_TRIGGERS:
+            schema_editor.execute(statement)
+
+
+# Existing posts were last active when they were last updated
+def copy_updated_at(apps, schema_editor):
+    Post = apps.get_model('api', 'Post')
+    Post.objects.update(activity_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_trending'),
+    ]
+
+    operations = [
+        # Unapplying remakes the table again, the triggers are restored after it
+        migrations.RunPython(migrations.RunPython.noop, restore_fts_triggers),
+        migrations.AddField(
+            model_name='post',
+            name='activity_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+        migrations.RunPython(copy_updated_at, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
-from django.db import models
+from django.db import connections, models
+from django.db.models.expressions import RawSQL
 from django.contrib.auth.models import AbstractUser
 
+from .indexes import COMMENT_POST_CREATED, POST_USER_CREATED
+
 
 # Custom user model with email as pk
 class User(AbstractUser):
@@ -9,6 +12,10 @@ class User(AbstractUser):
     # Implemented followers and following as ManyToMany relation of Users
     following = models.ManyToManyField('self', related_name='followers', symmetrical=False, blank=True, null=True)
 
+    # Denormalized counts kept in sync by the follow views, repaired by the reconcile_counters command
+    following_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
 
@@ -16,6 +23,80 @@ class User(AbstractUser):
         return self.email
 
 
+# Queryset helpers for loading posts with everything the serializers need
+class PostQuerySet(models.QuerySet):
+    def with_details(self):
+        # Comments are prefetched with their authors and likes come from the stored counter,
+        # so serializing any number of posts costs a fixed number of queries
+        return self.prefetch_related(
+            models.Prefetch('comments', queryset=Comment.objects.select_related('user').order_by('id'))
+        )
+
+    def for_fields(self, fields: list, comments: str = 'full'):
+        # Load only the columns behind the requested PostSerializer fields and only query comments
+        # when they are actually rendered. A comment preview is attached with attach_comment_preview
+        # once the posts are fetched.
+        columns = {'id', 'created_at', 'likes_count', 'comments_count'} | {f for f in fields if f in ('title', 'desc')}
+        posts = self.only(*columns)
+        if 'comments' in fields and comments == 'full':
+            posts = posts.with_details()
+        return posts
+
+
+# Ids of the latest `count` comments of each post. PostgreSQL stops each post's index scan after `count`
+# rows in a LATERAL subquery, elsewhere a ROW_NUMBER window per post ranks the comments of the posts.
+LATEST_COMMENTS_LATERAL = '''
+    SELECT latest.id FROM api_post post CROSS JOIN LATERAL (
+        SELECT id FROM api_comment WHERE post_id = post.id ORDER BY created_at DESC, id DESC LIMIT %s
+    ) latest
+    WHERE post.id IN ({posts})
+'''
+LATEST_COMMENTS_WINDOW = '''
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (PARTITION BY post_id ORDER BY created_at DESC, id DESC) AS position
+        FROM api_comment WHERE post_id IN ({posts})
+    ) ranked
+    WHERE position <= %s
+'''
+
+
+# Load the latest `count` comments of each of the fetched posts into post.latest_comments, with one query
+# for any number of posts, read from the database the posts came from. Each post's comments are read
+# newest first from the (post, created_at, id) index and cut at `count`, so a post with 50k comments
+# costs `count` rows. Returns the posts.
+def attach_comment_preview(posts, count: int) -> list:
+    posts = list(posts)
+    if posts:
+        _assign_comment_preview(posts, _latest_comments(posts, count))
+    return posts
+
+
+async def aattach_comment_preview(posts, count: int) -> list:
+    posts = list(posts)
+    if posts:
+        _assign_comment_preview(posts, [comment async for comment in _latest_comments(posts, count)])
+    return posts
+
+
+def _latest_comments(posts: list, count: int):
+    using = posts[0]._state.db
+    ids = [post.id for post in posts]
+    placeholders = ', '.join(['%s'] * len(ids))
+    if connections[using].vendor == 'postgresql':
+        latest = RawSQL(LATEST_COMMENTS_LATERAL.format(posts=placeholders), [count, *ids])
+    else:
+        latest = RawSQL(LATEST_COMMENTS_WINDOW.format(posts=placeholders), [*ids, count])
+    return Comment.objects.using(using).filter(id__in=latest).select_related('user').order_by('created_at', 'id')
+
+
+def _assign_comment_preview(posts: list, latest_comments):
+    comments = {}
+    for comment in latest_comments:
+        comments.setdefault(comment.post_id, []).append(comment)
+    for post in posts:
+        post.latest_comments = comments.get(post.id, [])
+
+
 # Post model connected to User model
 class Post(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
@@ -25,6 +106,18 @@ class Post(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     likes = models.ManyToManyField(User, related_name='liked_posts', blank=True, null=True)
 
+    # Denormalized counts kept in sync by the like and comment views, repaired by the reconcile_counters command
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+    # Last change to the post or its likes and comments, the Last-Modified of the post. updated_at stays the
+    # time of the last content edit.
+    activity_at = models.DateTimeField(auto_now=True)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [POST_USER_CREATED]
+
     def __str__(self):
         return self.title
 
@@ -37,5 +130,71 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [COMMENT_POST_CREATED]
+
     def __str__(self):
         return self.comment
+
+
+# Auto-created through tables, written directly so follows and likes are single conditional statements.
+# Their unique (from, to) index serves lookups from the owning side, migration 0007 adds the reverse
+# (follow_to_from_idx, like_user_post_idx) for followers and a user's likes
+Follow = User.following.through
+Like = Post.likes.through
+
+
+# Materialized home timeline, one row per (follower, post) written when the post is created
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    # Post author and creation time are copied so trims and feed reads never join posts
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='timeline_user_created_idx'),
+            models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} <- {self.post}'
+
+
+# Likes and comments a post received during one hour, upserted by the like and comment views and folded
+# into TrendingPost by the compact_trending job. Unlikes subtract, so likes can go negative in a bucket.
+class PostActivity(models.Model):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    bucket = models.DateTimeField()
+    likes = models.IntegerField(default=0)
+    comments = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'bucket'], name='unique_post_activity'),
+        ]
+        indexes = [
+            # Compaction reads the buckets of the window and deletes the ones that left it
+            models.Index(fields=['bucket'], name='post_activity_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} @ {self.bucket}'
+
+
+# The top TRENDING_SIZE posts of the last TRENDING_WINDOW_HOURS, replaced as a whole by compact_trending
+# so /api/trending/ is a single primary key range read
+class TrendingPost(models.Model):
+    rank = models.PositiveIntegerField(primary_key=True)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    score = models.PositiveIntegerField()
+    likes = models.IntegerField()
+    comments = models.PositiveIntegerField()
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.rank}. {self.post_id}'
@@ -0,0 +1,71 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+# Opaque cursor holding the (created_at, id) of the last row of a page
+def encode_cursor(created_at: datetime, id: int) -> str:
+    raw = f'{created_at.isoformat()}|{id}'
+    return urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(id)
+    except ValueError:
+        # Also covers bad base64 padding and undecodable bytes
+        raise ValueError('Invalid cursor')
+
+
+# Read the page size from a query param, falling back to the default and capping at the maximum
+def parse_page_size(value: str = None, default: int = DEFAULT_PAGE_SIZE, maximum: int = MAX_PAGE_SIZE) -> int:
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('Invalid limit')
+    if limit < 1:
+        raise ValueError('Invalid limit')
+    return min(limit, maximum)
+
+
+# Keyset pagination over (created_at, id) so every page costs the same index range scan,
+# no matter how deep into the result set the client is
+def keyset_page(queryset, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE, descending: bool = False):
+    # Fetch one extra row to know whether there is a next page
+    items = list(_keyset_queryset(queryset, cursor, descending)[:limit + 1])
+    return _split_page(items, limit)
+
+
+# Same as keyset_page, for async views
+async def akeyset_page(queryset, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE, descending: bool = False):
+    items = [item async for item in _keyset_queryset(queryset, cursor, descending)[:limit + 1]]
+    return _split_page(items, limit)
+
+
+def _keyset_queryset(queryset, cursor: str, descending: bool):
+    if descending:
+        queryset = queryset.order_by('-created_at', '-id')
+    else:
+        queryset = queryset.order_by('created_at', 'id')
+    if cursor:
+        created_at, id = decode_cursor(cursor)
+        if descending:
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=id))
+        else:
+            queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=id))
+    return queryset
+
+
+def _split_page(items: list, limit: int):
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+    return items, next_cursor
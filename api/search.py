@@ -0,0 +1,96 @@
+import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db import connections, router
+
+from .models import Post
+
+MAX_QUERY_LENGTH = 200
+MAX_QUERY_TERMS = 16
+
+# Matching posts and comments come from the inverted indexes of migration 0008: a GIN index over weighted
+# tsvector columns on PostgreSQL, FTS5 tables on SQLite. Every term is looked up on its own, in the posts
+# and in the comments, so a post matches when each term appears in its title, its description or any of
+# its comments. A post ranks by the sum over the terms of its own match plus its best matching comment,
+# ties are broken by id so (rank, id) orders every result.
+POSTGRESQL_TERMS = '''(
+    SELECT term, plainto_tsquery('english', word) AS query FROM unnest(%s::text[]) WITH ORDINALITY AS words(word, term)
+) terms'''
+POSTGRESQL_MATCHES = '''
+    SELECT post.id AS post_id, terms.term, ts_rank(post.search_vector, terms.query)::float8 AS rank
+    FROM {terms} JOIN api_post post ON post.search_vector @@ terms.query
+    UNION ALL
+    SELECT comment.post_id, terms.term, MAX(ts_rank(comment.search_vector, terms.query))::float8
+    FROM {terms} JOIN api_comment comment ON comment.search_vector @@ terms.query
+    GROUP BY comment.post_id, terms.term
+'''
+# Stop words have no lexeme and match nothing, they are not required
+POSTGRESQL_REQUIRED = "(SELECT COUNT(*) FROM unnest(%s::text[]) AS word WHERE numnode(plainto_tsquery('english', word)) > 0)"
+SQLITE_TERM_MATCHES = '''
+    SELECT rowid AS post_id, {term} AS term, -rank AS rank FROM api_post_fts WHERE api_post_fts MATCH %s
+    UNION ALL
+    SELECT comment.post_id, {term}, MAX(-api_comment_fts.rank)
+    FROM api_comment_fts JOIN api_comment comment ON comment.id = api_comment_fts.rowid
+    WHERE api_comment_fts MATCH %s
+    GROUP BY comment.post_id
+'''
+PAGE = '''
+    SELECT post_id, SUM(rank) AS rank FROM ({matches}) matches
+    GROUP BY post_id
+    HAVING COUNT(DISTINCT term) = {required} {after}
+    ORDER BY rank DESC, post_id DESC
+    LIMIT %s
+'''
+AFTER = 'AND (SUM(rank) < %s OR (SUM(rank) = %s AND post_id < %s))'
+
+
+# Opaque cursor holding the (rank, id) of the last result of a page. repr() round-trips the float exactly.
+def encode_rank_cursor(rank: float, id: int) -> str:
+    return urlsafe_b64encode(f'{rank!r}|{id}'.encode()).decode()
+
+
+def decode_rank_cursor(cursor: str):
+    try:
+        rank, id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return float(rank), int(id)
+    except ValueError:
+        raise ValueError('Invalid cursor')
+
+
+# Words of the query, matched as whole terms by both backends
+def parse_query(query: str) -> list:
+    terms = re.findall(r'\w+', (query or '')[:MAX_QUERY_LENGTH])[:MAX_QUERY_TERMS]
+    if not terms:
+        raise ValueError('Invalid query')
+    return terms
+
+
+# SQL of the (post_id, term, rank) matches and of the number of terms a post must match, with their params
+def _backend_query(connection, terms: list) -> tuple:
+    if connection.vendor == 'postgresql':
+        return (POSTGRESQL_MATCHES.format(terms=POSTGRESQL_TERMS), [terms, terms],
+                POSTGRESQL_REQUIRED, [terms])
+    if connection.vendor == 'sqlite':
+        # Quoted, every term is a plain string to FTS5 instead of query syntax
+        matches = ' UNION ALL '.join(SQLITE_TERM_MATCHES.format(term=i) for i in range(len(terms)))
+        return matches, [f'"{term}"' for term in terms for _ in range(2)], '%s', [len(terms)]
+    raise NotImplementedError(f'Full-text search is not supported on {connection.vendor}')
+
+
+# One page of the ids of the posts matching every term, best match first, and the cursor of the next page
+def search_posts(query: str, cursor: str = None, limit: int = 20):
+    # Reads are routed like ORM reads of posts, to a replica inside requests
+    connection = connections[router.db_for_read(Post)]
+    matches, params, required, required_params = _backend_query(connection, parse_query(query))
+    params += required_params
+    if cursor:
+        rank, id = decode_rank_cursor(cursor)
+        params += [rank, rank, id]
+    params.append(limit + 1)
+    sql = PAGE.format(matches=matches, required=required, after=AFTER if cursor else '')
+
+    with connection.cursor() as db:
+        db.execute(sql, params)
+        rows = db.fetchall()
+    next_cursor = encode_rank_cursor(rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+    return [post_id for post_id, rank in rows[:limit]], next_cursor
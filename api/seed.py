@@ -0,0 +1,120 @@
+import bisect
+import itertools
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from .counters import reconcile_counters
+from .feed import BACKFILL_LIMIT
+from .models import Comment, Follow, Like, Post, TimelineEntry, User
+
+BATCH_SIZE = 2000
+# Longest comment thread on a single post
+MAX_THREAD_LENGTH = 2000
+
+
+# Picks indexes 0..n-1 with probability proportional to 1 / (rank + 1) ** alpha over a shuffled ranking,
+# the heavy-tailed popularity of followers and likes in real social graphs
+class ZipfSampler:
+    def __init__(self, n: int, alpha: float, rng: random.Random):
+        self.rng = rng
+        self.ranking = list(range(n))
+        rng.shuffle(self.ranking)
+        self.cumulative = list(itertools.accumulate(1 / (rank + 1) ** alpha for rank in range(n)))
+
+    def sample(self) -> int:
+        rank = bisect.bisect(self.cumulative, self.rng.random() * self.cumulative[-1])
+        return self.ranking[min(rank, len(self.ranking) - 1)]
+
+
+# Seed a synthetic social graph with bulk inserts: users, power-law follows, posts spread over the last
+# `days` days, likes concentrated on popular posts, heavy-tailed comment threads, the timelines the follows
+# would have backfilled and the denormalized counters. The same arguments always produce the same graph.
+# Returns the number of rows inserted per table.
+def seed_graph(users: int = 1000, posts: int = 10, follows: int = 20, likes: int = 100000, comments: float = 5,
+               alpha: float = 1.2, days: int = 30, seed: int = 0, log=None):
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    now = timezone.now()
+    counts = {}
+
+    # Users cannot log in, hashing a password per user would dominate the seeding time
+    log(f'Seeding {users} users')
+    first_id = (User.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+    _insert(User, (User(username=f'seed{first_id + i}', email=f'seed{first_id + i}@seed.com',
+                        password=make_password(None)) for i in range(users)))
+    user_ids = list(User.objects.filter(id__gte=first_id).order_by('id').values_list('id', flat=True))
+    counts['users'] = len(user_ids)
+
+    log('Seeding follows')
+    popular_users = ZipfSampler(len(user_ids), alpha, rng)
+
+    def follow_rows():
+        for user_id in user_ids:
+            followees = {user_ids[popular_users.sample()] for _ in range(rng.randint(1, 2 * follows))}
+            followees.discard(user_id)
+            for followee_id in followees:
+                yield Follow(from_user_id=user_id, to_user_id=followee_id)
+    _insert(Follow, follow_rows())
+    counts['follows'] = Follow.objects.filter(from_user__gte=first_id).count()
+
+    log('Seeding posts')
+    post_rows = (Post(user_id=user_id, title=f'Post {i} by {user_id}', desc=f'Synthetic post {i} of user {user_id}')
+                 for user_id in user_ids for i in range(rng.randint(0, 2 * posts)))
+    _insert(Post, post_rows)
+    # created_at is set on insert, spread it over the last `days` days afterwards
+    post_ids = list(Post.objects.filter(user__gte=first_id).order_by('id').values_list('id', flat=True))
+    counts['posts'] = len(post_ids)
+    for batch in _batches(post_ids):
+        Post.objects.bulk_update([Post(id=post_id, created_at=now - timedelta(seconds=rng.uniform(0, days * 86400)))
+                                  for post_id in batch], ['created_at'])
+
+    log('Seeding likes')
+    popular_posts = ZipfSampler(len(post_ids), alpha, rng)
+    like_rows = (Like(user_id=rng.choice(user_ids), post_id=post_ids[popular_posts.sample()]) for _ in range(likes))
+    _insert(Like, like_rows)
+    counts['likes'] = Like.objects.filter(post__user__gte=first_id).count()
+
+    log('Seeding comments')
+
+    def comment_rows():
+        for post_id in post_ids:
+            # Pareto thread lengths: most posts get a few comments, some get very long threads
+            length = min(int(rng.paretovariate(1.5) * comments / 3), MAX_THREAD_LENGTH)
+            for i in range(length):
+                yield Comment(user_id=rng.choice(user_ids), post_id=post_id, comment=f'Comment {i} on {post_id}')
+    _insert(Comment, comment_rows())
+    counts['comments'] = Comment.objects.filter(post__user__gte=first_id).count()
+
+    log('Seeding timelines')
+    latest = {}
+    for post_id, user_id, created_at in (Post.objects.filter(user__gte=first_id)
+                                         .order_by('user', '-created_at', '-id')
+                                         .values_list('id', 'user', 'created_at').iterator(chunk_size=BATCH_SIZE)):
+        author_posts = latest.setdefault(user_id, [])
+        if len(author_posts) < BACKFILL_LIMIT:
+            author_posts.append((post_id, created_at))
+    follow_pairs = Follow.objects.filter(from_user__gte=first_id).values_list('from_user', 'to_user')
+    timeline_rows = (TimelineEntry(user_id=follower_id, post_id=post_id, author_id=followee_id, created_at=created_at)
+                     for follower_id, followee_id in follow_pairs.iterator(chunk_size=BATCH_SIZE)
+                     for post_id, created_at in latest.get(followee_id, ()))
+    _insert(TimelineEntry, timeline_rows)
+    counts['timeline_entries'] = TimelineEntry.objects.filter(user__gte=first_id).count()
+
+    log('Reconciling counters')
+    reconcile_counters()
+    return counts
+
+
+def _batches(items, size: int = BATCH_SIZE):
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+# Insert rows in batches, skipping duplicates
+def _insert(model, rows):
+    for batch in _batches(rows):
+        model.objects.bulk_create(batch, ignore_conflicts=True)
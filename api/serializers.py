@@ -1,11 +1,22 @@
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 
-from .models import User, Post, Comment
+from .models import User, Post, Comment, TrendingPost
+from .db.router import primary_reads
+from .hashing import pooled_hashing
+from .tokens import IndexedRefreshToken
 
 
 # Added username in JWT token for easier access in frontend
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = IndexedRefreshToken
+
+    # The password is checked on the password hash pool, which raises PasswordHashPoolBusy when it is full.
+    # The user is read from the primary, so a password just changed there is the one checked.
+    def validate(self, attrs):
+        with pooled_hashing(), primary_reads():
+            return super().validate(attrs)
+
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
@@ -17,6 +28,11 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         return token
 
 
+# Refresh token rotation with blacklist checks answered by the revoked jti index
+class MyTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = IndexedRefreshToken
+
+
 # Register new user
 class CreateUserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -24,8 +40,10 @@ class CreateUserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'password']
         extra_kwargs = {'password': {'write_only': True, 'required': True}}
 
+    # The password is hashed on the password hash pool, which raises PasswordHashPoolBusy when it is full
     def create(self, validated_data):
-        user = User.objects.create_user(**validated_data)
+        with pooled_hashing():
+            user = User.objects.create_user(**validated_data)
         return user
 
 
@@ -40,10 +58,15 @@ class UserSerializer(serializers.ModelSerializer):
         extra_kwargs = {'following': {'read_only': True}, 'followers': {'read_only': True}}
 
     def get_following(self, obj):
-        return obj.following.count()
+        return obj.following_count
 
     def get_followers(self, obj):
-        return obj.followers.count()
+        return obj.followers_count
+
+
+# List of user or post ids for the batch follow and like endpoints
+class BatchIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=100)
 
 
 # Create and serialize new comment
@@ -71,19 +94,86 @@ class CommentSerializer(serializers.ModelSerializer):
         return obj.user.username
 
 
+POST_FIELDS = ['id', 'title', 'desc', 'created_at', 'comments', 'likes']
+COMMENT_MODES = ['full', 'none', 'count', 'preview']
+MAX_COMMENT_PREVIEW = 100
+
+
+# Read ?fields=id,title and ?comments=none|count|preview:N, raises ValueError on bad input.
+# preview is the number of comments to attach with attach_comment_preview, None when no preview is rendered.
+def parse_post_options(query_params):
+    fields = POST_FIELDS
+    if query_params.get('fields'):
+        fields = [field.strip() for field in query_params['fields'].split(',') if field.strip()]
+        if not fields or any(field not in POST_FIELDS for field in fields):
+            raise ValueError('Invalid fields')
+
+    comments, preview = query_params.get('comments') or 'full', None
+    if comments.startswith('preview:'):
+        comments, count = comments.split(':', 1)
+        if not count.isdigit() or not 0 < int(count) <= MAX_COMMENT_PREVIEW:
+            raise ValueError('Invalid comments option')
+        preview = int(count) if 'comments' in fields else None
+    elif comments not in COMMENT_MODES or comments == 'preview':
+        raise ValueError('Invalid comments option')
+    return fields, comments, preview
+
+
 # Get formatted post with comments
+# Posts passed through attach_comment_preview() carry only the latest comments and a comment count
 class PostSerializer(serializers.ModelSerializer):
     likes = serializers.SerializerMethodField()
     comments = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
-        fields = ['id', 'title', 'desc', 'created_at', 'comments', 'likes']
+        fields = POST_FIELDS
         extra_kwargs = {'user': {'read_only': True}, 'created_at': {'read_only': True}}
 
+    # fields limits the output to a subset of POST_FIELDS, comments is one of COMMENT_MODES
+    def __init__(self, *args, fields=None, comments='full', **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        self.include_comments_count = 'comments' in self.fields and comments in ('count', 'preview')
+        if comments in ('none', 'count'):
+            self.fields.pop('comments', None)
+
     def get_likes(self, obj):
-        return obj.likes.count()
+        return obj.likes_count
 
     def get_comments(self, obj):
+        if hasattr(obj, 'latest_comments'):
+            return CommentSerializer(obj.latest_comments, many=True).data
         comments = obj.comments.all()
         return CommentSerializer(comments, many=True).data
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if self.include_comments_count or hasattr(instance, 'latest_comments'):
+            data['comments_count'] = instance.comments_count
+        return data
+
+
+# Get formatted post with its author for the home feed
+class FeedPostSerializer(PostSerializer):
+    user = serializers.SerializerMethodField()
+
+    class Meta(PostSerializer.Meta):
+        fields = ['id', 'user', 'title', 'desc', 'created_at', 'comments', 'likes']
+
+    def get_user(self, obj):
+        return obj.user.username
+
+
+# Get a trending post with its score and the likes and comments it gathered in the trending window
+class TrendingPostSerializer(serializers.ModelSerializer):
+    post = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TrendingPost
+        fields = ['rank', 'score', 'likes', 'comments', 'post']
+
+    def get_post(self, obj):
+        return FeedPostSerializer(obj.post, comments='count').data
@@ -0,0 +1,54 @@
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import invalidate_posts, invalidate_users
+from .counters import decrement
+from .db.stats import connection_stats
+from .models import Comment, Follow, Post, User
+
+
+# Drop the cached user whenever the row is saved or deleted outside the follow views
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_users([instance.pk])
+
+
+# Deleting a user cascades to their follows, likes and comments. Take them off the counters of the other
+# users and posts first, in the delete's transaction: Django sends pre_delete inside it, for admin, shell
+# and queryset deletes alike.
+@receiver(pre_delete, sender=User)
+def release_counters(sender, instance, **kwargs):
+    followed = list(Follow.objects.filter(from_user=instance.pk).values_list('to_user_id', flat=True))
+    followers = list(Follow.objects.filter(to_user=instance.pk).values_list('from_user_id', flat=True))
+    User.objects.filter(id__in=followed).update(followers_count=decrement('followers_count'))
+    User.objects.filter(id__in=followers).update(following_count=decrement('following_count'))
+
+    # The user's own posts go with them
+    others = Post.objects.exclude(user=instance.pk)
+    liked = list(others.filter(likes=instance.pk).values_list('id', flat=True))
+    others.filter(id__in=liked).update(likes_count=decrement('likes_count'), activity_at=timezone.now())
+    commented = list(others.filter(comments__user=instance.pk).distinct().values_list('id', flat=True))
+    comments = Subquery(Comment.objects.filter(user=instance.pk, post=OuterRef('pk')).order_by()
+                        .values('post').annotate(count=Count('*')).values('count'))
+    others.filter(id__in=commented).update(comments_count=decrement('comments_count', comments),
+                                           activity_at=timezone.now())
+
+    invalidate_users([*followed, *followers])
+    invalidate_posts([*liked, *commented])
+
+
+# Mark the thread's connections active for the duration of the request. Runs after Django's own
+# close_old_connections, so a connection still open here is reused by the request.
+@receiver(request_started)
+def track_request_started(sender, **kwargs):
+    connection_stats.request_started(connections.all(initialized_only=True))
+
+
+@receiver(request_finished)
+def track_request_finished(sender, **kwargs):
+    connection_stats.request_finished()
@@ -0,0 +1,172 @@
+import gzip
+import mimetypes
+import os
+import threading
+from typing import NamedTuple
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+# Files smaller than this are not worth a compressed variant
+MIN_COMPRESS_SIZE = 256
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Unhashed names can change in place on the next deploy, clients revalidate them
+REVALIDATE_CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+
+
+def compressible(name: str) -> bool:
+    content_type, encoding = mimetypes.guess_type(name)
+    return encoding is None and content_type is not None and content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+# collectstatic stores every file twice, under its own name and under a content hashed name, then writes a
+# gzip variant (name + '.gz') next to each compressible file when it comes out smaller
+class PrecompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # Templates still render before collectstatic has run, with the unhashed names
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if compressible(name) and self.exists(name):
+                compressed = self.compress(name)
+                if compressed:
+                    yield name, compressed, True
+
+    def compress(self, name: str):
+        with self.open(name) as file:
+            content = file.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return None
+        # mtime=0 keeps the output identical across runs
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(compressed) >= len(content):
+            return None
+        path = self.path(name + '.gz')
+        with open(path, 'wb') as file:
+            file.write(compressed)
+        return name + '.gz'
+
+
+class StaticFile(NamedTuple):
+    path: str
+    content_type: str
+    encoding: str
+    etag: str
+    last_modified: str
+    mtime: int
+    cache_control: str
+    gzip_path: str
+
+
+# Process-local index of the files under STATIC_ROOT, built by a single walk on the first static request.
+# Lookups never stat the filesystem, a path missing from the index is a 404 without any disk access.
+# collectstatic runs at deploy time and the workers restart after it, a running process never needs to rescan.
+class StaticFileIndex:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._files = None
+
+    def get(self, name: str):
+        if self._files is None:
+            with self._lock:
+                if self._files is None:
+                    self._files = self.scan(settings.STATIC_ROOT)
+        return self._files.get(name)
+
+    def scan(self, root) -> dict:
+        hashed_names = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        manifest_name = getattr(staticfiles_storage, 'manifest_name', None)
+        stats = {}
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                stats[name] = (path, os.stat(path))
+
+        files = {}
+        for name, (path, stat) in stats.items():
+            if name == manifest_name or (name.endswith('.gz') and name[:-3] in stats):
+                continue
+            content_type, encoding = mimetypes.guess_type(name)
+            gzip_path, _ = stats.get(name + '.gz', (None, None))
+            files[name] = StaticFile(
+                path=path,
+                content_type=content_type or 'application/octet-stream',
+                encoding=encoding,
+                etag=f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+                last_modified=http_date(stat.st_mtime),
+                mtime=int(stat.st_mtime),
+                cache_control=IMMUTABLE_CACHE_CONTROL if name in hashed_names else REVALIDATE_CACHE_CONTROL,
+                gzip_path=gzip_path,
+            )
+        return files
+
+
+static_files = StaticFileIndex()
+
+
+def accepts_gzip(request) -> bool:
+    for coding in request.headers.get('Accept-Encoding', '').split(','):
+        name, *params = [part.strip() for part in coding.split(';')]
+        if name.lower() in ('gzip', '*'):
+            quality = next((param[2:] for param in params if param.lower().startswith('q=')), '1')
+            try:
+                return float(quality) > 0
+            except ValueError:
+                return False
+    return False
+
+
+def not_modified(request, etag: str, mtime: int) -> bool:
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or \
+            etag in (candidate.strip().removeprefix('W/') for candidate in if_none_match.split(','))
+    modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return modified_since is not None and mtime <= modified_since
+
+
+# Serves STATIC_ROOT from the in-memory index: the precompressed variant when the client accepts gzip,
+# validators for conditional requests and a year long immutable lifetime for content hashed names
+@require_safe
+def serve(request, path):
+    file = static_files.get(path)
+    if file is None:
+        raise Http404(f'"{path}" does not exist')
+
+    headers = {'Last-Modified': file.last_modified, 'Cache-Control': file.cache_control}
+    if file.gzip_path:
+        headers['Vary'] = 'Accept-Encoding'
+    if file.gzip_path and accepts_gzip(request):
+        # Each representation needs its own validator
+        path, headers['ETag'], headers['Content-Encoding'] = file.gzip_path, file.etag[:-1] + '-gzip"', 'gzip'
+    else:
+        path, headers['ETag'] = file.path, file.etag
+        if file.encoding:
+            headers['Content-Encoding'] = file.encoding
+
+    if not_modified(request, headers['ETag'], file.mtime):
+        headers.pop('Content-Encoding', None)
+        return HttpResponseNotModified(headers=headers)
+    response = FileResponse(open(path, 'rb'), content_type=file.content_type, headers=headers)
+    # Assets are displayed, not downloaded under the name of the file on disk
+    del response['Content-Disposition']
+    return response
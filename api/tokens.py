@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import aware_utcnow, datetime_from_epoch
+
+# Blacklist rows can commit out of id order, so each sync rereads rows newer than the highest id
+# seen at least this many seconds ago (every unexpired row during the first SYNC_OVERLAP seconds)
+SYNC_OVERLAP = 10
+PRUNE_INTERVAL = 60
+
+
+# Process-local copy of the revoked refresh token jtis. Tokens revoked by this process are known
+# immediately, revocations by other processes are picked up by an incremental primary key range
+# read at most every REVOKED_JTI_SYNC_INTERVAL seconds, so most refresh checks skip the database.
+class RevokedJtiIndex:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._revoked = {}
+        self._checkpoints = deque()
+        self._max_id = 0
+        self._synced_at = None
+        self._pruned_at = time.monotonic()
+
+    def add(self, jti: str, expires_at):
+        self._revoked[jti] = expires_at
+
+    def contains(self, jti: str) -> bool:
+        if jti in self._revoked:
+            return True
+        self.sync()
+        return jti in self._revoked
+
+    def sync(self, force: bool = False):
+        now = time.monotonic()
+        if not force and self._synced_at is not None and now - self._synced_at < settings.REVOKED_JTI_SYNC_INTERVAL:
+            return
+
+        with self._lock:
+            # Highest id that was already seen SYNC_OVERLAP seconds ago
+            while len(self._checkpoints) > 1 and now - self._checkpoints[1][0] >= SYNC_OVERLAP:
+                self._checkpoints.popleft()
+            watermark = self._checkpoints[0][1] if self._checkpoints and now - self._checkpoints[0][0] >= SYNC_OVERLAP else 0
+
+            rows = (BlacklistedToken.objects.filter(id__gt=watermark, token__expires_at__gt=aware_utcnow())
+                    .values_list('id', 'token__jti', 'token__expires_at'))
+            for id, jti, expires_at in rows.iterator():
+                self._revoked[jti] = expires_at
+                self._max_id = max(self._max_id, id)
+
+            self._checkpoints.append((now, self._max_id))
+            self._synced_at = now
+            if now - self._pruned_at >= PRUNE_INTERVAL:
+                self.prune()
+
+    # Expired tokens fail verification on their own, they no longer need to be remembered
+    def prune(self):
+        current = aware_utcnow()
+        for jti, expires_at in list(self._revoked.items()):
+            if expires_at <= current:
+                self._revoked.pop(jti, None)
+        self._pruned_at = time.monotonic()
+
+
+revoked_jtis = RevokedJtiIndex()
+
+
+# Refresh token whose blacklist check goes through the revoked jti index
+class IndexedRefreshToken(RefreshToken):
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+
+        if revoked_jtis.contains(jti):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        result = super().blacklist()
+        revoked_jtis.add(self.payload[api_settings.JTI_CLAIM], datetime_from_epoch(self.payload['exp']))
+        return result
@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import PostActivity, TrendingPost
+
+BUCKET = timedelta(hours=1)
+# A comment is a stronger signal than a like
+COMMENT_WEIGHT = 2
+DELETE_CHUNK_SIZE = 5000
+
+
+def bucket_start(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+# Add like and comment events of the current hour to the activity buckets of the given posts. One upsert
+# statement for any number of posts: concurrent events on the same post add up instead of racing.
+def record_activity(post_ids, likes: int = 0, comments: int = 0):
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    connection = connections[router.db_for_write(PostActivity)]
+    bucket = connection.ops.adapt_datetimefield_value(bucket_start(timezone.now()))
+    table = connection.ops.quote_name(PostActivity._meta.db_table)
+    rows = ', '.join(['(%s, %s, %s, %s)'] * len(post_ids))
+    params = [value for post_id in post_ids for value in (post_id, bucket, likes, comments)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (post_id, bucket, likes, comments) VALUES {rows} '
+            f'ON CONFLICT (post_id, bucket) DO UPDATE SET likes = {table}.likes + excluded.likes, '
+            f'comments = {table}.comments + excluded.comments',
+            params,
+        )
+
+
+# Fold the buckets of the last `window_hours` hours into the top `size` posts and drop the buckets that
+# left the window. Reads only the window's buckets, never the like or comment tables, and swaps the
+# TrendingPost rows in one transaction so readers see the old or the new ranking, never a mix.
+# Returns the number of ranked posts and of deleted buckets.
+def compact_trending(window_hours: int = None, size: int = None):
+    window_hours = window_hours or settings.TRENDING_WINDOW_HOURS
+    size = size or settings.TRENDING_SIZE
+    now = timezone.now()
+    start = bucket_start(now) - BUCKET * (window_hours - 1)
+
+    scores = (PostActivity.objects.filter(bucket__gte=start).values('post')
+              .annotate(likes_sum=Sum('likes'), comments_sum=Sum('comments'))
+              .annotate(score=F('likes_sum') + COMMENT_WEIGHT * F('comments_sum'))
+              .filter(score__gt=0).order_by('-score', '-post')[:size])
+    trending = [TrendingPost(rank=rank, post_id=row['post'], score=row['score'], likes=row['likes_sum'],
+                             comments=row['comments_sum'], computed_at=now)
+                for rank, row in enumerate(scores, start=1)]
+    with transaction.atomic():
+        TrendingPost.objects.all().delete()
+        TrendingPost.objects.bulk_create(trending)
+
+    deleted = 0
+    while True:
+        ids = list(PostActivity.objects.filter(bucket__lt=start).values_list('id', flat=True)[:DELETE_CHUNK_SIZE])
+        if not ids:
+            break
+        deleted += PostActivity.objects.filter(id__in=ids).delete()[0]
+    return len(trending), deleted
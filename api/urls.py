@@ -1,33 +1,61 @@
 from django.urls import path
-from rest_framework_simplejwt.views import TokenRefreshView
 
+from . import async_views
 from .views import (
     MyTokenObtainPairView,
+    MyTokenRefreshView,
     register,
     follow_user,
     unfollow_user,
+    follow_users,
+    unfollow_users,
     get_user,
     create_post,
     get_or_delete_post,
+    get_post_comments,
     like_post,
     unlike_post,
+    like_posts,
+    unlike_posts,
     comment_post,
     get_posts,
+    export_posts,
+    get_feed,
+    search,
+    get_trending,
+    get_post_cache_stats,
+    get_db_stats,
 )
 
 urlpatterns = [
     path('authenticate/', MyTokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/refresh/', MyTokenRefreshView.as_view(), name='token_refresh'),
     path('register/', register, name='register'),
+    path('follow/batch/', follow_users, name='follow_users'),
     path('follow/<int:id>/', follow_user, name='follow_user'),
     path('follow/', follow_user, name='follow_user'),
+    path('unfollow/batch/', unfollow_users, name='unfollow_users'),
     path('unfollow/<int:id>/', unfollow_user, name='unfollow_user'),
     path('unfollow/', unfollow_user, name='unfollow_user'),
     path('user/', get_user, name='get_user'),
     path('posts/', create_post, name='create_post'),
     path('posts/<int:id>/', get_or_delete_post, name='get_or_delete_post'),
+    path('posts/<int:id>/comments/', get_post_comments, name='get_post_comments'),
+    path('like/batch/', like_posts, name='like_posts'),
     path('like/<int:id>/', like_post, name='like_post'),
+    path('unlike/batch/', unlike_posts, name='unlike_posts'),
     path('unlike/<int:id>/', unlike_post, name='unlike_post'),
     path('comment/<int:id>/', comment_post, name='comment_post'),
     path('all_posts/', get_posts, name='get_posts'),
+    path('export/', export_posts, name='export_posts'),
+    path('feed/', get_feed, name='get_feed'),
+    path('search/', search, name='search'),
+    path('trending/', get_trending, name='get_trending'),
+    path('cache/stats/', get_post_cache_stats, name='get_post_cache_stats'),
+    path('db/stats/', get_db_stats, name='get_db_stats'),
+
+    # Async versions of the read endpoints, served natively under ASGI
+    path('async/user/', async_views.get_user, name='async_get_user'),
+    path('async/all_posts/', async_views.get_posts, name='async_get_posts'),
+    path('async/posts/<int:id>/', async_views.get_or_delete_post, name='async_get_or_delete_post'),
 ]
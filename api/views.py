@@ -1,25 +1,83 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.gzip import gzip_page
 from rest_framework.response import Response
 from rest_framework.request import Request
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 
 from .serializers import (
     MyTokenObtainPairSerializer,
+    MyTokenRefreshSerializer,
     CreateUserSerializer,
     UserSerializer,
     PostSerializer,
     CreateCommentSerializer,
+    FeedPostSerializer,
+    TrendingPostSerializer,
+    BatchIdsSerializer,
+    CommentSerializer,
+    parse_post_options,
 )
 
-from .models import User, Post
+from .authentication import CachedJWTAuthentication
+from .cache import get_cached_post, set_cached_post, invalidate_post, invalidate_posts, invalidate_users, post_cache_stats
+from .counters import decrement
+from .conditional import conditional, user_validators, post_validators, posts_validators
+from .db.insert import insert_missing_pairs
+from .db.stats import connection_stats
+from .export import export_user
+from .feed import fan_out_post, backfill_timeline, trim_timeline
+from .hashing import PasswordHashPoolBusy
+from .models import User, Post, Comment, TimelineEntry, Follow, Like, TrendingPost, attach_comment_preview
+from .pagination import keyset_page, parse_page_size
+from .search import search_posts
+from .trending import record_activity
+
+LIMIT_PARAMETER = openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description='Page size')
+PAGE_PARAMETERS = [
+    LIMIT_PARAMETER,
+    openapi.Parameter('cursor', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='Cursor from a previous page'),
+]
+SEARCH_PARAMETER = openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True,
+                                     description='Words to search for, each must appear in the post or '
+                                                 'in one of its comments')
+# Latest comments returned with each search result
+SEARCH_COMMENT_PREVIEW = 3
+POST_SHAPE_PARAMETERS = [
+    openapi.Parameter('fields', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                      description='Comma separated post fields to return'),
+    openapi.Parameter('comments', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                      description='full, none, count or preview:N'),
+]
+
+
+# Back-pressure answer when the password hash pool has no free slot
+def password_hash_busy():
+    return Response({'message': 'Server busy, try again later'}, status=503, headers={'Retry-After': '1'})
 
 
 # Added custom JWT token
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
 
+    def post(self, request, *args, **kwargs):
+        try:
+            return super().post(request, *args, **kwargs)
+        except PasswordHashPoolBusy:
+            return password_hash_busy()
+
+
+# Refresh tokens checked against the in-memory revoked jti index
+class MyTokenRefreshView(TokenRefreshView):
+    serializer_class = MyTokenRefreshSerializer
+
 
 # Register new user
 @swagger_auto_schema(method='post', request_body=CreateUserSerializer)
@@ -27,7 +85,10 @@ class MyTokenObtainPairView(TokenObtainPairView):
 def register(request):
     serializer = CreateUserSerializer(data=request.data)
     if serializer.is_valid():
-        serializer.save()
+        try:
+            serializer.save()
+        except PasswordHashPoolBusy:
+            return password_hash_busy()
         return Response(serializer.data)
     return Response(serializer.errors)
 
@@ -39,20 +100,24 @@ def follow_user(request: Request, id: int = None):
     if id is None:
         return Response({'message': 'User id is required'}, status=400)
     user = request.user
-    user_to_follow = User.objects.filter(id=id)
+    username = User.objects.filter(id=id).values_list('username', flat=True).first()
 
-    if not user_to_follow.exists():
+    if username is None:
         return Response({'message': 'User not found'}, status=404)
-
-    user_to_follow = user_to_follow.first()
-    if user_to_follow == user:
+    if id == user.id:
         return Response({'message': 'You cannot follow yourself'}, status=400)
-    if user_to_follow in user.following.all():
-        return Response({'message': 'You are already following this user'}, status=400)
 
-    user.following.add(user_to_follow)
-    user.save()
-    return Response({"message": f'User {user_to_follow.username} followed successfully'})
+    # The unique (from_user, to_user) constraint rejects duplicates, no need to load existing follows
+    try:
+        with transaction.atomic():
+            Follow.objects.create(from_user_id=user.id, to_user_id=id)
+            User.objects.filter(id=user.id).update(following_count=F('following_count') + 1)
+            User.objects.filter(id=id).update(followers_count=F('followers_count') + 1)
+            backfill_timeline(user.id, [id])
+    except IntegrityError:
+        return Response({'message': 'You are already following this user'}, status=400)
+    invalidate_users([user.id, id])
+    return Response({"message": f'User {username} followed successfully'})
 
 
 # Unfollow user
@@ -62,25 +127,97 @@ def unfollow_user(request: Request, id: int = None):
     if id is None:
         return Response({'message': 'User id is required'}, status=400)
     user = request.user
-    user_to_unfollow = User.objects.filter(id=id)
+    username = User.objects.filter(id=id).values_list('username', flat=True).first()
 
-    if not user_to_unfollow.exists():
+    if username is None:
         return Response({'message': 'User not found'}, status=404)
-
-    user_to_unfollow = user_to_unfollow.first()
-    if user_to_unfollow == user:
+    if id == user.id:
         return Response({'message': 'You cannot unfollow yourself'}, status=400)
-    if user_to_unfollow not in user.following.all():
-        return Response({'message': 'You are not following this user'}, status=400)
 
-    user.following.remove(user_to_unfollow)
-    user.save()
-    return Response({"message": f'User {user_to_unfollow.username} unfollowed successfully'})
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(from_user_id=user.id, to_user_id=id).delete()
+        if not deleted:
+            return Response({'message': 'You are not following this user'}, status=400)
+        User.objects.filter(id=user.id).update(following_count=decrement('following_count'))
+        User.objects.filter(id=id).update(followers_count=decrement('followers_count'))
+        trim_timeline(user.id, [id])
+    invalidate_users([user.id, id])
+    return Response({"message": f'User {username} unfollowed successfully'})
+
+
+# Follow several users at once, returns a result per id
+@swagger_auto_schema(method='post', request_body=BatchIdsSerializer)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def follow_users(request: Request):
+    serializer = BatchIdsSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({"message": "Follow failed", "errors": serializer.errors}, status=400)
+    user = request.user
+    ids = set(serializer.validated_data['ids'])
+
+    existing = set(User.objects.filter(id__in=ids).values_list('id', flat=True))
+    with transaction.atomic():
+        # Counters only move for the follows this request inserted, not ones a concurrent request added
+        followed = insert_missing_pairs(Follow, 'from_user', user.id, 'to_user', existing - {user.id})
+        User.objects.filter(id=user.id).update(following_count=F('following_count') + len(followed))
+        User.objects.filter(id__in=followed).update(followers_count=F('followers_count') + 1)
+        backfill_timeline(user.id, followed)
+    invalidate_users([user.id, *followed])
+
+    results = {}
+    for id in ids:
+        if id not in existing:
+            results[id] = 'not_found'
+        elif id == user.id:
+            results[id] = 'self'
+        elif id in followed:
+            results[id] = 'followed'
+        else:
+            results[id] = 'already_following'
+    return Response({'results': results})
+
+
+# Unfollow several users at once, returns a result per id
+@swagger_auto_schema(method='post', request_body=BatchIdsSerializer)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def unfollow_users(request: Request):
+    serializer = BatchIdsSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({"message": "Unfollow failed", "errors": serializer.errors}, status=400)
+    user = request.user
+    ids = set(serializer.validated_data['ids'])
+
+    existing = set(User.objects.filter(id__in=ids).values_list('id', flat=True))
+    with transaction.atomic():
+        follows = Follow.objects.filter(from_user_id=user.id, to_user_id__in=existing)
+        to_unfollow = set(follows.select_for_update().values_list('to_user_id', flat=True))
+        follows.delete()
+        User.objects.filter(id=user.id).update(following_count=decrement('following_count', len(to_unfollow)))
+        User.objects.filter(id__in=to_unfollow).update(followers_count=decrement('followers_count'))
+        trim_timeline(user.id, to_unfollow)
+    invalidate_users([user.id, *to_unfollow])
+
+    results = {}
+    for id in ids:
+        if id not in existing:
+            results[id] = 'not_found'
+        elif id == user.id:
+            results[id] = 'self'
+        elif id in to_unfollow:
+            results[id] = 'unfollowed'
+        else:
+            results[id] = 'not_following'
+    return Response({'results': results})
 
 
 # Get current user profile
+@gzip_page
 @api_view(['GET'])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
+@conditional(user_validators)
 def get_user(request: Request):
     user = request.user
     serializer = UserSerializer(user, many=False)
@@ -95,58 +232,106 @@ def create_post(request: Request):
     serializer = PostSerializer(data=request.data)
 
     if serializer.is_valid():
-        serializer.save(user=user)
+        with transaction.atomic():
+            post = serializer.save(user_id=user.id)
+            fan_out_post(post)
         return Response(serializer.data, status=201)
     return Response({"message": "Create Post failed", "errors": serializer.errors}, status=400)
 
 
 # Get or delete a post
+@gzip_page
+@swagger_auto_schema(method='get', manual_parameters=POST_SHAPE_PARAMETERS)
 @api_view(['GET', 'DELETE'])
 @permission_classes([IsAuthenticated])
+@conditional(post_validators)
 def get_or_delete_post(request: Request, id: int = None):
-    post = Post.objects.filter(id=id)
-    if not post.exists():
+    # Only the default full shape is cached
+    shaped = 'fields' in request.query_params or 'comments' in request.query_params
+    if request.method == 'GET' and not shaped:
+        data = get_cached_post(id)
+        if data is not None:
+            return Response(data)
+
+    posts = Post.objects.filter(id=id)
+    if request.method == 'GET':
+        try:
+            fields, comments, preview = parse_post_options(request.query_params)
+        except ValueError as e:
+            return Response({'message': str(e)}, status=400)
+        posts = posts.for_fields(fields, comments)
+
+    post = posts.first()
+    if post is None:
         return Response({'message': 'Post not found'}, status=404)
-    post = post.first()
 
     if request.method == 'GET':
-        serializer = PostSerializer(post, many=False)
+        if preview:
+            attach_comment_preview([post], preview)
+        serializer = PostSerializer(post, many=False, fields=fields, comments=comments)
         # serializer_data = {
         #     "id": serializer.data['id'],
         #     "likes": serializer.data['likes'],
         #     "comments": len(serializer.data['comments']),
         # }
 
+        if not shaped:
+            set_cached_post(post.id, serializer.data)
         return Response(serializer.data)
     elif request.method == 'DELETE':
         user = request.user
-        if post.user != user:
+        if post.user_id != user.id:
             return Response({'message': 'You cannot delete this post'}, status=403)
 
         post_id = post.id
         post.delete()
+        invalidate_post(post_id)
         return Response({"message": f'Post {post_id} deleted'})
 
 
+# Get the comments of a post, oldest first, a page at a time
+@swagger_auto_schema(method='get', manual_parameters=PAGE_PARAMETERS)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_post_comments(request: Request, id: int):
+    if not Post.objects.filter(id=id).exists():
+        return Response({'message': 'Post not found'}, status=404)
+
+    # Authors are joined in, so usernames for the whole page come from the same query
+    comments = Comment.objects.filter(post=id).select_related('user').only(
+        'id', 'comment', 'created_at', 'user__username')
+    try:
+        limit = parse_page_size(request.query_params.get('limit'))
+        comments, next_cursor = keyset_page(comments, request.query_params.get('cursor'), limit)
+    except ValueError as e:
+        return Response({'message': str(e)}, status=400)
+
+    serializer = CommentSerializer(comments, many=True)
+    return Response({'results': serializer.data, 'next': next_cursor})
+
+
 # Like a post
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def like_post(request: Request, id: int):
     user = request.user
-    post = Post.objects.filter(id=id)
+    author_id = Post.objects.filter(id=id).values_list('user_id', flat=True).first()
 
-    if not post.exists():
+    if author_id is None:
         return Response({'message': 'Post not found'}, status=404)
-
-    post = post.first()
-    if post.user == user:
+    if author_id == user.id:
         return Response({'message': 'You cannot like your own post'}, status=400)
-    if post in user.liked_posts.all():
-        return Response({'message': 'You have already liked this post'}, status=400)
 
-    user.liked_posts.add(post)
-    user.save()
-    return Response({"message": f'Post {post.id} liked'})
+    # The unique (post, user) constraint rejects duplicates, no need to load existing likes
+    try:
+        with transaction.atomic():
+            Like.objects.create(post_id=id, user_id=user.id)
+            Post.objects.filter(id=id).update(likes_count=F('likes_count') + 1, activity_at=timezone.now())
+            record_activity([id], likes=1)
+    except IntegrityError:
+        return Response({'message': 'You have already liked this post'}, status=400)
+    invalidate_post(id)
+    return Response({"message": f'Post {id} liked'})
 
 
 # Unlike a post
@@ -154,20 +339,88 @@ def like_post(request: Request, id: int):
 @permission_classes([IsAuthenticated])
 def unlike_post(request: Request, id: int):
     user = request.user
-    post = Post.objects.filter(id=id)
+    author_id = Post.objects.filter(id=id).values_list('user_id', flat=True).first()
 
-    if not post.exists():
+    if author_id is None:
         return Response({'message': 'Post not found'}, status=404)
-
-    post = post.first()
-    if post.user == user:
+    if author_id == user.id:
         return Response({'message': 'You cannot unlike your own post'}, status=400)
-    if post not in user.liked_posts.all():
-        return Response({'message': 'You have not liked this post'}, status=400)
 
-    user.liked_posts.remove(post)
-    user.save()
-    return Response({"message": f'Post {post.id} unliked'})
+    with transaction.atomic():
+        deleted, _ = Like.objects.filter(post_id=id, user_id=user.id).delete()
+        if not deleted:
+            return Response({'message': 'You have not liked this post'}, status=400)
+        Post.objects.filter(id=id).update(likes_count=decrement('likes_count'), activity_at=timezone.now())
+        record_activity([id], likes=-1)
+    invalidate_post(id)
+    return Response({"message": f'Post {id} unliked'})
+
+
+# Like several posts at once, returns a result per id
+@swagger_auto_schema(method='post', request_body=BatchIdsSerializer)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def like_posts(request: Request):
+    serializer = BatchIdsSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({"message": "Like failed", "errors": serializer.errors}, status=400)
+    user = request.user
+    ids = set(serializer.validated_data['ids'])
+
+    authors = dict(Post.objects.filter(id__in=ids).values_list('id', 'user_id'))
+    own = {id for id, author_id in authors.items() if author_id == user.id}
+
+    with transaction.atomic():
+        # Counters only move for the likes this request inserted, not ones a concurrent request added
+        liked = insert_missing_pairs(Like, 'user', user.id, 'post', set(authors) - own)
+        Post.objects.filter(id__in=liked).update(likes_count=F('likes_count') + 1, activity_at=timezone.now())
+        record_activity(liked, likes=1)
+    invalidate_posts(liked)
+
+    results = {}
+    for id in ids:
+        if id not in authors:
+            results[id] = 'not_found'
+        elif id in own:
+            results[id] = 'own_post'
+        elif id in liked:
+            results[id] = 'liked'
+        else:
+            results[id] = 'already_liked'
+    return Response({'results': results})
+
+
+# Unlike several posts at once, returns a result per id
+@swagger_auto_schema(method='post', request_body=BatchIdsSerializer)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def unlike_posts(request: Request):
+    serializer = BatchIdsSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({"message": "Unlike failed", "errors": serializer.errors}, status=400)
+    user = request.user
+    ids = set(serializer.validated_data['ids'])
+
+    authors = dict(Post.objects.filter(id__in=ids).values_list('id', 'user_id'))
+    with transaction.atomic():
+        likes = Like.objects.filter(user_id=user.id, post_id__in=authors)
+        to_unlike = set(likes.select_for_update().values_list('post_id', flat=True))
+        likes.delete()
+        Post.objects.filter(id__in=to_unlike).update(likes_count=decrement('likes_count'), activity_at=timezone.now())
+        record_activity(to_unlike, likes=-1)
+    invalidate_posts(to_unlike)
+
+    results = {}
+    for id in ids:
+        if id not in authors:
+            results[id] = 'not_found'
+        elif authors[id] == user.id:
+            results[id] = 'own_post'
+        elif id in to_unlike:
+            results[id] = 'unliked'
+        else:
+            results[id] = 'not_liked'
+    return Response({'results': results})
 
 
 # Comment on a post
@@ -184,16 +437,121 @@ def comment_post(request: Request, id: int):
     serializer = CreateCommentSerializer(data=request.data)
 
     if serializer.is_valid():
-        comment = serializer.save(user=user, post=post)
+        with transaction.atomic():
+            comment = serializer.save(user_id=user.id, post=post)
+            Post.objects.filter(id=post.id).update(comments_count=F('comments_count') + 1, activity_at=timezone.now())
+            record_activity([post.id], comments=1)
+        invalidate_post(post.id)
         return Response({"cid": comment.id}, status=201)
     return Response({"message": "Comment creation failed", "errors": serializer.errors}, status=400)
 
 
 # Get all posts by current user
+# Passing limit or cursor switches to keyset pagination, otherwise the full list is returned
+@gzip_page
+@swagger_auto_schema(method='get', manual_parameters=PAGE_PARAMETERS + POST_SHAPE_PARAMETERS)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional(posts_validators)
 def get_posts(request: Request):
     user = request.user
-    posts = Post.objects.filter(user=user)
-    serializer = PostSerializer(posts, many=True)
+    try:
+        fields, comments, preview = parse_post_options(request.query_params)
+    except ValueError as e:
+        return Response({'message': str(e)}, status=400)
+    posts = Post.objects.filter(user=user.id).for_fields(fields, comments)
+
+    if 'limit' in request.query_params or 'cursor' in request.query_params:
+        try:
+            limit = parse_page_size(request.query_params.get('limit'))
+            posts, next_cursor = keyset_page(posts, request.query_params.get('cursor'), limit)
+        except ValueError as e:
+            return Response({'message': str(e)}, status=400)
+        if preview:
+            attach_comment_preview(posts, preview)
+        serializer = PostSerializer(posts, many=True, fields=fields, comments=comments)
+        return Response({'results': serializer.data, 'next': next_cursor})
+
+    posts = posts.order_by('id')
+    if preview:
+        posts = attach_comment_preview(posts, preview)
+    serializer = PostSerializer(posts, many=True, fields=fields, comments=comments)
     return Response(serializer.data)
+
+
+# Stream every post of the current user with its comments as newline delimited JSON
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_posts(request: Request):
+    response = StreamingHttpResponse(export_user(request.user.id), content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="posts.ndjson"'
+    return response
+
+
+# Get the home feed of posts by followed users, newest first
+@swagger_auto_schema(method='get', manual_parameters=PAGE_PARAMETERS)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_feed(request: Request):
+    user = request.user
+    entries = TimelineEntry.objects.filter(user=user.id).only('id', 'post_id', 'created_at')
+
+    try:
+        limit = parse_page_size(request.query_params.get('limit'))
+        entries, next_cursor = keyset_page(entries, request.query_params.get('cursor'), limit, descending=True)
+    except ValueError as e:
+        return Response({'message': str(e)}, status=400)
+
+    posts = Post.objects.with_details().select_related('user').in_bulk([entry.post_id for entry in entries])
+    # A post deleted since the timeline was read is skipped
+    serializer = FeedPostSerializer([posts[entry.post_id] for entry in entries if entry.post_id in posts], many=True)
+    return Response({'results': serializer.data, 'next': next_cursor})
+
+
+# Search post titles, descriptions and comments, best match first, a page at a time
+# Every word of q must appear in the post's title or description or in any of its comments
+@swagger_auto_schema(method='get', manual_parameters=[SEARCH_PARAMETER] + PAGE_PARAMETERS)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search(request: Request):
+    try:
+        limit = parse_page_size(request.query_params.get('limit'))
+        ids, next_cursor = search_posts(request.query_params.get('q'), request.query_params.get('cursor'), limit)
+    except ValueError as e:
+        return Response({'message': str(e)}, status=400)
+
+    posts = Post.objects.select_related('user').in_bulk(ids)
+    attach_comment_preview(posts.values(), SEARCH_COMMENT_PREVIEW)
+    serializer = FeedPostSerializer([posts[id] for id in ids if id in posts], many=True)
+    return Response({'results': serializer.data, 'next': next_cursor})
+
+
+# Most liked and commented posts of the last TRENDING_WINDOW_HOURS hours, as last ranked by compact_trending
+@swagger_auto_schema(method='get', manual_parameters=[LIMIT_PARAMETER])
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_trending(request: Request):
+    try:
+        limit = parse_page_size(request.query_params.get('limit'), maximum=settings.TRENDING_SIZE)
+    except ValueError as e:
+        return Response({'message': str(e)}, status=400)
+
+    trending = TrendingPost.objects.select_related('post__user').order_by('rank')[:limit]
+    serializer = TrendingPostSerializer(trending, many=True)
+    return Response({'results': serializer.data})
+
+
+# Post cache hit and miss counters, for sizing the cache
+@api_view(['GET'])
+@authentication_classes([CachedJWTAuthentication])
+@permission_classes([IsAdminUser])
+def get_post_cache_stats(request: Request):
+    return Response(post_cache_stats())
+
+
+# Active, idle and wait time statistics of this process's database connections
+@api_view(['GET'])
+@authentication_classes([CachedJWTAuthentication])
+@permission_classes([IsAdminUser])
+def get_db_stats(request: Request):
+    return Response(connection_stats.snapshot())
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from swagger.schema import schema_cache
+
+
+# Generate the OpenAPI schema at build time, so no process inspects the views on its first schema request
+class Command(BaseCommand):
+    help = 'Write the OpenAPI schema as JSON and YAML to SCHEMA_ROOT'
+
+    def handle(self, *args, **options):
+        for path in schema_cache.build():
+            self.stdout.write(f'Wrote {path}')
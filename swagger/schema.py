@@ -0,0 +1,120 @@
+import hashlib
+import os
+import threading
+from importlib.util import find_spec
+from typing import NamedTuple
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+from drf_yasg.generators import OpenAPISchemaGenerator
+from drf_yasg.renderers import _SpecRenderer
+from drf_yasg.views import get_schema_view
+from rest_framework import permissions
+
+# Modules the schema is generated from: the routes, the serializers and the swagger_auto_schema annotations
+# of the views. The fingerprint only changes when one of them does.
+SCHEMA_SOURCES = ('api.urls', 'api.serializers', 'api.views', 'api.async_views')
+
+info = openapi.Info(
+    title="Reunion API",
+    default_version='v1',
+    description="Reunion API",
+    terms_of_service="https://www.google.com/policies/terms/",
+    license=openapi.License(name="MIT License"),
+)
+
+
+def schema_fingerprint() -> str:
+    digest = hashlib.sha256()
+    for module in SCHEMA_SOURCES:
+        with open(find_spec(module).origin, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()[:16]
+
+
+class RenderedSchema(NamedTuple):
+    fingerprint: str
+    json: bytes
+    yaml: bytes
+
+
+# The schema rendered once per process as JSON and YAML. `generate_schema` writes it to SCHEMA_ROOT at build
+# time, the first request loads that build when its fingerprint matches the current sources and generates
+# the schema itself otherwise. The schema is public and has no host, so one rendering serves every request.
+class SchemaCache:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._schema = None
+
+    def get(self) -> RenderedSchema:
+        if self._schema is None:
+            with self._lock:
+                if self._schema is None:
+                    fingerprint = schema_fingerprint()
+                    self._schema = self.load(fingerprint) or self.generate(fingerprint)
+        return self._schema
+
+    def generate(self, fingerprint: str) -> RenderedSchema:
+        schema = OpenAPISchemaGenerator(info).get_schema(request=None, public=True)
+        return RenderedSchema(fingerprint, OpenAPICodecJson([]).encode(schema), OpenAPICodecYaml([]).encode(schema))
+
+    def paths(self, fingerprint: str) -> dict:
+        return {format: os.path.join(settings.SCHEMA_ROOT, f'openapi.{fingerprint}.{format}')
+                for format in ('json', 'yaml')}
+
+    def load(self, fingerprint: str):
+        try:
+            rendered = {}
+            for format, path in self.paths(fingerprint).items():
+                with open(path, 'rb') as file:
+                    rendered[format] = file.read()
+        except FileNotFoundError:
+            return None
+        return RenderedSchema(fingerprint, **rendered)
+
+    # Write the current schema to SCHEMA_ROOT, returning the paths written
+    def build(self) -> list:
+        fingerprint = schema_fingerprint()
+        schema = self.generate(fingerprint)
+        os.makedirs(settings.SCHEMA_ROOT, exist_ok=True)
+        paths = self.paths(fingerprint)
+        for format, path in paths.items():
+            with open(path, 'wb') as file:
+                file.write(getattr(schema, format))
+        return list(paths.values())
+
+
+schema_cache = SchemaCache()
+
+BaseSchemaView = get_schema_view(
+    info,
+    public=True,
+    permission_classes=[permissions.AllowAny],
+)
+
+
+# Answers the spec formats (/swagger.json, /swagger.yaml, ?format=openapi of the UI pages) from the cached
+# rendering with an ETag, so clients revalidate with a 304. The UI pages themselves never inspect the views.
+class SchemaView(BaseSchemaView):
+    def get(self, request, version='', format=None):
+        renderer = request.accepted_renderer
+        if not isinstance(renderer, _SpecRenderer):
+            return super().get(request, version, format)
+
+        schema = schema_cache.get()
+        format = 'yaml' if renderer.format == '.yaml' else 'json'
+        etag = f'"{schema.fingerprint}-{format}"'
+        response = get_conditional_response(request, etag=etag) or \
+            HttpResponse(getattr(schema, format), content_type=f'{renderer.media_type}; charset=utf-8')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+        return response
+
+
+schema_view = SchemaView
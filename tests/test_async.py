@@ -0,0 +1,81 @@
+import os
+
+import jwt
+from django.core.cache import cache
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from api.counters import reconcile_counters
+from api.models import Comment, Post, User
+
+
+class AsyncReadViewsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+        self.tester1 = User.objects.create_user(username='tester1', email='tester1@test.com', password='tester1')
+        self.tester2 = User.objects.create_user(username='tester2', email='tester2@test.com', password='tester2')
+        for tester in (self.tester1, self.tester2):
+            tester.token = jwt.encode({'token_type': 'access',
+                                       'exp': 9999999999,
+                                       'iat': 0,
+                                       'jti': '1234567890',
+                                       'user_id': tester.id,
+                                       'username': tester.username}, os.environ.get('SECRET_KEY'), algorithm='HS256')
+
+        self.post1 = Post.objects.create(title="Test 1", desc="Description 1", user=self.tester1)
+        self.post2 = Post.objects.create(title="Test 2", desc="Description 2", user=self.tester1)
+        self.post1.likes.add(self.tester2)
+        self.tester2.following.add(self.tester1)
+        Comment.objects.create(user=self.tester2, post=self.post1, comment="Comment 1")
+        reconcile_counters()
+
+    def assertSameResponse(self, sync_url, async_url, tester, **params):
+        sync_response = self.client.get(sync_url, params, HTTP_AUTHORIZATION=f"Bearer {tester.token}")
+        cache.clear()
+        async_response = self.client.get(async_url, params, HTTP_AUTHORIZATION=f"Bearer {tester.token}")
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response.content, sync_response.content)
+
+    def test_get_user(self):
+        self.assertSameResponse(reverse('get_user'), reverse('async_get_user'), self.tester1)
+
+    def test_get_posts(self):
+        self.assertSameResponse(reverse('get_posts'), reverse('async_get_posts'), self.tester1)
+        self.assertSameResponse(reverse('get_posts'), reverse('async_get_posts'), self.tester1, limit=1)
+        self.assertSameResponse(reverse('get_posts'), reverse('async_get_posts'), self.tester1, fields='id,likes', comments='count')
+        self.assertSameResponse(reverse('get_posts'), reverse('async_get_posts'), self.tester1, comments='preview:1')
+        self.assertSameResponse(reverse('get_posts'), reverse('async_get_posts'), self.tester1, comments='preview:1', limit=1)
+
+    def test_get_post(self):
+        self.assertSameResponse(reverse('get_or_delete_post', args=[self.post1.id]),
+                                reverse('async_get_or_delete_post', args=[self.post1.id]), self.tester2)
+        self.assertSameResponse(reverse('get_or_delete_post', args=[self.post1.id]),
+                                reverse('async_get_or_delete_post', args=[self.post1.id]), self.tester2, comments='preview:1')
+        self.assertSameResponse(reverse('get_or_delete_post', args=[999]),
+                                reverse('async_get_or_delete_post', args=[999]), self.tester2)
+
+    def test_delete_post(self):
+        url = reverse('async_get_or_delete_post', args=[self.post1.id])
+        response = self.client.delete(url, HTTP_AUTHORIZATION=f"Bearer {self.tester2.token}")
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json(), {'message': 'You cannot delete this post'})
+
+        response = self.client.delete(url, HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'message': f'Post {self.post1.id} deleted'})
+        self.assertFalse(Post.objects.filter(id=self.post1.id).exists())
+
+    def test_invalid_auth(self):
+        response = self.client.get(reverse('async_get_user'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json().get('detail'), 'Authentication credentials were not provided.')
+
+        response = self.client.get(reverse('async_get_user'), HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}invalid")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json().get('detail'), 'Given token not valid for any token type')
+
+    def test_method_not_allowed(self):
+        response = self.client.post(reverse('async_get_user'), HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 405)
@@ -0,0 +1,175 @@
+import gzip
+import json
+import os
+from datetime import timedelta
+from unittest import mock
+
+import jwt
+from django.core.cache import cache
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+
+from api.models import Comment, Post, User
+from api.serializers import PostSerializer
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create_user(username='author', email='author@test.com', password='author')
+        self.reader = User.objects.create_user(username='reader', email='reader@test.com', password='reader')
+        for user in (self.author, self.reader):
+            user.token = 'Bearer ' + jwt.encode({'token_type': 'access',
+                                                 'exp': 9999999999,
+                                                 'iat': 0,
+                                                 'jti': '1234567890',
+                                                 'user_id': user.id,
+                                                 'username': user.username}, os.environ.get('SECRET_KEY'), algorithm='HS256')
+        self.posts = [Post.objects.create(user=self.author, title=f'Post {i}', desc='Description ' * 50)
+                      for i in range(3)]
+        self.post_url = reverse('get_or_delete_post', args=[self.posts[0].id])
+
+    def get(self, url, user=None, **headers):
+        return self.client.get(url, HTTP_AUTHORIZATION=(user or self.author).token, **headers)
+
+    def post(self, url, data=None, user=None):
+        return self.client.post(url, data or {}, content_type='application/json',
+                                HTTP_AUTHORIZATION=(user or self.reader).token)
+
+    def assertRevalidates(self, url, change, user=None):
+        etag = self.get(url, user)['ETag']
+        response = self.get(url, user, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        change()
+        response = self.get(url, user, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_post_validators(self):
+        response = self.get(self.post_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertIn('Authorization', response['Vary'])
+        self.assertIn('Last-Modified', response)
+
+        # A shaped representation has its own validator
+        self.assertNotEqual(self.get(self.post_url + '?comments=none')['ETag'], response['ETag'])
+
+    def test_post_revalidates(self):
+        id = self.posts[0].id
+        self.assertRevalidates(self.post_url, lambda: self.post(reverse('like_post', args=[id])))
+        self.assertRevalidates(self.post_url, lambda: self.post(reverse('unlike_post', args=[id])))
+        self.assertRevalidates(self.post_url, lambda: self.post(reverse('comment_post', args=[id]),
+                                                                {'comment': 'Comment'}))
+        self.assertRevalidates(self.post_url, lambda: self.post(reverse('like_posts'), {'ids': [id]}))
+
+        # Comments written around the views move the latest comment time once the cached state expires
+        def comment_directly():
+            Comment.objects.create(user=self.reader, post_id=id, comment='Direct')
+            cache.clear()
+        self.assertRevalidates(self.post_url, comment_directly)
+
+    def test_not_modified_skips_rendering(self):
+        etag = self.get(self.post_url)['ETag']
+        cache.clear()
+        with mock.patch.object(PostSerializer, 'to_representation') as to_representation, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.get(self.post_url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(len(queries), 1)
+            # The state is cached from then on
+            self.assertEqual(self.get(self.post_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(len(queries), 1)
+        to_representation.assert_not_called()
+
+    def test_if_modified_since(self):
+        response = self.get(self.post_url, HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('Last-Modified', response)
+
+        past = (timezone.now() - timedelta(days=1)).timestamp()
+        self.assertEqual(self.get(self.post_url, HTTP_IF_MODIFIED_SINCE=http_date(past)).status_code, 200)
+        # A matching If-None-Match wins over If-Modified-Since
+        response = self.get(self.post_url, HTTP_IF_NONE_MATCH='"stale"', HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_post(self):
+        response = self.get(reverse('get_or_delete_post', args=[0]), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+    def test_delete_unconditional(self):
+        etag = self.get(self.post_url)['ETag']
+        response = self.client.delete(self.post_url, HTTP_AUTHORIZATION=self.author.token, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+    def test_posts_revalidate(self):
+        url = reverse('get_posts')
+        self.assertRevalidates(url, lambda: self.post(reverse('like_post', args=[self.posts[1].id])))
+        self.assertRevalidates(url, lambda: self.client.post(reverse('create_post'), {'title': 'New', 'desc': 'Post'},
+                                                             HTTP_AUTHORIZATION=self.author.token))
+        self.assertRevalidates(url, lambda: self.client.delete(reverse('get_or_delete_post', args=[self.posts[2].id]),
+                                                               HTTP_AUTHORIZATION=self.author.token))
+        # Pages have their own validators, users their own lists
+        self.assertNotEqual(self.get(url + '?limit=1')['ETag'], self.get(url)['ETag'])
+        self.assertNotEqual(self.get(url, self.reader)['ETag'], self.get(url)['ETag'])
+
+    def test_posts_list_without_last_modified(self):
+        url = reverse('get_posts')
+        response = self.get(url)
+        self.assertNotIn('Last-Modified', response)
+        # Deleting an older post leaves the latest activity time of the list as it was
+        self.client.delete(reverse('get_or_delete_post', args=[self.posts[0].id]), HTTP_AUTHORIZATION=self.author.token)
+        response = self.get(url, HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+
+    def test_activity_leaves_updated_at(self):
+        id = self.posts[0].id
+        before = Post.objects.values('updated_at', 'activity_at').get(id=id)
+        self.post(reverse('like_post', args=[id]))
+        self.post(reverse('comment_post', args=[id]), {'comment': 'Comment'})
+        after = Post.objects.values('updated_at', 'activity_at').get(id=id)
+        self.assertEqual(after['updated_at'], before['updated_at'])
+        self.assertGreater(after['activity_at'], before['activity_at'])
+
+    def test_user_delete_moves_last_modified(self):
+        id = self.posts[0].id
+        self.post(reverse('like_post', args=[id]))
+        Post.objects.filter(id=id).update(activity_at=timezone.now() - timedelta(days=1))
+        cache.clear()
+        last_modified = self.get(self.post_url)['Last-Modified']
+        self.assertEqual(self.get(self.post_url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.reader.delete()
+        response = self.get(self.post_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['likes'], 0)
+
+    def test_user_revalidates(self):
+        url = reverse('get_user')
+        self.assertRevalidates(url, lambda: self.post(reverse('follow_user', args=[self.author.id])))
+        self.assertNotIn('Last-Modified', self.get(url))
+
+    def test_gzip(self):
+        response = self.get(reverse('get_posts'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))), 3)
+
+        # Compression weakens the validator, which still matches
+        response = self.get(reverse('get_posts'), HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.get(reverse('get_posts'))
+        self.assertNotIn('Content-Encoding', response)
+        # Small bodies are not worth compressing
+        self.assertNotIn('Content-Encoding', self.get(reverse('get_user'), HTTP_ACCEPT_ENCODING='gzip'))
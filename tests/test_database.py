@@ -0,0 +1,80 @@
+import os
+import tempfile
+from unittest import mock
+
+import jwt
+from django.db import connections
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from api.db.sqlite3.base import DatabaseWrapper
+from api.db.stats import connection_stats
+from api.models import User
+
+
+class ConnectionStatsTestCase(TestCase):
+    def setUp(self):
+        connection_stats.reset()
+        # A file database, in-memory SQLite connections ignore close()
+        self.directory = tempfile.TemporaryDirectory()
+        settings_dict = {**connections['default'].settings_dict, 'NAME': os.path.join(self.directory.name, 'stats.sqlite3'),
+                         'CONN_HEALTH_CHECKS': True}
+        self.wrapper = DatabaseWrapper(settings_dict, alias='stats')
+
+    def tearDown(self):
+        self.wrapper.close()
+        self.directory.cleanup()
+
+    def test_connect_and_close(self):
+        self.wrapper.ensure_connection()
+        stats = connection_stats.snapshot()
+        self.assertEqual((stats['opened'], stats['active'], stats['idle']), (1, 0, 1))
+        self.assertGreater(stats['wait_ms']['max'], 0)
+
+        self.wrapper.close()
+        stats = connection_stats.snapshot()
+        self.assertEqual((stats['closed'], stats['active'], stats['idle']), (1, 0, 0))
+
+    def test_active_during_request(self):
+        self.wrapper.ensure_connection()
+        connection_stats.request_started([self.wrapper])
+        stats = connection_stats.snapshot()
+        self.assertEqual((stats['active'], stats['idle'], stats['reused']), (1, 0, 1))
+
+        connection_stats.request_finished()
+        stats = connection_stats.snapshot()
+        self.assertEqual((stats['active'], stats['idle']), (0, 1))
+
+    def test_failed_health_check(self):
+        self.wrapper.ensure_connection()
+        # Simulate the server dropping the connection between requests
+        self.wrapper.health_check_done = False
+        with mock.patch.object(self.wrapper, 'is_usable', return_value=False):
+            self.wrapper.cursor().close()
+        stats = connection_stats.snapshot()
+        self.assertEqual((stats['opened'], stats['closed'], stats['health_check_failures']), (2, 1, 1))
+
+
+class DbStatsEndpointTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.db_stats_url = reverse('get_db_stats')
+        self.tester1 = User.objects.create_user(username='tester1', email='tester1@test.com', password='tester1')
+        self.tester2 = User.objects.create_user(username='tester2', email='tester2@test.com', password='tester2',
+                                                is_staff=True)
+        for tester in (self.tester1, self.tester2):
+            tester.token = jwt.encode({'token_type': 'access',
+                                       'exp': 9999999999,
+                                       'iat': 0,
+                                       'jti': '1234567890',
+                                       'user_id': tester.id,
+                                       'username': tester.username}, os.environ.get('SECRET_KEY'), algorithm='HS256')
+
+    def test_db_stats(self):
+        response = self.client.get(self.db_stats_url, HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 403)
+
+        response = self.client.get(self.db_stats_url, HTTP_AUTHORIZATION=f"Bearer {self.tester2.token}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data.keys(), {'active', 'idle', 'opened', 'closed', 'health_check_failures',
+                                                'requests', 'reused', 'wait_ms'})
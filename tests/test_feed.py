@@ -0,0 +1,119 @@
+import os
+from unittest import mock
+
+import jwt
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from api import feed
+from api.feed import backfill_timeline
+from api.models import Post, TimelineEntry, User
+
+
+class FeedTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.feed_url = reverse('get_feed')
+        self.post_url = reverse('create_post')
+        self.get_or_delete_post_url = lambda id: reverse('get_or_delete_post', args=[id])
+        self.follow_url = lambda id: reverse('follow_user', args=[id])
+        self.unfollow_url = lambda id: reverse('unfollow_user', args=[id])
+
+        self.tester1 = User.objects.create_user(username='tester1', email='tester1@test.com', password='tester1')
+        self.tester2 = User.objects.create_user(username='tester2', email='tester2@test.com', password='tester2')
+        self.tester3 = User.objects.create_user(username='tester3', email='tester3@test.com', password='tester3')
+
+        for tester in (self.tester1, self.tester2, self.tester3):
+            tester.token = jwt.encode({'token_type': 'access',
+                                       'exp': 9999999999,
+                                       'iat': 0,
+                                       'jti': '1234567890',
+                                       'user_id': tester.id,
+                                       'username': tester.username}, os.environ.get('SECRET_KEY'), algorithm='HS256')
+
+        self.old_post = Post.objects.create(title="Old", desc="Written before the follow", user=self.tester2)
+
+    def create_post(self, tester, title):
+        response = self.client.post(self.post_url, {'title': title, 'desc': title}, HTTP_AUTHORIZATION=f'Bearer {tester.token}')
+        self.assertEqual(response.status_code, 201)
+        return response.data.get('id')
+
+    def get_feed(self, tester, **params):
+        response = self.client.get(self.feed_url, params, HTTP_AUTHORIZATION=f'Bearer {tester.token}')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_feed(self):
+        self.client.post(self.follow_url(self.tester2.id), HTTP_AUTHORIZATION=f'Bearer {self.tester1.token}')
+        self.client.post(self.follow_url(self.tester3.id), HTTP_AUTHORIZATION=f'Bearer {self.tester1.token}')
+        post2 = self.create_post(self.tester2, "From tester2")
+        post3 = self.create_post(self.tester3, "From tester3")
+        self.create_post(self.tester1, "Own post")
+
+        data = self.get_feed(self.tester1)
+        self.assertEqual([p.get('id') for p in data.get('results')], [post3, post2, self.old_post.id])
+        self.assertEqual(data.get('results')[0].get('user'), 'tester3')
+        self.assertIsNone(data.get('next'))
+
+        self.assertEqual(self.get_feed(self.tester2).get('results'), [])
+
+    def test_backfill_several_followees(self):
+        posts = [Post.objects.create(title=f"Post {i}", desc="Post", user=self.tester3) for i in range(3)]
+        with self.assertNumQueries(1):
+            backfill_timeline(self.tester1.id, [self.tester2.id, self.tester3.id])
+        self.assertEqual(set(TimelineEntry.objects.filter(user=self.tester1).values_list('post_id', flat=True)),
+                         {self.old_post.id, *(post.id for post in posts)})
+
+        # Only each followee's latest posts are copied, existing entries are left alone
+        TimelineEntry.objects.all().delete()
+        feed.BACKFILL_LIMIT, limit = 2, feed.BACKFILL_LIMIT
+        try:
+            backfill_timeline(self.tester1.id, [self.tester2.id, self.tester3.id])
+            backfill_timeline(self.tester1.id, [self.tester3.id])
+        finally:
+            feed.BACKFILL_LIMIT = limit
+        self.assertEqual(sorted(TimelineEntry.objects.filter(user=self.tester1).values_list('post_id', flat=True)),
+                         sorted([self.old_post.id, posts[1].id, posts[2].id]))
+
+    def test_feed_paginated(self):
+        self.client.post(self.follow_url(self.tester2.id), HTTP_AUTHORIZATION=f'Bearer {self.tester1.token}')
+        ids = [self.create_post(self.tester2, f"Post {i}") for i in range(4)]
+
+        data = self.get_feed(self.tester1, limit=2)
+        seen = [p.get('id') for p in data.get('results')]
+        while data.get('next'):
+            data = self.get_feed(self.tester1, limit=2, cursor=data.get('next'))
+            seen += [p.get('id') for p in data.get('results')]
+        self.assertEqual(seen, list(reversed(ids)) + [self.old_post.id])
+
+    def test_feed_unfollow_trims(self):
+        self.client.post(self.follow_url(self.tester2.id), HTTP_AUTHORIZATION=f'Bearer {self.tester1.token}')
+        self.create_post(self.tester2, "From tester2")
+        self.assertEqual(len(self.get_feed(self.tester1).get('results')), 2)
+
+        self.client.post(self.unfollow_url(self.tester2.id), HTTP_AUTHORIZATION=f'Bearer {self.tester1.token}')
+        self.assertEqual(self.get_feed(self.tester1).get('results'), [])
+        self.assertFalse(TimelineEntry.objects.filter(user=self.tester1).exists())
+
+    def test_feed_post_delete_retracts(self):
+        self.client.post(self.follow_url(self.tester2.id), HTTP_AUTHORIZATION=f'Bearer {self.tester1.token}')
+        post_id = self.create_post(self.tester2, "From tester2")
+
+        response = self.client.delete(self.get_or_delete_post_url(post_id), HTTP_AUTHORIZATION=f'Bearer {self.tester2.token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p.get('id') for p in self.get_feed(self.tester1).get('results')], [self.old_post.id])
+
+    def test_feed_post_deleted_while_reading(self):
+        self.client.post(self.follow_url(self.tester2.id), HTTP_AUTHORIZATION=f'Bearer {self.tester1.token}')
+        post = self.create_post(self.tester2, "Deleted while reading")
+        # The post disappears between the timeline read and the post fetch
+        with mock.patch('api.views.Post.objects.with_details') as with_details:
+            with_details.return_value.select_related.return_value.in_bulk = \
+                lambda ids: Post.objects.select_related('user').exclude(id=post).in_bulk(ids)
+            data = self.get_feed(self.tester1)
+        self.assertEqual([p.get('id') for p in data.get('results')], [self.old_post.id])
+
+    def test_feed_missing_token(self):
+        response = self.client.get(self.feed_url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data.get('detail'), 'Authentication credentials were not provided.')
@@ -0,0 +1,99 @@
+import json
+import os
+from unittest import mock
+
+import jwt
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.test import AsyncClient, TestCase, Client, override_settings
+from django.urls import reverse
+
+from api.counters import reconcile_counters
+from api.instrumentation import RepeatedQueryError, fingerprint, record_queries
+from api.models import User, Post, Comment, PostQuerySet
+
+
+class FingerprintTestCase(TestCase):
+    def test_fingerprint(self):
+        self.assertEqual(fingerprint('SELECT * FROM "api_post" WHERE "id" IN (%s, %s,\n %s) LIMIT 21'),
+                         'SELECT * FROM "api_post" WHERE "id" IN (...) LIMIT ?')
+        self.assertEqual(fingerprint("SELECT 1 FROM t WHERE a = 'x''y' AND b = %s"),
+                         'SELECT ? FROM t WHERE a = ? AND b = %s')
+        self.assertEqual(fingerprint('SELECT * FROM t WHERE id IN (%s)'), fingerprint('SELECT * FROM t WHERE id IN (%s, %s)'))
+
+    def test_record_queries(self):
+        with record_queries() as recorder:
+            for i in range(3):
+                Post.objects.filter(id=i).exists()
+            User.objects.count()
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual(len(recorder.shapes), 2)
+        self.assertEqual([count for shape, count in recorder.repeated(2)], [3])
+
+
+class QueryInstrumentationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.get_posts_url = reverse('get_posts')
+
+        self.tester1 = User.objects.create_user(username='tester1', email='tester1@test.com', password='tester1')
+        self.tester2 = User.objects.create_user(username='tester2', email='tester2@test.com', password='tester2')
+        self.tester1.token = jwt.encode({'token_type': 'access',
+                                         'exp': 9999999999,
+                                         'iat': 0,
+                                         'jti': '1234567890',
+                                         'user_id': self.tester1.id,
+                                         'username': self.tester1.username}, os.environ.get('SECRET_KEY'), algorithm='HS256')
+        for i in range(5):
+            post = Post.objects.create(title=f"Test {i}", desc=f"Description {i}", user=self.tester1)
+            Comment.objects.create(user=self.tester2, post=post, comment=f"Comment {i}")
+        reconcile_counters()
+
+    def get_posts(self):
+        return self.client.get(self.get_posts_url, HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+
+    def test_server_timing(self):
+        response = self.get_posts()
+        self.assertEqual(response.status_code, 200)
+        db, app = response['Server-Timing'].split(', ')
+        self.assertRegex(db, r'^db;dur=\d+\.\d\d;desc="3 queries"$')
+        self.assertRegex(app, r'^app;dur=\d+\.\d\d$')
+
+    async def test_server_timing_async(self):
+        response = await AsyncClient().get(reverse('async_get_posts'), AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+        # The posts and their comments, the async view has no conditional GET validator query
+        self.assertRegex(response['Server-Timing'], r'^db;dur=\d+\.\d\d;desc="2 queries", ')
+
+    def test_async_handler_not_adapted(self):
+        # No middleware in the chain makes Django run the async views on a thread
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler().load_middleware(is_async=True)
+
+    def test_log_line(self):
+        with self.assertLogs('api.sql', 'INFO') as logs:
+            self.get_posts()
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['path'], self.get_posts_url)
+        self.assertEqual((line['status'], line['queries'], line['repeated']), (200, 3, []))
+
+    @override_settings(SQL_REPEAT_THRESHOLD=3)
+    def test_repeated_query_logged(self):
+        # Without the comments prefetch every post loads its comments, and every comment its author, on its own
+        with mock.patch.object(PostQuerySet, 'with_details', lambda posts: posts), \
+                self.assertLogs('api.sql', 'WARNING') as logs:
+            self.get_posts()
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual([repeated['count'] for repeated in line['repeated']], [5, 5])
+        self.assertEqual({repeated['sql'].split(' FROM ')[1].split()[0] for repeated in line['repeated']},
+                         {'"api_comment"', '"api_user"'})
+
+    @override_settings(SQL_REPEAT_THRESHOLD=3, SQL_REPEAT_RAISE=True)
+    def test_repeated_query_raises(self):
+        with mock.patch.object(PostQuerySet, 'with_details', lambda posts: posts), \
+                self.assertRaises(RepeatedQueryError):
+            self.get_posts()
+
+        # The prefetching view stays under the threshold at any number of posts
+        self.assertEqual(self.get_posts().status_code, 200)
@@ -1,10 +1,17 @@
+import json
 import os
+from unittest import mock
 
+from django.core.cache import cache
 from django.test import TestCase, Client
 from django.urls import reverse
 import jwt
 
-from api.models import Post, User
+from api.cache import get_cached_post_state, set_cached_post, set_cached_post_state
+from api.counters import reconcile_counters
+from api.export import export_user
+from api.models import Comment, Post, User, attach_comment_preview
+from api.serializers import PostSerializer
 
 
 class CreatePostTestCase(TestCase):
@@ -86,6 +93,7 @@ class CreatePostTestCase(TestCase):
 
 class PostTestCase(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.login_url = reverse('token_obtain_pair')
         self.user_url = reverse('get_user')
@@ -326,3 +334,410 @@ class PostTestCase(TestCase):
         response = self.client.post(self.comment_post_url(self.post1.id), data={'comment': 'Test comment'}, HTTP_AUTHORIZATION=f'Bearer {self.tester1.token}invalid')
         self.assertEqual(response.status_code, 401)
         self.assertEqual(response.data.get('detail'), 'Given token not valid for any token type')
+
+
+class PostQueryCountTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.get_or_delete_post_url = lambda id: reverse('get_or_delete_post', args=[id])
+        self.get_posts_url = reverse('get_posts')
+
+        self.tester1 = User.objects.create_user(username='tester1', email='tester1@test.com', password='tester1')
+        self.tester2 = User.objects.create_user(username='tester2', email='tester2@test.com', password='tester2')
+
+        self.tester1.token = jwt.encode({'token_type': 'access',
+                                         'exp': 9999999999,
+                                         'iat': 0,
+                                         'jti': '1234567890',
+                                         'user_id': self.tester1.id,
+                                         'username': self.tester1.username}, os.environ.get('SECRET_KEY'), algorithm='HS256')
+
+    def create_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(title=f"Test {i}", desc=f"Description {i}", user=self.tester1)
+            post.likes.add(self.tester2)
+            Comment.objects.create(user=self.tester2, post=post, comment=f"Comment {i}")
+            Comment.objects.create(user=self.tester1, post=post, comment=f"Reply {i}")
+        reconcile_counters()
+
+    def test_get_all_posts_query_count(self):
+        # The conditional GET validators, posts with their stored like counts, then comments with their authors
+        self.create_posts(2)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.get_posts_url, HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+
+        self.create_posts(10)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.get_posts_url, HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 12)
+        self.assertEqual(response.data[0].get('likes'), 1)
+        self.assertEqual([c.get('user') for c in response.data[0].get('comments')], ['tester2', 'tester1'])
+
+    def test_like_post_query_count(self):
+        # Liking costs the same number of queries no matter how many posts the user already liked
+        posts = [Post.objects.create(title=f"Test {i}", desc=f"Description {i}", user=self.tester2) for i in range(6)]
+        # The user check of writes on an empty user cache, the post author lookup, then the savepointed
+        # like insert, counter update and activity bucket upsert
+        cache.clear()
+        with self.assertNumQueries(7):
+            response = self.client.post(reverse('like_post', args=[posts[0].id]), HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+
+        for post in posts[1:5]:
+            self.client.post(reverse('like_post', args=[post.id]), HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        cache.clear()
+        with self.assertNumQueries(7):
+            response = self.client.post(reverse('like_post', args=[posts[5].id]), HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Post.objects.get(id=posts[5].id).likes_count, 1)
+
+    def test_get_post_query_count(self):
+        self.create_posts(1)
+        post = Post.objects.get()
+        # The conditional GET validators, the post, then its comments
+        with self.assertNumQueries(3):
+            response = self.client.get(self.get_or_delete_post_url(post.id), HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data.get('likes'), 1)
+        self.assertEqual(response.data.get('comments')[0].get('comment'), 'Comment 0')
+
+
+class PaginatedPostsTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.get_posts_url = reverse('get_posts')
+
+        self.tester1 = User.objects.create_user(username='tester1', email='tester1@test.com', password='tester1')
+        self.tester1.token = jwt.encode({'token_type': 'access',
+                                         'exp': 9999999999,
+                                         'iat': 0,
+                                         'jti': '1234567890',
+                                         'user_id': self.tester1.id,
+                                         'username': self.tester1.username}, os.environ.get('SECRET_KEY'), algorithm='HS256')
+
+        self.posts = [Post.objects.create(title=f"Test {i}", desc=f"Description {i}", user=self.tester1) for i in range(5)]
+
+    def test_get_all_posts_paginated(self):
+        response = self.client.get(self.get_posts_url, {'limit': 2}, HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p.get('id') for p in response.data.get('results')], [self.posts[0].id, self.posts[1].id])
+
+        ids = [p.get('id') for p in response.data.get('results')]
+        while response.data.get('next'):
+            response = self.client.get(self.get_posts_url, {'limit': 2, 'cursor': response.data.get('next')},
+                                       HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+            self.assertEqual(response.status_code, 200)
+            ids += [p.get('id') for p in response.data.get('results')]
+        self.assertEqual(ids, [p.id for p in self.posts])
+
+    def test_get_all_posts_unpaginated(self):
+        response = self.client.get(self.get_posts_url, HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 5)
+
+    def test_get_all_posts_invalid_cursor(self):
+        response = self.client.get(self.get_posts_url, {'cursor': 'invalid'}, HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data.get('message'), 'Invalid cursor')
+
+        response = self.client.get(self.get_posts_url, {'limit': 0}, HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data.get('message'), 'Invalid limit')
+
+
+class PostCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.get_or_delete_post_url = lambda id: reverse('get_or_delete_post', args=[id])
+        self.like_post_url = lambda id: reverse('like_post', args=[id])
+        self.comment_post_url = lambda id: reverse('comment_post', args=[id])
+        self.cache_stats_url = reverse('get_post_cache_stats')
+
+        self.tester1 = User.objects.create_user(username='tester1', email='tester1@test.com', password='tester1')
+        self.tester2 = User.objects.create_user(username='tester2', email='tester2@test.com', password='tester2',
+                                                is_staff=True)
+        for tester in (self.tester1, self.tester2):
+            tester.token = jwt.encode({'token_type': 'access',
+                                       'exp': 9999999999,
+                                       'iat': 0,
+                                       'jti': '1234567890',
+                                       'user_id': tester.id,
+                                       'username': tester.username}, os.environ.get('SECRET_KEY'), algorithm='HS256')
+
+        self.post1 = Post.objects.create(title="Test 1", desc="Description 1", user=self.tester1)
+
+    def get_post(self):
+        response = self.client.get(self.get_or_delete_post_url(self.post1.id), HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_get_post_cached(self):
+        data = self.get_post()
+        # No query runs on a cache hit
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_post(), data)
+
+        response = self.client.get(self.cache_stats_url, HTTP_AUTHORIZATION=f"Bearer {self.tester2.token}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'hits': 1, 'misses': 1})
+
+    def test_get_post_cache_invalidated(self):
+        self.assertEqual(self.get_post().get('likes'), 0)
+        self.client.post(self.like_post_url(self.post1.id), HTTP_AUTHORIZATION=f"Bearer {self.tester2.token}")
+        self.assertEqual(self.get_post().get('likes'), 1)
+
+        self.client.post(self.comment_post_url(self.post1.id), data={'comment': 'Test comment'}, HTTP_AUTHORIZATION=f"Bearer {self.tester2.token}")
+        self.assertEqual(len(self.get_post().get('comments')), 1)
+
+        response = self.client.delete(self.get_or_delete_post_url(self.post1.id), HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.get_or_delete_post_url(self.post1.id), HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalidation_outlives_older_reads(self):
+        # A request read the post before a like, the like's invalidation lands before that request caches
+        self.get_post()
+        state = get_cached_post_state(self.post1.id)
+        self.client.post(self.like_post_url(self.post1.id), HTTP_AUTHORIZATION=f"Bearer {self.tester2.token}")
+        set_cached_post(self.post1.id, {'likes': 0})
+        set_cached_post_state(self.post1.id, state)
+        self.assertIsNone(get_cached_post_state(self.post1.id))
+        self.assertEqual(self.get_post().get('likes'), 1)
+
+    def test_cache_stats_not_admin(self):
+        response = self.client.get(self.cache_stats_url, HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 403)
+
+
+class BatchLikeTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.like_posts_url = reverse('like_posts')
+        self.unlike_posts_url = reverse('unlike_posts')
+
+        self.tester1 = User.objects.create_user(username='tester1', email='tester1@test.com', password='tester1')
+        self.tester2 = User.objects.create_user(username='tester2', email='tester2@test.com', password='tester2')
+        self.tester1.token = jwt.encode({'token_type': 'access',
+                                         'exp': 9999999999,
+                                         'iat': 0,
+                                         'jti': '1234567890',
+                                         'user_id': self.tester1.id,
+                                         'username': self.tester1.username}, os.environ.get('SECRET_KEY'), algorithm='HS256')
+
+        self.own_post = Post.objects.create(title="Own", desc="Own post", user=self.tester1)
+        self.post1 = Post.objects.create(title="Test 1", desc="Description 1", user=self.tester2)
+        self.post2 = Post.objects.create(title="Test 2", desc="Description 2", user=self.tester2)
+
+    def test_like_posts(self):
+        response = self.client.post(self.like_posts_url, {'ids': [self.post1.id, self.post2.id, self.own_post.id, 999]},
+                                    content_type='application/json', HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'results': {str(self.post1.id): 'liked',
+                                                       str(self.post2.id): 'liked',
+                                                       str(self.own_post.id): 'own_post',
+                                                       '999': 'not_found'}})
+
+        response = self.client.post(self.like_posts_url, {'ids': [self.post1.id]},
+                                    content_type='application/json', HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.json(), {'results': {str(self.post1.id): 'already_liked'}})
+        self.assertEqual(Post.objects.get(id=self.post1.id).likes_count, 1)
+        self.assertEqual(self.tester1.liked_posts.count(), 2)
+
+    def test_unlike_posts(self):
+        self.client.post(self.like_posts_url, {'ids': [self.post1.id]},
+                         content_type='application/json', HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+
+        response = self.client.post(self.unlike_posts_url, {'ids': [self.post1.id, self.post2.id, self.own_post.id]},
+                                    content_type='application/json', HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'results': {str(self.post1.id): 'unliked',
+                                                       str(self.post2.id): 'not_liked',
+                                                       str(self.own_post.id): 'own_post'}})
+        self.assertEqual(Post.objects.get(id=self.post1.id).likes_count, 0)
+
+
+class PostCommentsTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.post_comments_url = lambda id: reverse('get_post_comments', args=[id])
+
+        self.tester1 = User.objects.create_user(username='tester1', email='tester1@test.com', password='tester1')
+        self.tester2 = User.objects.create_user(username='tester2', email='tester2@test.com', password='tester2')
+        self.tester1.token = jwt.encode({'token_type': 'access',
+                                         'exp': 9999999999,
+                                         'iat': 0,
+                                         'jti': '1234567890',
+                                         'user_id': self.tester1.id,
+                                         'username': self.tester1.username}, os.environ.get('SECRET_KEY'), algorithm='HS256')
+
+        self.post1 = Post.objects.create(title="Test 1", desc="Description 1", user=self.tester1)
+        for i in range(5):
+            Comment.objects.create(user=self.tester2 if i % 2 else self.tester1, post=self.post1, comment=f"Comment {i}")
+        reconcile_counters()
+
+    def test_get_post_comments(self):
+        comments = []
+        response = self.client.get(self.post_comments_url(self.post1.id), {'limit': 2}, HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data.get('results')[1], {'user': 'tester2', 'comment': 'Comment 1',
+                                                           'created_at': response.data.get('results')[1].get('created_at')})
+        comments += [c.get('comment') for c in response.data.get('results')]
+        while response.data.get('next'):
+            # Post existence check, one page of comments with authors
+            with self.assertNumQueries(2):
+                response = self.client.get(self.post_comments_url(self.post1.id), {'limit': 2, 'cursor': response.data.get('next')},
+                                           HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+            comments += [c.get('comment') for c in response.data.get('results')]
+        self.assertEqual(comments, [f"Comment {i}" for i in range(5)])
+
+    def test_get_post_comments_invalid_id(self):
+        response = self.client.get(self.post_comments_url(999), HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data.get('message'), 'Post not found')
+
+    def test_post_comment_preview(self):
+        post = attach_comment_preview([Post.objects.get(id=self.post1.id)], 2)[0]
+        data = PostSerializer(post).data
+        self.assertEqual([c.get('comment') for c in data.get('comments')], ["Comment 3", "Comment 4"])
+        self.assertEqual(data.get('comments_count'), 5)
+
+    def test_comment_preview_several_posts(self):
+        post2 = Post.objects.create(title="Test 2", desc="Description 2", user=self.tester2)
+        Comment.objects.create(user=self.tester1, post=post2, comment="Only")
+        post3 = Post.objects.create(title="Test 3", desc="Description 3", user=self.tester2)
+        # The posts, then the latest comments of every post with their authors
+        with self.assertNumQueries(2):
+            posts = attach_comment_preview(Post.objects.order_by('id'), 3)
+            previews = [[(c.comment, c.user.username) for c in post.latest_comments] for post in posts]
+        self.assertEqual(previews, [[("Comment 2", "tester1"), ("Comment 3", "tester2"), ("Comment 4", "tester1")],
+                                    [("Only", "tester1")], []])
+        self.assertEqual([post.id for post in posts], [self.post1.id, post2.id, post3.id])
+
+        # Posts fetched any other way get the same preview
+        with self.assertNumQueries(2):
+            posts = attach_comment_preview(Post.objects.order_by('id').iterator(), 1)
+        self.assertEqual([len(post.latest_comments) for post in posts], [1, 1, 0])
+        comment = Comment.objects.select_related('post').get(comment="Only")
+        with self.assertNumQueries(1):
+            attach_comment_preview([comment.post], 1)
+        self.assertEqual([c.get('comment') for c in PostSerializer(comment.post).data.get('comments')], ["Only"])
+        self.assertEqual(attach_comment_preview([], 1), [])
+
+
+class SparsePostFieldsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.get_or_delete_post_url = lambda id: reverse('get_or_delete_post', args=[id])
+        self.get_posts_url = reverse('get_posts')
+
+        self.tester1 = User.objects.create_user(username='tester1', email='tester1@test.com', password='tester1')
+        self.tester2 = User.objects.create_user(username='tester2', email='tester2@test.com', password='tester2')
+        self.tester1.token = jwt.encode({'token_type': 'access',
+                                         'exp': 9999999999,
+                                         'iat': 0,
+                                         'jti': '1234567890',
+                                         'user_id': self.tester1.id,
+                                         'username': self.tester1.username}, os.environ.get('SECRET_KEY'), algorithm='HS256')
+
+        self.post1 = Post.objects.create(title="Test 1", desc="Description 1", user=self.tester1)
+        self.post1.likes.add(self.tester2)
+        for i in range(3):
+            Comment.objects.create(user=self.tester2, post=self.post1, comment=f"Comment {i}")
+        reconcile_counters()
+
+    def test_get_all_posts_fields(self):
+        # Validators and posts only, comments are never queried
+        with self.assertNumQueries(2):
+            response = self.client.get(self.get_posts_url, {'fields': 'id,title,likes'}, HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{'id': self.post1.id, 'title': "Test 1", 'likes': 1}])
+
+    def test_get_post_comments_count(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(self.get_or_delete_post_url(self.post1.id), {'comments': 'count'},
+                                       HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('comments', response.data)
+        self.assertEqual(response.data.get('comments_count'), 3)
+
+        response = self.client.get(self.get_or_delete_post_url(self.post1.id), {'comments': 'none'},
+                                   HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(set(response.data), {'id', 'title', 'desc', 'created_at', 'likes'})
+
+    def test_get_post_comments_preview(self):
+        response = self.client.get(self.get_or_delete_post_url(self.post1.id), {'comments': 'preview:2', 'fields': 'id,comments'},
+                                   HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {'id', 'comments', 'comments_count'})
+        self.assertEqual([c.get('comment') for c in response.data.get('comments')], ["Comment 1", "Comment 2"])
+        self.assertEqual(response.data.get('comments_count'), 3)
+
+        # Shaped responses are not cached, the default shape still has every comment
+        response = self.client.get(self.get_or_delete_post_url(self.post1.id), HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(len(response.data.get('comments')), 3)
+
+    def test_get_posts_invalid_options(self):
+        response = self.client.get(self.get_posts_url, {'fields': 'id,password'}, HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data.get('message'), 'Invalid fields')
+
+        response = self.client.get(self.get_posts_url, {'comments': 'preview:x'}, HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data.get('message'), 'Invalid comments option')
+
+
+class ExportPostsTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.export_url = reverse('export_posts')
+
+        self.tester1 = User.objects.create_user(username='tester1', email='tester1@test.com', password='tester1')
+        self.tester2 = User.objects.create_user(username='tester2', email='tester2@test.com', password='tester2')
+        self.tester1.token = jwt.encode({'token_type': 'access',
+                                         'exp': 9999999999,
+                                         'iat': 0,
+                                         'jti': '1234567890',
+                                         'user_id': self.tester1.id,
+                                         'username': self.tester1.username}, os.environ.get('SECRET_KEY'), algorithm='HS256')
+
+        self.post1 = Post.objects.create(title="Test 1", desc="Description 1", user=self.tester1)
+        self.post2 = Post.objects.create(title="Test 2", desc="Description 2", user=self.tester1)
+        self.post3 = Post.objects.create(title="Test 3", desc="Description 3", user=self.tester2)
+        self.comment1 = Comment.objects.create(user=self.tester2, post=self.post2, comment="Comment 1")
+        self.comment2 = Comment.objects.create(user=self.tester1, post=self.post1, comment="Comment 2")
+        self.comment3 = Comment.objects.create(user=self.tester1, post=self.post3, comment="Comment 3")
+
+    def test_export_posts(self):
+        response = self.client.get(self.export_url, HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([(line['type'], line['id']) for line in lines], [
+            ('post', self.post1.id), ('comment', self.comment2.id),
+            ('post', self.post2.id), ('comment', self.comment1.id),
+            ('comment', self.comment3.id),
+        ])
+        self.assertEqual(lines[0]['title'], "Test 1")
+        self.assertEqual(lines[3]['user'], 'tester2')
+        self.assertEqual(lines[4]['post'], self.post3.id)
+
+    def test_export_post_deleted_between_queries(self):
+        # The comments query still sees the first post, the posts query no longer does
+        posts = Post.objects.filter
+        with mock.patch('api.export.Post') as post_model:
+            post_model.objects.filter = lambda **kwargs: posts(**kwargs).exclude(id=self.post1.id)
+            lines = [json.loads(line) for line in export_user(self.tester1.id)]
+        self.assertEqual([(line['type'], line['id']) for line in lines], [
+            ('post', self.post2.id), ('comment', self.comment1.id), ('comment', self.comment3.id),
+        ])
+
+    def test_export_posts_missing_token(self):
+        response = self.client.get(self.export_url)
+        self.assertEqual(response.status_code, 401)
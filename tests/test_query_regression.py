@@ -0,0 +1,216 @@
+import itertools
+import os
+from importlib import import_module
+
+import jwt
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from api import urls
+from api.counters import reconcile_counters
+from api.feed import backfill_timeline
+from api.indexes import access_pattern_indexes
+from api.models import User, Post, Comment, Follow, Like
+from api.tokens import IndexedRefreshToken, revoked_jtis
+from api.trending import compact_trending, record_activity
+
+# Most queries each route may run on an empty cache, counting the savepoints of atomic blocks nested in the
+# test transaction. Every route must also run the same number of queries at every data size.
+MAX_QUERIES = {
+    'POST authenticate/': 2,
+    'POST token/refresh/': 6,
+    'POST register/': 3,
+    'GET user/': 1,
+    'POST follow/<id>/': 8,
+    'POST follow/batch/': 8,
+    'POST unfollow/<id>/': 8,
+    'POST unfollow/batch/': 9,
+    'POST posts/': 7,
+    'GET posts/<id>/': 3,
+    'DELETE posts/<id>/': 8,
+    'GET posts/<id>/comments/': 2,
+    'POST like/<id>/': 7,
+    'POST like/batch/': 7,
+    'POST unlike/<id>/': 7,
+    'POST unlike/batch/': 8,
+    'POST comment/<id>/': 8,
+    'GET all_posts/': 3,
+    'GET all_posts/?limit=': 3,
+    'GET export/': 3,
+    'GET feed/': 3,
+    'GET search/': 3,
+    'GET trending/': 1,
+    'GET cache/stats/': 1,
+    'GET db/stats/': 1,
+    'GET async/user/': 1,
+    'GET async/all_posts/': 2,
+    'GET async/posts/<id>/': 2,
+}
+
+# Index each key query must use: (route, table) -> index. A dropped or unusable index fails the test.
+PLANS = {
+    ('GET all_posts/?limit=', 'api_post'): 'post_user_created_idx',
+    ('GET posts/<id>/comments/', 'api_comment'): 'comment_post_created_idx',
+    ('GET feed/', 'api_timelineentry'): 'timeline_user_created_idx',
+    ('POST posts/', 'api_user_following'): 'follow_to_from_idx',
+}
+
+
+def explain(sql: str) -> str:
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Tables this small are cheaper to scan, make the planner show the index it would use at scale
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                cursor.execute(f'EXPLAIN {sql}')
+            finally:
+                cursor.execute('RESET enable_seqscan')
+        else:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+
+class QueryRegressionTestCase(TestCase):
+    maxDiff = None
+
+    def setUp(self):
+        self.client = Client()
+        self.ids = itertools.count()
+        self.tester = User.objects.create_user(username='tester', email='tester@test.com', password='testerpassword',
+                                               is_staff=True)
+        self.token = "Bearer " + jwt.encode({'token_type': 'access',
+                                            'exp': 9999999999,
+                                            'iat': 0,
+                                            'jti': '1234567890',
+                                            'user_id': self.tester.id,
+                                            'username': self.tester.username},
+                                           os.environ.get('SECRET_KEY'), algorithm='HS256')
+
+    def create_users(self, count: int) -> list:
+        return User.objects.bulk_create([User(username=f'user{i}', email=f'user{i}@test.com', password=make_password(None))
+                                         for i in itertools.islice(self.ids, count)])
+
+    # Grow the data around the tester: `size` more followed users with `size` posts each, `size` more own
+    # posts, and `size` comments and likes on every new post
+    def grow(self, size: int):
+        users = self.create_users(size)
+        Follow.objects.bulk_create([Follow(from_user_id=self.tester.id, to_user_id=user.id) for user in users] +
+                                   [Follow(from_user_id=user.id, to_user_id=self.tester.id) for user in users])
+        posts = Post.objects.bulk_create([Post(user=author, title=f'Post {i}', desc=f'Description {i}')
+                                          for author in users + [self.tester] for i in range(size)])
+        Comment.objects.bulk_create([Comment(user=users[i], post=post, comment=f'Comment {i}')
+                                     for post in posts for i in range(size)])
+        Like.objects.bulk_create([Like(user_id=users[i].id, post_id=post.id) for post in posts for i in range(size)])
+        backfill_timeline(self.tester.id, [user.id for user in users])
+        reconcile_counters()
+        record_activity([post.id for post in posts], likes=size, comments=size)
+        compact_trending()
+
+    def get(self, path):
+        return lambda: self.client.get(path, HTTP_AUTHORIZATION=self.token)
+
+    def post(self, path, data=None):
+        return lambda: self.client.post(path, data or {}, content_type='application/json', HTTP_AUTHORIZATION=self.token)
+
+    # Every route of api/urls.py, with fresh targets for the writes
+    def routes(self):
+        strangers = self.create_users(3)
+        stranger_posts = Post.objects.bulk_create([Post(user=user, title='Stranger', desc='Post') for user in strangers])
+        own_post = Post.objects.filter(user=self.tester).order_by('id').first()
+        doomed = Post.objects.create(user=self.tester, title='Doomed', desc='Post')
+        refresh = str(IndexedRefreshToken.for_user(self.tester))
+        registration = next(self.ids)
+
+        return {
+            'POST authenticate/': ('token_obtain_pair', lambda: self.client.post(
+                reverse('token_obtain_pair'), {'email': 'tester@test.com', 'password': 'testerpassword'})),
+            'POST token/refresh/': ('token_refresh', lambda: self.client.post(
+                reverse('token_refresh'), {'refresh': refresh})),
+            'POST register/': ('register', lambda: self.client.post(reverse('register'), {
+                'username': f'register{registration}', 'email': f'register{registration}@test.com',
+                'password': f'register-password-{registration}'})),
+            'GET user/': ('get_user', self.get(reverse('get_user'))),
+            'POST follow/<id>/': ('follow_user', self.post(reverse('follow_user', args=[strangers[0].id]))),
+            'POST follow/batch/': ('follow_users', self.post(reverse('follow_users'),
+                                                             {'ids': [user.id for user in strangers[1:]]})),
+            'POST unfollow/<id>/': ('unfollow_user', self.post(reverse('unfollow_user', args=[strangers[0].id]))),
+            'POST unfollow/batch/': ('unfollow_users', self.post(reverse('unfollow_users'),
+                                                                 {'ids': [user.id for user in strangers[1:]]})),
+            'POST posts/': ('create_post', self.post(reverse('create_post'), {'title': 'New', 'desc': 'Post'})),
+            'GET posts/<id>/': ('get_or_delete_post', self.get(reverse('get_or_delete_post', args=[own_post.id]))),
+            'DELETE posts/<id>/': ('get_or_delete_post', lambda: self.client.delete(
+                reverse('get_or_delete_post', args=[doomed.id]), HTTP_AUTHORIZATION=self.token)),
+            'GET posts/<id>/comments/': ('get_post_comments',
+                                         self.get(reverse('get_post_comments', args=[own_post.id]))),
+            'POST like/<id>/': ('like_post', self.post(reverse('like_post', args=[stranger_posts[0].id]))),
+            'POST like/batch/': ('like_posts', self.post(reverse('like_posts'),
+                                                         {'ids': [post.id for post in stranger_posts[1:]]})),
+            'POST unlike/<id>/': ('unlike_post', self.post(reverse('unlike_post', args=[stranger_posts[0].id]))),
+            'POST unlike/batch/': ('unlike_posts', self.post(reverse('unlike_posts'),
+                                                             {'ids': [post.id for post in stranger_posts[1:]]})),
+            'POST comment/<id>/': ('comment_post', self.post(reverse('comment_post', args=[own_post.id]),
+                                                             {'comment': 'Comment'})),
+            'GET all_posts/': ('get_posts', self.get(reverse('get_posts'))),
+            'GET all_posts/?limit=': ('get_posts', self.get(reverse('get_posts') + '?limit=5')),
+            'GET export/': ('export_posts', self.get(reverse('export_posts'))),
+            'GET feed/': ('get_feed', self.get(reverse('get_feed'))),
+            'GET search/': ('search', self.get(reverse('search') + '?q=post')),
+            'GET trending/': ('get_trending', self.get(reverse('get_trending'))),
+            'GET cache/stats/': ('get_post_cache_stats', self.get(reverse('get_post_cache_stats'))),
+            'GET db/stats/': ('get_db_stats', self.get(reverse('get_db_stats'))),
+            'GET async/user/': ('async_get_user', self.get(reverse('async_get_user'))),
+            'GET async/all_posts/': ('async_get_posts', self.get(reverse('async_get_posts'))),
+            'GET async/posts/<id>/': ('async_get_or_delete_post',
+                                      self.get(reverse('async_get_or_delete_post', args=[own_post.id]))),
+        }
+
+    # Run every route once on an empty cache, returning the queries each ran
+    def measure(self) -> dict:
+        captured = {}
+        for label, (name, call) in self.routes().items():
+            cache.clear()
+            # Otherwise whether the refresh reads new blacklist rows depends on the time since the last read
+            revoked_jtis.reset()
+            with CaptureQueriesContext(connection) as queries:
+                response = call()
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertLess(response.status_code, 400, label)
+            captured[label] = [query['sql'] for query in queries.captured_queries]
+        return captured
+
+    def test_every_route_covered(self):
+        self.grow(1)
+        names = {name for name, call in self.routes().values()}
+        self.assertEqual({pattern.name for pattern in urls.urlpatterns} - names, set())
+        self.assertEqual(set(self.routes()), set(MAX_QUERIES))
+
+    def test_query_counts_constant(self):
+        self.grow(2)
+        small = {label: len(queries) for label, queries in self.measure().items()}
+        self.grow(8)
+        large = {label: len(queries) for label, queries in self.measure().items()}
+
+        self.assertEqual(large, small)
+        for label, count in large.items():
+            self.assertLessEqual(count, MAX_QUERIES[label], label)
+
+    def test_query_plans(self):
+        self.grow(4)
+        captured = self.measure()
+        for (label, table), index in PLANS.items():
+            with self.subTest(label=label, table=table):
+                sql = next(sql for sql in captured[label] if sql.startswith('SELECT') and f'"{table}"' in sql)
+                self.assertIn(index, explain(sql))
+
+    def test_migration_matches_index_definitions(self):
+        # Migration 0007 keeps a frozen copy of api.indexes, which the benchmark and the models use
+        frozen = import_module('api.migrations.0007_access_pattern_indexes').access_pattern_indexes(apps)
+        current = access_pattern_indexes()
+        self.assertEqual([(model._meta.db_table, index.deconstruct()) for model, index in frozen],
+                         [(model._meta.db_table, index.deconstruct()) for model, index in current])
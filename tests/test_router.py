@@ -0,0 +1,161 @@
+import asyncio
+import os
+
+import jwt
+from django.core.cache import cache
+from django.db import connections
+from django.test import AsyncClient, TestCase, Client, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from api import async_views
+from api.cache import primary_pin_key
+from api.db.router import PrimaryReplicaRouter, primary_reads, routing_context
+from api.middleware import ReplicaStickinessMiddleware
+from api.models import User, Post, Follow
+from api.tokens import IndexedRefreshToken, revoked_jtis
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_STICKY_SECONDS=60)
+class ReplicaRoutingTestCase(TestCase):
+    # An in-memory SQLite database, private to this process, stands in for a replica. It is registered and
+    # migrated for this class only and never replicated to: anything written through the API only shows
+    # up where the router sends reads to the primary.
+    @classmethod
+    def setUpClass(cls):
+        default = connections.settings['default']
+        connections.settings['replica'] = {
+            **default,
+            'ENGINE': 'api.db.sqlite3',
+            'NAME': ':memory:',
+            'TEST': {**default['TEST'], 'NAME': None, 'MIRROR': None},
+        }
+        connections['replica'].creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # Declared here rather than on the class, the test runner checks the class's databases before this runs
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        try:
+            super().tearDownClass()
+        finally:
+            del cls.databases
+            connections['replica'].close()
+            del connections['replica']
+            del connections.settings['replica']
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.tester1 = User.objects.create_user(username='tester1', email='tester1@test.com', password='tester1')
+        self.tester2 = User.objects.create_user(username='tester2', email='tester2@test.com', password='tester2')
+        self.tester3 = User.objects.create_user(username='tester3', email='tester3@test.com', password='tester3')
+        self.post1 = Post.objects.create(title="Test 1", desc="Description 1", user=self.tester2)
+        # Start the replica in sync with the primary
+        User.objects.using('replica').bulk_create(User.objects.all())
+        Post.objects.using('replica').bulk_create(Post.objects.all())
+        for tester in (self.tester1, self.tester2, self.tester3):
+            tester.token = jwt.encode({'token_type': 'access',
+                                       'exp': 9999999999,
+                                       'iat': 0,
+                                       'jti': '1234567890',
+                                       'user_id': tester.id,
+                                       'username': tester.username}, os.environ.get('SECRET_KEY'), algorithm='HS256')
+
+    def get_likes(self, tester):
+        response = self.client.get(reverse('get_or_delete_post', args=[self.post1.id]),
+                                   HTTP_AUTHORIZATION=f"Bearer {tester.token}")
+        self.assertEqual(response.status_code, 200)
+        return response.data['likes']
+
+    def test_router(self):
+        router = PrimaryReplicaRouter()
+        # Outside requests everything uses the primary
+        self.assertEqual(router.db_for_read(Post), 'default')
+        with routing_context() as state:
+            self.assertEqual(router.db_for_read(Post), 'replica')
+            self.assertEqual(router.db_for_write(Post), 'default')
+            self.assertTrue(state.wrote)
+            # Reads after a write see it
+            self.assertEqual(router.db_for_read(Post), 'default')
+        with routing_context(use_primary=True):
+            self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_router_primary_reads(self):
+        router = PrimaryReplicaRouter()
+        with routing_context() as state:
+            self.assertEqual(router.db_for_read(BlacklistedToken), 'default')
+            self.assertEqual(router.db_for_read(OutstandingToken), 'default')
+            with primary_reads():
+                self.assertEqual(router.db_for_read(User), 'default')
+            # Only the block reads the primary, the request is not pinned
+            self.assertEqual(router.db_for_read(User), 'replica')
+            self.assertFalse(state.wrote)
+
+    def test_deleted_user_rejected_on_write(self):
+        # The replica still has the user the primary already deleted
+        User.objects.filter(id=self.tester1.id).delete()
+        cache.clear()
+        response = self.client.post(reverse('like_post', args=[self.post1.id]),
+                                    HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 401)
+
+    def test_rotated_refresh_token_not_replayed(self):
+        refresh = str(IndexedRefreshToken.for_user(self.tester1))
+        response = self.client.post(reverse('token_refresh'), {'refresh': refresh})
+        self.assertEqual(response.status_code, 200)
+        # Another process, which did not see the rotation, checks the blacklist the replica has not received
+        revoked_jtis.reset()
+        response = self.client.post(reverse('token_refresh'), {'refresh': refresh})
+        self.assertEqual(response.status_code, 401)
+
+    def test_reads_from_replica(self):
+        Post.objects.filter(id=self.post1.id).update(likes_count=5)
+        self.assertEqual(self.get_likes(self.tester1), 0)
+
+    def test_read_your_writes(self):
+        response = self.client.post(reverse('like_post', args=[self.post1.id]),
+                                    HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(cache.get(primary_pin_key(self.tester1.id)))
+
+        # The writer sees the like, other users read the replica that has not caught up yet
+        self.assertEqual(self.get_likes(self.tester1), 1)
+        self.assertEqual(self.get_likes(self.tester3), 0)
+        # and the stale replica row was not cached for everyone
+        self.assertEqual(self.get_likes(self.tester1), 1)
+
+        # Once the window is over the writer reads from the replica again
+        cache.delete(primary_pin_key(self.tester1.id))
+        self.assertEqual(self.get_likes(self.tester1), 0)
+
+    def test_follow_counts_read_your_writes(self):
+        response = self.client.post(reverse('follow_user', args=[self.tester2.id]),
+                                    HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('get_user'), HTTP_AUTHORIZATION=f"Bearer {self.tester1.token}")
+        self.assertEqual(response.data['following'], 1)
+        self.assertTrue(Follow.objects.filter(from_user=self.tester1, to_user=self.tester2).exists())
+        self.assertFalse(Follow.objects.using('replica').exists())
+
+    def test_not_pinned_without_write(self):
+        self.get_likes(self.tester1)
+        self.assertIsNone(cache.get(primary_pin_key(self.tester1.id)))
+
+    async def test_async_read_your_writes(self):
+        middleware = ReplicaStickinessMiddleware(async_views.get_user)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+
+        client = AsyncClient()
+        token = f"Bearer {self.tester2.token}"
+        response = await client.get(reverse('async_get_or_delete_post', args=[self.post1.id]), AUTHORIZATION=token)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(cache.get(primary_pin_key(self.tester2.id)))
+
+        response = await client.delete(reverse('async_get_or_delete_post', args=[self.post1.id]), AUTHORIZATION=token)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(cache.get(primary_pin_key(self.tester2.id)))
+        # The replica still has the post, the pinned author reads the primary
+        response = await client.get(reverse('async_get_or_delete_post', args=[self.post1.id]), AUTHORIZATION=token)
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,127 @@
+import os
+
+import jwt
+from django.db import connection
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from api.counters import reconcile_counters
+from api.models import Comment, Post, User
+from api.search import search_posts, parse_query, decode_rank_cursor, encode_rank_cursor
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username='author', email='author@test.com', password='author')
+        self.reader = User.objects.create_user(username='reader', email='reader@test.com', password='reader')
+        self.token = 'Bearer ' + jwt.encode({'token_type': 'access',
+                                             'exp': 9999999999,
+                                             'iat': 0,
+                                             'jti': '1234567890',
+                                             'user_id': self.reader.id,
+                                             'username': self.reader.username}, os.environ.get('SECRET_KEY'), algorithm='HS256')
+        self.title = Post.objects.create(user=self.author, title='Mountain hiking', desc='A long walk')
+        self.desc = Post.objects.create(user=self.author, title='Weekend', desc='We went hiking in the hills')
+        self.comment = Post.objects.create(user=self.author, title='Photos', desc='Some pictures')
+        Comment.objects.create(user=self.reader, post=self.comment, comment='Great hiking spot')
+        self.unrelated = Post.objects.create(user=self.author, title='Cooking', desc='Pasta recipe')
+        reconcile_counters()
+
+    def search(self, **params):
+        return self.client.get(reverse('search'), params, HTTP_AUTHORIZATION=self.token)
+
+    def test_ranked_matches(self):
+        # Title matches outrank description matches, which outrank comment matches
+        ids, next_cursor = search_posts('hiking')
+        self.assertEqual(ids, [self.title.id, self.desc.id, self.comment.id])
+        self.assertIsNone(next_cursor)
+
+    def test_stemming_and_all_terms(self):
+        self.assertEqual(search_posts('hikes')[0], search_posts('hiking')[0])
+        self.assertEqual(search_posts('hiking hills')[0], [self.desc.id])
+        self.assertEqual(search_posts('hiking pasta')[0], [])
+
+    def test_terms_match_across_post_and_comments(self):
+        # One term in the post, the other in a comment, or both spread over two comments
+        self.assertEqual(search_posts('photos great')[0], [self.comment.id])
+        Comment.objects.create(user=self.author, post=self.unrelated, comment='Tasty')
+        Comment.objects.create(user=self.reader, post=self.unrelated, comment='Quick dinner')
+        self.assertEqual(search_posts('tasty dinner')[0], [self.unrelated.id])
+        self.assertEqual(search_posts('tasty hiking')[0], [])
+
+    def test_index_maintained(self):
+        post = Post.objects.create(user=self.author, title='Sailing', desc='Boats')
+        self.assertEqual(search_posts('sailing')[0], [post.id])
+
+        post.title = 'Rowing'
+        post.save()
+        self.assertEqual(search_posts('sailing')[0], [])
+        self.assertEqual(search_posts('rowing')[0], [post.id])
+
+        # Counter updates leave the text alone
+        Post.objects.filter(id=post.id).update(likes_count=5)
+        self.assertEqual(search_posts('rowing')[0], [post.id])
+
+        Comment.objects.bulk_create([Comment(user=self.reader, post=post, comment='Kayak trip')])
+        self.assertEqual(search_posts('kayak')[0], [post.id])
+        post.delete()
+        self.assertEqual(search_posts('rowing')[0], [])
+        self.assertEqual(search_posts('kayak')[0], [])
+
+    def test_query_syntax_is_plain_text(self):
+        self.assertEqual(search_posts('hiking OR "pasta" NOT -*')[0], [])
+        self.assertEqual(search_posts('"hiking"')[0], [self.title.id, self.desc.id, self.comment.id])
+        for query in ('', '  ', '"*"', None):
+            with self.assertRaises(ValueError):
+                parse_query(query)
+
+    def test_cursor_pagination(self):
+        posts = Post.objects.bulk_create([Post(user=self.author, title=f'Trail {i}', desc='trail ' * (i % 3 + 1))
+                                          for i in range(7)])
+        seen, cursor = [], None
+        while True:
+            ids, cursor = search_posts('trail', cursor, limit=3)
+            seen += ids
+            if cursor is None:
+                break
+        self.assertEqual(sorted(seen), sorted(post.id for post in posts))
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(seen, search_posts('trail', limit=10)[0])
+
+    def test_rank_cursor(self):
+        rank = 1 / 3
+        self.assertEqual(decode_rank_cursor(encode_rank_cursor(rank, 7)), (rank, 7))
+        with self.assertRaises(ValueError):
+            decode_rank_cursor('bad')
+
+    def test_search_view(self):
+        response = self.search(q='hiking', limit=2)
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([post['id'] for post in results], [self.title.id, self.desc.id])
+        self.assertEqual(results[0]['user'], 'author')
+
+        response = self.search(q='hiking', cursor=response.data['next'])
+        self.assertEqual([post['id'] for post in response.data['results']], [self.comment.id])
+        self.assertEqual(response.data['results'][0]['comments'][0]['comment'], 'Great hiking spot')
+        self.assertEqual(response.data['results'][0]['comments_count'], 1)
+        self.assertIsNone(response.data['next'])
+
+    def test_search_view_errors(self):
+        self.assertEqual(self.search().status_code, 400)
+        self.assertEqual(self.search(q='hiking', cursor='bad').status_code, 400)
+        self.assertEqual(self.search(q='hiking', limit=0).status_code, 400)
+        self.assertEqual(self.client.get(reverse('search'), {'q': 'hiking'}).status_code, 401)
+
+    def test_uses_index(self):
+        sql = 'EXPLAIN QUERY PLAN SELECT rowid FROM api_post_fts WHERE api_post_fts MATCH %s'
+        if connection.vendor == 'postgresql':
+            sql = "EXPLAIN SELECT id FROM api_post WHERE search_vector @@ websearch_to_tsquery('english', %s)"
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # The table is small enough to scan, show the index the planner would use at scale
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(sql, ['hiking'])
+            plan = ' '.join(str(column) for row in cursor.fetchall() for column in row)
+        self.assertIn('post_search_idx' if connection.vendor == 'postgresql' else 'VIRTUAL TABLE', plan)
@@ -0,0 +1,27 @@
+from django.test import TestCase
+
+from api.counters import reconcile_counters
+from api.models import User, Post, Comment, Follow, Like, TimelineEntry
+from api.seed import seed_graph
+
+
+class SeedGraphTestCase(TestCase):
+    def test_seed_graph(self):
+        counts = seed_graph(users=200, posts=3, follows=5, likes=1000, comments=4)
+        self.assertEqual(counts, {
+            'users': User.objects.count(),
+            'follows': Follow.objects.count(),
+            'posts': Post.objects.count(),
+            'likes': Like.objects.count(),
+            'comments': Comment.objects.count(),
+            'timeline_entries': TimelineEntry.objects.count(),
+        })
+        self.assertEqual(counts['users'], 200)
+        self.assertGreater(counts['likes'], 0)
+        self.assertGreater(counts['timeline_entries'], 0)
+        # Stored counters already match the relation tables
+        self.assertTrue(all(repaired == 0 for repaired in reconcile_counters().values()))
+
+        # Followers follow a power law: the most followed user is far above the median
+        followers = sorted(User.objects.values_list('followers_count', flat=True), reverse=True)
+        self.assertGreater(followers[0], 10 * max(followers[len(followers) // 2], 1))
@@ -0,0 +1,108 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.test import TestCase, Client, override_settings
+from django.utils.http import http_date
+
+from api.staticfiles import static_files, IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL
+
+CSS = 'body { background: url("logo.svg"); }\n' + ''.join(f'.item-{i} {{ margin: {i}px; }}\n' for i in range(50))
+SVG = '<svg xmlns="http://www.w3.org/2000/svg">' + '<rect width="1" height="1"/>' * 40 + '</svg>'
+
+
+class StaticFilesTestCase(TestCase):
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source)
+        self.addCleanup(shutil.rmtree, self.root)
+        os.makedirs(os.path.join(self.source, 'app'))
+        for name, content in {'app/site.css': CSS, 'app/logo.svg': SVG, 'app/tiny.txt': 'tiny'}.items():
+            with open(os.path.join(self.source, name), 'w') as file:
+                file.write(content)
+        with open(os.path.join(self.source, 'app/photo.png'), 'wb') as file:
+            file.write(os.urandom(1024))
+
+        settings = override_settings(STATIC_ROOT=self.root, STATICFILES_DIRS=[self.source],
+                                     STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'])
+        settings.enable()
+        self.addCleanup(settings.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        static_files.reset()
+        self.addCleanup(static_files.reset)
+        self.client = Client()
+
+    def hashed(self, name: str) -> str:
+        return staticfiles_storage.stored_name(name)
+
+    def test_collectstatic_precompresses(self):
+        for name in ('app/site.css', 'app/logo.svg', self.hashed('app/site.css')):
+            with gzip.open(os.path.join(self.root, name + '.gz')) as file:
+                with open(os.path.join(self.root, name), 'rb') as original:
+                    self.assertEqual(file.read(), original.read())
+        # Too small to gain anything, or incompressible
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'app/tiny.txt.gz')))
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'app/photo.png.gz')))
+
+    def test_serve_gzip_variant(self):
+        response = self.client.get('/static/app/site.css', HTTP_ACCEPT_ENCODING='br, gzip;q=0.8')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertNotIn('Content-Disposition', response)
+        body = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        self.assertEqual(gzip.decompress(body).decode(), CSS)
+
+    def test_serve_identity(self):
+        for accept_encoding in ('', 'gzip;q=0', 'identity'):
+            response = self.client.get('/static/app/site.css', HTTP_ACCEPT_ENCODING=accept_encoding)
+            self.assertNotIn('Content-Encoding', response)
+            self.assertEqual(b''.join(response.streaming_content).decode(), CSS)
+
+        response = self.client.get('/static/app/photo.png', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertNotIn('Accept-Encoding', response.get('Vary', ''))
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+    def test_hashed_names_immutable(self):
+        hashed = self.hashed('app/site.css')
+        self.assertNotEqual(hashed, 'app/site.css')
+        self.assertEqual(self.client.get(f'/static/{hashed}')['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(self.client.get('/static/app/site.css')['Cache-Control'], REVALIDATE_CACHE_CONTROL)
+        # References inside the stylesheet point at the hashed names too
+        content = b''.join(self.client.get(f'/static/{hashed}').streaming_content).decode()
+        self.assertIn(os.path.basename(self.hashed('app/logo.svg')), content)
+
+    def test_conditional_get(self):
+        response = self.client.get('/static/app/logo.svg', HTTP_ACCEPT_ENCODING='gzip')
+        etag = response['ETag']
+
+        response = self.client.get('/static/app/logo.svg', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        # The identity representation has its own validator
+        response = self.client.get('/static/app/logo.svg', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/static/app/logo.svg', HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, 304)
+
+    def test_index_skips_filesystem(self):
+        self.client.get('/static/app/site.css')
+        os.remove(os.path.join(self.root, 'app/tiny.txt'))
+        # Neither hits nor misses stat the filesystem once the index is built
+        with self.assertRaises(FileNotFoundError):
+            self.client.get('/static/app/tiny.txt')
+        self.assertEqual(self.client.get('/static/app/missing.css').status_code, 404)
+        self.assertEqual(self.client.get('/static/staticfiles.json').status_code, 404)
+        self.assertEqual(self.client.get('/static/app/site.css.gz').status_code, 404)
+
+    def test_unsafe_methods(self):
+        self.assertEqual(self.client.post('/static/app/site.css').status_code, 405)
+        self.assertEqual(self.client.head('/static/app/site.css').status_code, 200)
@@ -0,0 +1,82 @@
+import json
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, Client, override_settings
+
+from swagger.schema import schema_cache, schema_fingerprint, SchemaCache
+
+
+class SwaggerSchemaTestCase(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings = override_settings(SCHEMA_ROOT=self.root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        schema_cache.reset()
+        self.addCleanup(schema_cache.reset)
+        self.client = Client()
+
+    def test_schema_json(self):
+        response = self.client.get('/swagger.json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json; charset=utf-8')
+        self.assertEqual(response['ETag'], f'"{schema_fingerprint()}-json"')
+        schema = json.loads(response.content)
+        self.assertEqual(schema['info']['title'], 'Reunion API')
+        self.assertIn('/posts/', schema['paths'])
+        # Rendered without a request, the UI uses the host it was loaded from
+        self.assertNotIn('host', schema)
+
+    def test_schema_yaml(self):
+        response = self.client.get('/swagger.yaml')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/yaml; charset=utf-8')
+        self.assertEqual(response['ETag'], f'"{schema_fingerprint()}-yaml"')
+        self.assertIn(b'title: Reunion API', response.content)
+
+    def test_ui_pages(self):
+        for path in ('/swagger/', '/swagger/redoc/'):
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+
+            response = self.client.get(path, {'format': 'openapi'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, schema_cache.get().json)
+
+    def test_conditional_get(self):
+        etag = self.client.get('/swagger.json')['ETag']
+        response = self.client.get('/swagger.json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get('/swagger.yaml', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_generated_once(self):
+        with mock.patch.object(SchemaCache, 'generate', wraps=schema_cache.generate) as generate:
+            for path in ('/swagger.json', '/swagger.yaml', '/swagger.json', '/swagger/?format=openapi'):
+                self.client.get(path)
+        self.assertEqual(generate.call_count, 1)
+
+    def test_build_loaded(self):
+        call_command('generate_schema', stdout=mock.Mock())
+        schema_cache.reset()
+        with mock.patch.object(SchemaCache, 'generate') as generate:
+            response = self.client.get('/swagger.json')
+        generate.assert_not_called()
+        self.assertEqual(response['ETag'], f'"{schema_fingerprint()}-json"')
+
+        # A build of other sources is ignored
+        with mock.patch('swagger.schema.schema_fingerprint', return_value='0' * 16):
+            schema_cache.reset()
+            self.assertIsNone(schema_cache.load('0' * 16))
+            self.assertEqual(schema_cache.get().fingerprint, '0' * 16)
+
+    def test_fingerprint_tracks_sources(self):
+        fingerprint = schema_fingerprint()
+        self.assertEqual(schema_fingerprint(), fingerprint)
+        with mock.patch('swagger.schema.SCHEMA_SOURCES', ('api.urls', 'api.serializers')):
+            self.assertNotEqual(schema_fingerprint(), fingerprint)
@@ -0,0 +1,62 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, Client
+from django.urls import reverse
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+from api.models import User
+from api.tokens import IndexedRefreshToken, revoked_jtis
+
+
+class TestTokenRefresh(TestCase):
+    def setUp(self):
+        revoked_jtis.reset()
+        self.client = Client()
+        self.login_url = reverse('token_obtain_pair')
+        self.refresh_url = reverse('token_refresh')
+
+        self.tuser1 = User.objects.create_user(email="testuser1@test.com", username="testuser1",
+                                               password="testpassword1")
+        response = self.client.post(self.login_url, {"email": self.tuser1.email, "password": "testpassword1"})
+        self.refresh_token = response.data['refresh']
+
+    def test_refresh_rotation(self):
+        response = self.client.post(self.refresh_url, {"refresh": self.refresh_token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data.keys(), {"refresh", "access"})
+
+        # The rotated token is known to this process, no blacklist query is needed
+        with self.assertNumQueries(0):
+            response = self.client.post(self.refresh_url, {"refresh": self.refresh_token})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data.get('detail'), 'Token is blacklisted')
+
+    def test_refresh_revoked_by_other_process(self):
+        IndexedRefreshToken(self.refresh_token).blacklist()
+        revoked_jtis.reset()
+
+        response = self.client.post(self.refresh_url, {"refresh": self.refresh_token})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data.get('detail'), 'Token is blacklisted')
+
+
+class TestPruneTokens(TestCase):
+    def setUp(self):
+        self.tuser1 = User.objects.create_user(email="testuser1@test.com", username="testuser1",
+                                               password="testpassword1")
+        expired = aware_utcnow() - timedelta(days=1)
+        for i in range(5):
+            token = OutstandingToken.objects.create(user=self.tuser1, jti=f'expired{i}', token='', expires_at=expired)
+            if i % 2:
+                BlacklistedToken.objects.create(token=token)
+        OutstandingToken.objects.create(user=self.tuser1, jti='valid', token='', expires_at=aware_utcnow() + timedelta(days=1))
+
+    def test_prune_tokens(self):
+        out = StringIO()
+        call_command('prune_tokens', '--chunk-size', '2', stdout=out)
+        self.assertEqual(out.getvalue().strip(), '5 outstanding and 2 blacklisted tokens deleted')
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), ['valid'])
+        self.assertFalse(BlacklistedToken.objects.exists())
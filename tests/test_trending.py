@@ -0,0 +1,127 @@
+import os
+from datetime import timedelta
+from unittest import mock
+
+import jwt
+from django.core.cache import cache
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.utils import timezone
+
+from api.models import Post, PostActivity, TrendingPost, User
+from api.trending import BUCKET, bucket_start, compact_trending, record_activity
+
+
+class TrendingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create_user(username='author', email='author@test.com', password='author')
+        self.reader = User.objects.create_user(username='reader', email='reader@test.com', password='reader')
+        self.token = 'Bearer ' + jwt.encode({'token_type': 'access',
+                                             'exp': 9999999999,
+                                             'iat': 0,
+                                             'jti': '1234567890',
+                                             'user_id': self.reader.id,
+                                             'username': self.reader.username}, os.environ.get('SECRET_KEY'), algorithm='HS256')
+        self.posts = [Post.objects.create(user=self.author, title=f'Post {i}', desc=f'Description {i}') for i in range(4)]
+
+    def post(self, name, *args, data=None):
+        return self.client.post(reverse(name, args=args), data or {}, content_type='application/json',
+                                HTTP_AUTHORIZATION=self.token)
+
+    def activity(self, post):
+        return PostActivity.objects.filter(post=post).values_list('likes', 'comments').first()
+
+    # Activity recorded `hours` ago
+    def record_at(self, hours, post_ids, **counts):
+        with mock.patch('api.trending.timezone.now', return_value=timezone.now() - timedelta(hours=hours)):
+            record_activity(post_ids, **counts)
+
+    def test_views_record_activity(self):
+        first, second = self.posts[0].id, self.posts[1].id
+        self.post('like_post', first)
+        self.post('comment_post', first, data={'comment': 'Nice'})
+        self.post('like_posts', data={'ids': [first, second]})
+        self.assertEqual(self.activity(first), (1, 1))
+        self.assertEqual(self.activity(second), (1, 0))
+        # Every event of the hour lands in one bucket per post
+        self.assertEqual(PostActivity.objects.count(), 2)
+        self.assertEqual(PostActivity.objects.get(post_id=first).bucket, bucket_start(timezone.now()))
+
+        self.post('unlike_post', first)
+        self.post('unlike_posts', data={'ids': [second]})
+        self.assertEqual(self.activity(first), (0, 1))
+        self.assertEqual(self.activity(second), (0, 0))
+
+        # Rejected events are not counted
+        self.post('like_post', 0)
+        self.post('unlike_post', second)
+        self.assertEqual(PostActivity.objects.count(), 2)
+
+    def test_record_activity_upserts(self):
+        ids = [post.id for post in self.posts]
+        with self.assertNumQueries(1):
+            record_activity(ids, likes=2)
+        record_activity(ids[:2], comments=1)
+        with self.assertNumQueries(0):
+            record_activity([], likes=1)
+        self.assertEqual(self.activity(self.posts[0]), (2, 1))
+        self.assertEqual(self.activity(self.posts[3]), (2, 0))
+
+        self.record_at(2, ids[:1], likes=1)
+        self.assertEqual(PostActivity.objects.filter(post=self.posts[0]).count(), 2)
+
+    def test_compaction(self):
+        first, second, third, fourth = [post.id for post in self.posts]
+        record_activity([first], likes=3)
+        record_activity([second], comments=2)
+        self.record_at(5, [third], likes=1)
+        # Outside a 24 hour window
+        self.record_at(30, [fourth], likes=10)
+        self.record_at(30, [third], likes=10)
+        # Likes taken back leave nothing to rank
+        record_activity([fourth], likes=1)
+        record_activity([fourth], likes=-1)
+
+        self.assertEqual(compact_trending(window_hours=24, size=10), (3, 2))
+        trending = list(TrendingPost.objects.order_by('rank').values_list('rank', 'post_id', 'score', 'likes', 'comments'))
+        # A comment counts twice as much as a like
+        self.assertEqual(trending, [(1, second, 4, 0, 2), (2, first, 3, 3, 0), (3, third, 1, 1, 0)])
+        self.assertFalse(PostActivity.objects.filter(bucket__lt=bucket_start(timezone.now()) - BUCKET * 23).exists())
+
+        # The ranking is replaced, not merged
+        self.assertEqual(compact_trending(window_hours=2, size=1), (1, 1))
+        self.assertEqual(list(TrendingPost.objects.values_list('rank', 'post_id')), [(1, second)])
+
+    def test_deleted_post_leaves_trending(self):
+        record_activity([self.posts[0].id], likes=1)
+        compact_trending()
+        self.posts[0].delete()
+        self.assertFalse(TrendingPost.objects.exists())
+        self.assertFalse(PostActivity.objects.exists())
+
+    def test_trending_view(self):
+        self.post('like_posts', data={'ids': [post.id for post in self.posts[:3]]})
+        self.post('comment_post', self.posts[2].id, data={'comment': 'Nice'})
+        compact_trending()
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('get_trending'), HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([result['post']['id'] for result in results],
+                         [self.posts[2].id, self.posts[1].id, self.posts[0].id])
+        self.assertEqual(results[0]['rank'], 1)
+        self.assertEqual(results[0]['score'], 3)
+        self.assertEqual((results[0]['likes'], results[0]['comments']), (1, 1))
+        self.assertEqual(results[0]['post']['user'], 'author')
+        self.assertEqual(results[0]['post']['comments_count'], 1)
+        self.assertNotIn('comments', results[0]['post'])
+
+        response = self.client.get(reverse('get_trending'), {'limit': 1}, HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_trending_view_errors(self):
+        self.assertEqual(self.client.get(reverse('get_trending'), {'limit': 0}, HTTP_AUTHORIZATION=self.token).status_code, 400)
+        self.assertEqual(self.client.get(reverse('get_trending')).status_code, 401)
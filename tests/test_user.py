@@ -1,10 +1,19 @@
 import os
+import threading
+from unittest import mock
 
 import jwt
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import cache
 from django.test import TestCase, Client
 from django.urls import reverse
 
-from api.models import User
+from api.counters import reconcile_counters
+from api.hashing import PasswordHashPool, PasswordHashPoolBusy, hash_pool
+from api.cache import user_cache_key
+from api.db.insert import insert_missing_pairs
+from api.models import Follow, User
 
 
 class TestUserAuth(TestCase):
@@ -221,6 +230,8 @@ class TestUserUnfollow(TestCase):
 
         self.tuser1.following.add(self.tuser2)
         self.tuser1.following.add(self.tuser3)
+        # Follows added directly through the ORM bypass the stored counters
+        reconcile_counters()
 
     def test_unfollow_user(self):
         response = self.client.post(self.login_url, {"email": self.tuser1.email, "password": "testpassword1"})
@@ -292,3 +303,250 @@ class TestUserUnfollow(TestCase):
         response = self.client.post(f"{self.unfollow_url}{self.tuser2.id}/", HTTP_AUTHORIZATION=f'Bearer 123')
         self.assertEqual(response.status_code, 401)
         self.assertEqual(response.data.get('detail'), 'Given token not valid for any token type')
+
+
+class TestUserBatchFollow(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.login_url = reverse('token_obtain_pair')
+        self.user_url = reverse('get_user')
+        self.follow_users_url = reverse('follow_users')
+        self.unfollow_users_url = reverse('unfollow_users')
+
+        self.tuser1 = User.objects.create_user(email="testuser1@test.com", username="testuser1",
+                                               password="testpassword1")
+        self.tuser2 = User.objects.create_user(email="testuser2@test.com", username="testuser2",
+                                               password="testpassword2")
+        self.tuser3 = User.objects.create_user(email="testuser3@test.com", username="testuser3",
+                                               password="testpassword3")
+
+        response = self.client.post(self.login_url, {"email": self.tuser1.email, "password": "testpassword1"})
+        self.access_token = response.data['access']
+
+    def test_follow_users(self):
+        response = self.client.post(self.follow_users_url, {'ids': [self.tuser2.id, self.tuser3.id, self.tuser1.id, 999]},
+                                    content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'results': {str(self.tuser2.id): 'followed',
+                                                       str(self.tuser3.id): 'followed',
+                                                       str(self.tuser1.id): 'self',
+                                                       '999': 'not_found'}})
+
+        response = self.client.post(self.follow_users_url, {'ids': [self.tuser2.id]},
+                                    content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        self.assertEqual(response.json(), {'results': {str(self.tuser2.id): 'already_following'}})
+
+        response = self.client.get(self.user_url, HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        self.assertEqual(response.data['following'], 2)
+        self.assertEqual(User.objects.get(id=self.tuser2.id).followers_count, 1)
+        self.assertEqual(self.tuser1.following.count(), 2)
+
+    def test_follow_users_counts_inserted_follows(self):
+        # A follow a concurrent request inserted is reported and counted by that request only
+        Follow.objects.create(from_user_id=self.tuser1.id, to_user_id=self.tuser2.id)
+        response = self.client.post(self.follow_users_url, {'ids': [self.tuser2.id, self.tuser3.id]},
+                                    content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        self.assertEqual(response.json(), {'results': {str(self.tuser2.id): 'already_following',
+                                                       str(self.tuser3.id): 'followed'}})
+        self.assertEqual(User.objects.get(id=self.tuser1.id).following_count, 1)
+        self.assertEqual(User.objects.get(id=self.tuser2.id).followers_count, 0)
+
+    def test_insert_missing_pairs(self):
+        with self.assertNumQueries(1):
+            inserted = insert_missing_pairs(Follow, 'from_user', self.tuser1.id, 'to_user', [self.tuser2.id, self.tuser3.id])
+        self.assertEqual(inserted, {self.tuser2.id, self.tuser3.id})
+        self.assertEqual(insert_missing_pairs(Follow, 'from_user', self.tuser1.id, 'to_user', [self.tuser2.id]), set())
+        with self.assertNumQueries(0):
+            self.assertEqual(insert_missing_pairs(Follow, 'from_user', self.tuser1.id, 'to_user', []), set())
+
+    def test_unfollow_users(self):
+        self.client.post(self.follow_users_url, {'ids': [self.tuser2.id]},
+                         content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+
+        response = self.client.post(self.unfollow_users_url, {'ids': [self.tuser2.id, self.tuser3.id]},
+                                    content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'results': {str(self.tuser2.id): 'unfollowed',
+                                                       str(self.tuser3.id): 'not_following'}})
+
+        response = self.client.get(self.user_url, HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        self.assertEqual(response.data['following'], 0)
+        self.assertEqual(User.objects.get(id=self.tuser2.id).followers_count, 0)
+
+    def test_follow_users_invalid_ids(self):
+        response = self.client.post(self.follow_users_url, {'ids': []},
+                                    content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ids', response.data.get('errors'))
+
+        response = self.client.post(self.follow_users_url, {'ids': list(range(101))},
+                                    content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        self.assertEqual(response.status_code, 400)
+
+    def test_follow_users_missing_token(self):
+        response = self.client.post(self.follow_users_url, {'ids': [self.tuser2.id]}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data.get('detail'), 'Authentication credentials were not provided.')
+
+
+class TestUserCachedAuth(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.login_url = reverse('token_obtain_pair')
+        self.user_url = reverse('get_user')
+        self.posts_url = reverse('get_posts')
+
+        self.tuser1 = User.objects.create_user(email="testuser1@test.com", username="testuser1",
+                                               password="testpassword1")
+        self.tuser2 = User.objects.create_user(email="testuser2@test.com", username="testuser2",
+                                               password="testpassword2")
+
+        response = self.client.post(self.login_url, {"email": self.tuser1.email, "password": "testpassword1"})
+        self.access_token = response.data['access']
+        # Creating the users left invalidation tombstones, let them expire
+        cache.clear()
+
+    def test_get_user_cached(self):
+        response = self.client.get(self.user_url, HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.user_url, HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        self.assertEqual(response.data['username'], self.tuser1.username)
+
+    def test_get_user_cache_invalidated(self):
+        self.client.get(self.user_url, HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+
+        self.tuser1.username = "renamed"
+        self.tuser1.save()
+        response = self.client.get(self.user_url, HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        self.assertEqual(response.data['username'], "renamed")
+
+        self.tuser1.is_active = False
+        self.tuser1.save()
+        response = self.client.get(self.user_url, HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        self.assertEqual(response.status_code, 401)
+
+    def test_stateless_auth(self):
+        # Endpoints that only need the user id read it from the token without a user query,
+        # only the conditional GET validators and the posts are read
+        with self.assertNumQueries(2):
+            response = self.client.get(self.posts_url, HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_cache_holds_no_password(self):
+        self.client.get(self.user_url, HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        cached = cache.get(user_cache_key(self.tuser1.id))
+        self.assertEqual(cached['username'], self.tuser1.username)
+        self.assertNotIn('password', cached)
+
+    def test_write_with_deleted_user(self):
+        self.tuser1.delete()
+        response = self.client.post(reverse('create_post'), {'title': 'Title', 'desc': 'Desc'},
+                                    HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data.get('code'), 'user_not_found')
+        response = self.client.post(reverse('like_post', args=[1]), HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        self.assertEqual(response.status_code, 401)
+
+    def test_write_user_check_cached(self):
+        self.client.get(self.user_url, HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        # The cached user covers the check, only the follow target is looked up
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse('follow_user', args=[999]), HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        self.assertEqual(response.status_code, 404)
+
+
+class TestPasswordHashPool(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.login_url = reverse('token_obtain_pair')
+        self.register_url = reverse('register')
+        self.tuser1 = User.objects.create_user(email="testuser1@test.com", username="testuser1",
+                                               password="testpassword1")
+
+    def test_pool_rejects_when_full(self):
+        pool = PasswordHashPool(workers=1, queue_depth=0)
+        started = threading.Event()
+        release = threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        caller = threading.Thread(target=pool.run, args=(block,))
+        caller.start()
+        started.wait()
+        with self.assertRaises(PasswordHashPoolBusy):
+            pool.run(make_password, "testpassword1")
+
+        release.set()
+        caller.join()
+        self.assertTrue(pool.run(make_password, "testpassword1").startswith('pbkdf2_sha256$'))
+        pool.shutdown()
+
+    def test_hashing_off_request_thread(self):
+        threads = []
+        encode = PBKDF2PasswordHasher.encode
+
+        def record(*args):
+            threads.append(threading.current_thread())
+            return encode(*args)
+
+        with mock.patch.object(PBKDF2PasswordHasher, 'encode', record):
+            response = self.client.post(self.login_url, {"email": self.tuser1.email, "password": "testpassword1"})
+            self.assertEqual(response.status_code, 200)
+            # Unknown users are hashed on the pool too, so they take as long as a wrong password
+            response = self.client.post(self.login_url, {"email": "nobody@test.com", "password": "testpassword1"})
+            self.assertEqual(response.status_code, 401)
+        self.assertEqual(len(threads), 2)
+        self.assertTrue(all(thread != threading.current_thread() for thread in threads))
+
+    def test_login_goes_through_auth_backends(self):
+        failed = []
+
+        def record(sender, credentials, **kwargs):
+            failed.append(credentials['email'])
+
+        user_login_failed.connect(record)
+        try:
+            response = self.client.post(self.login_url, {"email": self.tuser1.email, "password": "wrong"})
+        finally:
+            user_login_failed.disconnect(record)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(failed, [self.tuser1.email])
+
+        # ModelBackend.user_can_authenticate turns inactive users away
+        User.objects.filter(id=self.tuser1.id).update(is_active=False)
+        response = self.client.post(self.login_url, {"email": self.tuser1.email, "password": "testpassword1"})
+        self.assertEqual(response.status_code, 401)
+
+    def test_login_busy(self):
+        with mock.patch.object(hash_pool, 'run', side_effect=PasswordHashPoolBusy):
+            response = self.client.post(self.login_url, {"email": self.tuser1.email, "password": "testpassword1"})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(response.data, {'message': 'Server busy, try again later'})
+
+    def test_register_busy(self):
+        with mock.patch.object(hash_pool, 'run', side_effect=PasswordHashPoolBusy):
+            response = self.client.post(self.register_url, {"email": "testuser2@test.com", "username": "testuser2",
+                                                             "password": "testpassword2"})
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(User.objects.filter(email="testuser2@test.com").exists())
+
+    def test_model_methods_bypass_pool(self):
+        # Admin login, createsuperuser and changepassword keep working while the API is saturated
+        with mock.patch.object(hash_pool, 'run', side_effect=PasswordHashPoolBusy):
+            self.tuser1.set_password("changed")
+            self.tuser1.save()
+            self.assertTrue(self.tuser1.check_password("changed"))
+            User.objects.create_superuser(username="admin", email="admin@test.com", password="adminpassword")
+
+    def test_outdated_hash_upgraded(self):
+        User.objects.filter(id=self.tuser1.id).update(password=make_password("testpassword1", hasher='pbkdf2_sha1'))
+        response = self.client.post(self.login_url, {"email": self.tuser1.email, "password": "testpassword1"})
+        self.assertEqual(response.status_code, 200)
+        self.tuser1.refresh_from_db()
+        self.assertTrue(self.tuser1.password.startswith('pbkdf2_sha256$'))